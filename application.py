@@ -5,176 +5,432 @@ Maneja subida y listado de fotos sin dependencias externas.
 """
 
 import os
+import sys
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import parse_qs
 
+# Módulos compartidos con Firebase Functions (functions/lasacam)
+_BASE_DIR = Path(__file__).resolve().parent
+for _candidate in (_BASE_DIR / 'functions', _BASE_DIR.parent / 'functions'):
+    if _candidate.is_dir():
+        sys.path.insert(0, str(_candidate))
+        break
+
+from lasacam.instrumentation import (REGISTRY, METRICS_CONTENT_TYPE, RequestTimer, TimedBody, stage,
+                                     add_bytes)
+from lasacam.profiling import profile_admin
+from lasacam.storage import open_storage, content_type_for, ObjectNotFound
+from lasacam.resize import (available as resize_available, parse_resize_params,
+                            resized_image, resize_cache_from_env)
+from lasacam.variants import variant_settings_from_env, negotiated_variant
+from lasacam.ratelimit import limiter_from_env, trusted_proxies_from_env, client_key, check
+from lasacam.compression import json_response, wants_compact, compact_listing
+from lasacam.listing import (wants_ndjson, iter_photos, is_photo, ndjson_chunks, NDJSON_CONTENT_TYPE,
+                             parse_since, delta_listing, delta_payload, parse_window)
+from lasacam.ingest import ingest_policy, normalize_upload, archive_name
+from lasacam.uploads import (read_multipart, UploadRejected, LimitedBodyReader,
+                             ChunkedBodyReader, image_dimensions)
+from lasacam.live import (LiveFeed, SSE_HEADERS, upload_event, last_event_id, storage_replay,
+                          iter_events, sse_wsgi_limit)
+from lasacam.scan import scan_objects, window_photos
+from lasacam.batch_upload import BatchUpload, BATCH_FIELDS, batch_max_files, batch_payload
+from lasacam.placeholder import photo_metadata, listing_fields
+from lasacam.contact_sheet import (available as sheet_available, parse_sheet_params, plan_sheet,
+                                   sheet_map, sheet_image, sheet_cache_control)
+
 # Configuración
-UPLOAD_DIR = Path(__file__).parent / 'uploads'
-UPLOAD_DIR.mkdir(exist_ok=True)
+# LASACAM_STORAGE: directorio raíz (por defecto, junto a este archivo) o gs://<bucket>
+STORAGE = open_storage(os.environ.get('LASACAM_STORAGE', Path(__file__).parent))
+UPLOAD_PREFIX = 'uploads/'
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Normalización de subidas; LASACAM_EVENT elige la configuración por evento
+INGEST_POLICY = ingest_policy(os.environ.get('LASACAM_EVENT'))
+# Variantes WebP/AVIF para /uploads/ (ver lasacam/variants.py)
+VARIANT_FORMATS, VARIANT_CACHE = variant_settings_from_env(Path(__file__).parent)
+# Caché de /img/<archivo>?w=&h= (ver lasacam/resize.py)
+IMAGE_CACHE = resize_cache_from_env(Path(__file__).parent)
+# Límite de subidas por cliente (ver lasacam/ratelimit.py); X-Forwarded-For solo
+# cuenta con LASACAM_TRUSTED_PROXIES
+UPLOAD_LIMITER = limiter_from_env('upload')
+TRUSTED_PROXIES = trusted_proxies_from_env()
+# Novedades en vivo por SSE; cada suscriptor ocupa un worker (ver lasacam/live.py)
+LIVE = LiveFeed()
+LIVE_SLOTS = threading.BoundedSemaphore(sse_wsgi_limit())
+THUMBNAIL_WIDTH = 400
+
+
+def _body_reader(environ):
+    """
+    Función read(n) sobre el cuerpo de la petición, o None si no hay cuerpo.
+    Sin Content-Length (chunked) se lee hasta el final y el tope de bytes lo
+    aplica read_multipart.
+    """
+    wsgi_input = environ['wsgi.input']
+    content_length = int(environ.get('CONTENT_LENGTH') or 0)
+    if content_length:
+        reader = LimitedBodyReader(wsgi_input, content_length).read
+    elif environ.get('wsgi.input_terminated'):
+        reader = wsgi_input.read
+    elif 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+        reader = ChunkedBodyReader(wsgi_input).read
+    else:
+        return None
+
+    def read(size):
+        data = reader(size)
+        add_bytes('in', len(data))
+        return data
+    return read
 
 
-def parse_multipart(data, boundary):
-    """Parsea datos multipart/form-data."""
-    parts = data.split(b'--' + boundary.encode())
-    fields = {}
-    
-    for part in parts:
-        if b'Content-Disposition: form-data' in part:
-            # Extraer nombre del campo
-            if b'name="photo"' in part:
-                # Extraer nombre del archivo
-                filename = None
-                if b'filename=' in part:
-                    for line in part.split(b'\r\n'):
-                        if b'filename=' in line:
-                            filename_part = line.decode('utf-8', errors='ignore')
-                            if 'filename=' in filename_part:
-                                filename = filename_part.split('filename=')[1].strip('"')
-                                break
-                
-                # Extraer datos del archivo (después de línea en blanco)
-                file_start = part.find(b'\r\n\r\n') + 4
-                file_end = part.rfind(b'\r\n')
-                if file_end > file_start:
-                    file_data = part[file_start:file_end]
-                    fields['photo'] = {
-                        'filename': filename,
-                        'data': file_data
-                    }
-    
-    return fields
+def _base_url(environ):
+    host = environ.get('HTTP_HOST', 'localhost')
+    protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
+    return f"{protocol}://{host}"
+
+
+def save_upload(photo, base_url):
+    """
+    Normaliza y guarda una foto recibida (UploadedFile) y avisa a /api/events.
+    Devuelve {'filename', 'url'}.
+    """
+    # Normalización de ingesta (opcional)
+    with stage('normalize'):
+        file_data, filename, original = normalize_upload(photo.data, photo.filename,
+                                                         INGEST_POLICY)
+    file_ext = Path(filename).suffix.lower()
+    
+    # Generar nombre único
+    timestamp = int(datetime.now().timestamp() * 1000)
+    unique_filename = f'lasacam-{timestamp}-{os.urandom(4).hex()}{file_ext}'
+    
+    # Guardar archivo, con sus dimensiones y placeholder para los listados
+    STORAGE.put(UPLOAD_PREFIX + unique_filename, file_data,
+                content_type=content_type_for(unique_filename),
+                metadata=photo_metadata(file_data))
+    if original is not None:
+        archive = archive_name(INGEST_POLICY, unique_filename, photo.filename)
+        STORAGE.put(archive, original, content_type=content_type_for(archive))
+    
+    # Avisar a los suscriptores de /api/events
+    width, height = image_dimensions(file_data)
+    LIVE.publish(photo_event(base_url, unique_filename, width, height))
+    
+    return {'filename': unique_filename, 'url': f"{base_url}/uploads/{unique_filename}"}
 
 
 def handle_upload(environ):
     """Maneja la subida de una foto."""
     try:
-        # Leer el contenido
-        content_length = int(environ.get('CONTENT_LENGTH', 0))
-        if content_length == 0:
+        content_length = int(environ.get('CONTENT_LENGTH') or 0) or None
+        read = _body_reader(environ)
+        if read is None:
             return {'error': 'No se recibió ningún archivo'}, 400
         
-        if content_length > MAX_FILE_SIZE:
-            return {'error': f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB'}, 400
-        
-        # Leer el body
-        wsgi_input = environ['wsgi.input']
-        post_data = wsgi_input.read(content_length)
-        
-        # Parsear multipart
-        content_type = environ.get('CONTENT_TYPE', '')
-        if 'boundary=' not in content_type:
-            return {'error': 'Content-Type debe ser multipart/form-data'}, 400
+        # Leer, parsear y validar a medida que llega el cuerpo: una subida
+        # inválida se rechaza sin terminar de leerla
+        with stage('receive'):
+            try:
+                files, _ = read_multipart(read, environ.get('CONTENT_TYPE', ''),
+                                          content_length=content_length,
+                                          allowed_extensions=ALLOWED_EXTENSIONS,
+                                          max_file_size=MAX_FILE_SIZE)
+            except UploadRejected as e:
+                return {'error': e.message}, e.status
         
-        boundary = content_type.split('boundary=')[1]
-        fields = parse_multipart(post_data, boundary)
-        
-        if 'photo' not in fields:
+        if not files:
             return {'error': 'No se encontró el archivo "photo"'}, 400
         
-        photo = fields['photo']
-        filename = photo['filename']
-        file_data = photo['data']
-        
-        if not filename:
-            return {'error': 'No se seleccionó ningún archivo'}, 400
-        
-        # Validar extensión
-        file_ext = Path(filename).suffix.lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return {'error': f'Extensión no permitida. Use: {", ".join(ALLOWED_EXTENSIONS)}'}, 400
-        
-        # Validar tamaño
-        if len(file_data) > MAX_FILE_SIZE:
-            return {'error': f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB'}, 400
-        
-        # Generar nombre único
-        timestamp = int(datetime.now().timestamp() * 1000)
-        unique_filename = f'lasacam-{timestamp}-{os.urandom(4).hex()}{file_ext}'
-        file_path = UPLOAD_DIR / unique_filename
+        saved = save_upload(files[0], _base_url(environ))
+        return {'message': 'Foto subida con éxito', **saved}, 200
+    
+    except Exception as e:
+        return {'error': f'Error al subir foto: {str(e)}'}, 500
+
+
+def handle_batch_upload(environ, client):
+    """Subida de varias fotos en una petición, con un resultado por archivo."""
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH') or 0) or None
+        read = _body_reader(environ)
+        if read is None:
+            return {'error': 'No se recibió ningún archivo'}, 400
         
-        # Guardar archivo
-        with open(file_path, 'wb') as f:
-            f.write(file_data)
+        def admit():
+            # Cada foto después de la primera consume su propia cuota
+            limited = check(UPLOAD_LIMITER, client)
+            return limited[0] if limited is not None else None
         
-        # Construir URL
-        host = environ.get('HTTP_HOST', 'localhost')
-        protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
-        file_url = f"{protocol}://{host}/uploads/{unique_filename}"
+        base_url = _base_url(environ)
+        batch = BatchUpload(lambda photo: save_upload(photo, base_url), admit)
+        with stage('receive'):
+            try:
+                read_multipart(read, environ.get('CONTENT_TYPE', ''),
+                               content_length=content_length, fields=BATCH_FIELDS,
+                               max_files=batch_max_files(),
+                               allowed_extensions=ALLOWED_EXTENSIONS,
+                               max_file_size=MAX_FILE_SIZE,
+                               on_file=batch.on_file, on_reject=batch.on_reject)
+            except UploadRejected as e:
+                # Lo ya guardado queda guardado: el cliente recibe sus resultados
+                return {'error': e.message, 'results': batch.results()}, e.status
         
-        return {
-            'message': 'Foto subida con éxito',
-            'filename': unique_filename,
-            'url': file_url
-        }, 200
+        results = batch.results()
+        if not results:
+            return {'error': 'No se encontró ningún archivo "photos"'}, 400
+        return batch_payload(results)
     
     except Exception as e:
-        return {'error': f'Error al subir foto: {str(e)}'}, 500
+        return {'error': f'Error al subir fotos: {str(e)}'}, 500
+
+
+def photo_entry(base_url, obj):
+    """Entrada de una foto en los listados, con width, height y placeholder si los tiene."""
+    filename = obj.name[len(UPLOAD_PREFIX):]
+    return {'filename': filename, 'url': f"{base_url}/uploads/{filename}",
+            **listing_fields(obj.metadata)}
 
 
 def handle_list_photos(environ):
-    """Lista todas las fotos subidas."""
+    """
+    Lista todas las fotos subidas (?shape=compact: URL base una sola vez;
+    ?since=: solo los cambios desde ese timestamp o cursor; ?from=&to=: solo
+    las subidas de ese horario).
+    """
     try:
-        photos = []
-        
-        if UPLOAD_DIR.exists():
-            # Obtener el host
-            host = environ.get('HTTP_HOST', 'localhost')
-            protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
-            
-            # Listar archivos ordenados por fecha (más recientes primero)
-            files = list(UPLOAD_DIR.glob('*'))
-            files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
-            
-            for file_path in files:
-                if file_path.is_file() and file_path.suffix.lower() in ALLOWED_EXTENSIONS:
-                    photos.append({
-                        'filename': file_path.name,
-                        'url': f"{protocol}://{host}/uploads/{file_path.name}"
-                    })
-        
-        return photos, 200
+        delta = None
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        
+        # Obtener el host
+        host = environ.get('HTTP_HOST', 'localhost')
+        protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
+        
+        try:
+            window = parse_window(params)
+            since = parse_since(params)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if window is not None and since is not None:
+            return {'error': 'since no se puede combinar con from/to'}, 400
+        
+        if window is not None:
+            # Búsqueda por rango de nombres en el índice de la carpeta
+            with stage('list'):
+                objects = window_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, *window)
+        elif since is not None:
+            with stage('list'):
+                objects, *delta = delta_listing(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, since)
+        else:
+            # Los nombres incluyen el timestamp: orden inverso de nombre = más recientes primero
+            with stage('list'):
+                objects = [obj for obj in reversed(scan_objects(STORAGE, UPLOAD_PREFIX))
+                           if is_photo(obj, UPLOAD_PREFIX, ALLOWED_EXTENSIONS)]
+        
+        photos = [photo_entry(f"{protocol}://{host}", obj) for obj in objects]
+        if wants_compact(params):
+            photos = compact_listing(f"{protocol}://{host}/uploads/", photos)
+        return (delta_payload(photos, *delta) if delta is not None else photos), 200
     
     except Exception as e:
         return {'error': f'Error al listar fotos: {str(e)}'}, 500
 
 
+def stream_photos_ndjson(environ, window=None):
+    """Bloques NDJSON del listado (?format=ndjson), más recientes primero."""
+    host = environ.get('HTTP_HOST', 'localhost')
+    protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
+    if window is not None:
+        objects = window_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, *window)
+    else:
+        objects = iter_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS)
+    return ndjson_chunks(photo_entry(f"{protocol}://{host}", obj) for obj in objects)
+
+
+def photo_event(base_url, filename, width=None, height=None):
+    """Datos del evento SSE de una foto."""
+    urls = {}
+    if resize_available():
+        urls['thumbnailUrl'] = f"{base_url}/img/{filename}?w={THUMBNAIL_WIDTH}"
+    return upload_event(filename, f"{base_url}/uploads/{filename}", width, height, **urls)
+
+
+class _LiveSlotBody:
+    """
+    Cuerpo WSGI que ocupa un lugar de LIVE_SLOTS hasta close(). El servidor
+    llama a close() aunque corte la respuesta antes del primer bloque, cuando
+    el finally de un generador sin empezar nunca corre.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._held = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        if not self._held:
+            return
+        self._held = False
+        try:
+            self._chunks.close()
+        finally:
+            LIVE_SLOTS.release()
+
+
+def stream_events(environ):
+    """Cuerpo SSE de /api/events; libera su lugar en LIVE_SLOTS al cerrarse."""
+    host = environ.get('HTTP_HOST', 'localhost')
+    protocol = 'https' if environ.get('HTTPS') == 'on' else 'http'
+    base_url = f"{protocol}://{host}"
+    last_id = last_event_id(environ.get('HTTP_LAST_EVENT_ID'),
+                            parse_qs(environ.get('QUERY_STRING', '')))
+
+    def replay(since):
+        return storage_replay(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, since,
+                              lambda filename, obj: photo_event(base_url, filename))
+
+    return _LiveSlotBody(iter_events(LIVE.log, last_id, replay))
+
+
 def serve_upload_file(environ, path):
-    """Sirve un archivo de la carpeta uploads."""
+    """
+    Sirve un archivo de la carpeta uploads.
+    Devuelve (bloques, content_type, status, tamaño) o (None, status) si falla.
+    """
     try:
         filename = path.replace('/uploads/', '')
-        file_path = UPLOAD_DIR / filename
+        object_name = UPLOAD_PREFIX + filename
         
-        if not file_path.exists() or not file_path.is_file():
+        info = STORAGE.stat(object_name)
+        if info is None:
             return None, 404
         
-        # Determinar content-type
-        ext = file_path.suffix.lower()
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif'
-        }
-        content_type = content_types.get(ext, 'application/octet-stream')
+        # Variante WebP/AVIF si el cliente la acepta
+        variant = negotiated_variant(STORAGE, object_name, info, environ.get('HTTP_ACCEPT', ''),
+                                     VARIANT_FORMATS, VARIANT_CACHE)
+        if variant is not None:
+            data, content_type = variant
+            return [data], content_type, 200, len(data)
         
-        # Leer archivo
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
+        # Determinar content-type
+        content_type = content_type_for(filename)
         
-        return file_data, content_type, 200
+        # El archivo se envía por bloques, sin cargarlo entero en memoria
+        return STORAGE.stream(object_name), content_type, 200, info.size
     
     except Exception as e:
         return None, 500
 
 
+def handle_resize(environ, path):
+    """
+    Versión redimensionada de una foto: /img/<archivo>?w=&h=&q=&fmt=.
+    Devuelve (bytes, content_type, 200) o ({'error': ...}, status).
+    """
+    try:
+        if not resize_available():
+            return {'error': 'Redimensionado no disponible (falta Pillow)'}, 501
+        
+        try:
+            params = parse_qs(environ.get('QUERY_STRING', ''))
+            spec = parse_resize_params(params, environ.get('HTTP_ACCEPT', ''))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        
+        object_name = UPLOAD_PREFIX + path[len('/img/'):]
+        info = STORAGE.stat(object_name)
+        if info is None:
+            return {'error': 'Archivo no encontrado'}, 404
+        
+        data, content_type = resized_image(STORAGE, object_name, info, spec, IMAGE_CACHE)
+        return data, content_type, 200
+    
+    except ObjectNotFound:
+        return {'error': 'Archivo no encontrado'}, 404
+    except Exception as e:
+        return {'error': f'Error al redimensionar imagen: {str(e)}'}, 500
+
+
+def handle_contact_sheet(environ):
+    """
+    Hoja de contactos de una página de la galería: /api/photos/sheet?page=&size=&tile=&cols=.
+    Devuelve (mapa, 200), con image=1 (bytes, cache_control, 200), o ({'error': ...}, status).
+    """
+    try:
+        if not sheet_available():
+            return {'error': 'Hojas de contactos no disponibles (falta Pillow)'}, 501
+        
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            spec = parse_sheet_params(params)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        
+        plan = plan_sheet(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, spec)
+        if plan is None:
+            return {'error': 'Página no encontrada'}, 404
+        
+        if params.get('image', [''])[0] != '1':
+            base_url = _base_url(environ)
+            return sheet_map(plan, spec, UPLOAD_PREFIX, f"{base_url}/api/photos/sheet",
+                             lambda name: f"{base_url}/uploads/{name}"), 200
+        
+        data = sheet_image(STORAGE, plan, spec, IMAGE_CACHE)
+        return data, sheet_cache_control(plan, params.get('v', [''])[0]), 200
+    
+    except Exception as e:
+        return {'error': f'Error al armar la hoja de contactos: {str(e)}'}, 500
+
+
+def _route_label(path):
+    """Etiqueta de ruta para las métricas (evita una serie por archivo)."""
+    if path.startswith('/uploads/'):
+        return '/uploads'
+    if path.startswith('/img/'):
+        return '/img'
+    if path in ('/api/upload', '/api/upload/batch', '/api/photos', '/api/photos/sheet',
+                '/api/events', '/metrics', '/admin/profile'):
+        return path
+    return 'other'
+
+
 def application(environ, start_response):
     """
     Función WSGI principal que maneja todas las peticiones.
+    Mide cada petición y agrega el header Server-Timing a la respuesta; los
+    cuerpos que se generan al enviarse se miden hasta su close().
     """
+    path = environ.get('PATH_INFO', '')
+    timer = RequestTimer(_route_label(path), environ.get('REQUEST_METHOD', ''))
+
+    def timed_start_response(status, headers, exc_info=None):
+        timer.status = int(status.split(' ', 1)[0])
+        headers = list(headers) + [('Server-Timing', timer.server_timing())]
+        return start_response(status, headers, exc_info)
+
+    try:
+        with timer.activate():
+            body = _dispatch(environ, timed_start_response)
+    except BaseException:
+        timer.finish()
+        raise
+    if isinstance(body, list):
+        timer.add_bytes('out', sum(len(chunk) for chunk in body))
+        timer.finish()
+        return body
+    return TimedBody(body, timer)
+
+
+def _dispatch(environ, start_response):
+    """Enruta la petición al handler correspondiente."""
     method = environ.get('REQUEST_METHOD', '')
     path = environ.get('PATH_INFO', '')
     
@@ -201,28 +457,144 @@ def application(environ, start_response):
             start_response(status, headers)
             return [json.dumps({'error': 'Archivo no encontrado'}).encode('utf-8')]
         
-        file_data, content_type, status_code = result
+        chunks, content_type, status_code, size = result
         status = f'{status_code} OK'
-        headers = [('Content-Type', content_type)] + cors_headers
+        headers = [('Content-Type', content_type), ('Content-Length', str(size))] + cors_headers
+        if VARIANT_CACHE is not None:
+            headers.append(('Vary', 'Accept'))
         start_response(status, headers)
-        return [file_data]
+        return chunks
+    
+    # Versiones redimensionadas
+    if path.startswith('/img/'):
+        result = handle_resize(environ, path)
+        if len(result) == 2:
+            error, status_code = result
+            start_response(f'{status_code} Error', [('Content-Type', 'application/json')] + cors_headers)
+            return [json.dumps(error).encode('utf-8')]
+        
+        data, content_type, status_code = result
+        headers = [
+            ('Content-Type', content_type),
+            ('Content-Length', str(len(data))),
+            ('Cache-Control', 'public, max-age=86400'),
+            ('Vary', 'Accept'),
+        ] + cors_headers
+        start_response(f'{status_code} OK', headers)
+        return [data]
     
-    # Manejar /api/upload
-    if path == '/api/upload' and method == 'POST':
-        result, status_code = handle_upload(environ)
-        status = f'{status_code} OK' if status_code == 200 else f'{status_code} Error'
+    # Manejar /api/upload y /api/upload/batch
+    if path in ('/api/upload', '/api/upload/batch') and method == 'POST':
+        # Límite por cliente, antes de leer el cuerpo
+        client = client_key({'X-Forwarded-For': environ.get('HTTP_X_FORWARDED_FOR')},
+                            environ.get('REMOTE_ADDR', ''), TRUSTED_PROXIES)
+        rejection = check(UPLOAD_LIMITER, client)
+        if rejection is not None:
+            message, retry_after = rejection
+            headers = [('Content-Type', 'application/json'), ('Retry-After', str(retry_after))]
+            start_response('429 Too Many Requests', headers + cors_headers)
+            return [json.dumps({'error': message}).encode('utf-8')]
+        
+        if path == '/api/upload':
+            result, status_code = handle_upload(environ)
+        else:
+            result, status_code = handle_batch_upload(environ, client)
+        if status_code == 207:
+            status = '207 Multi-Status'
+        else:
+            status = f'{status_code} OK' if status_code == 200 else f'{status_code} Error'
         headers = [('Content-Type', 'application/json')] + cors_headers
         start_response(status, headers)
         return [json.dumps(result).encode('utf-8')]
     
+    # Listado en NDJSON: un generador que emite una foto por línea
+    if path == '/api/photos' and method == 'GET' and wants_ndjson(parse_qs(environ.get('QUERY_STRING', ''))):
+        # Los parámetros se validan antes de empezar la respuesta
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            window = parse_window(params)
+            since = parse_since(params)
+        except ValueError as e:
+            start_response('400 Bad Request', [('Content-Type', 'application/json')] + cors_headers)
+            return [json.dumps({'error': str(e)}).encode('utf-8')]
+        if since is not None:
+            start_response('400 Bad Request', [('Content-Type', 'application/json')] + cors_headers)
+            return [json.dumps({'error': 'since no se puede combinar con format=ndjson'}).encode('utf-8')]
+        start_response('200 OK', [('Content-Type', NDJSON_CONTENT_TYPE),
+                                  ('Cache-Control', 'no-cache')] + cors_headers)
+        return stream_photos_ndjson(environ, window)
+    
+    # Novedades en vivo (Server-Sent Events)
+    if path == '/api/events' and method == 'GET':
+        if not LIVE_SLOTS.acquire(blocking=False):
+            headers = [('Content-Type', 'application/json'), ('Retry-After', '30')]
+            start_response('503 Service Unavailable', headers + cors_headers)
+            return [json.dumps({'error': 'Demasiados suscriptores en vivo, intenta más tarde'}).encode('utf-8')]
+        start_response('200 OK', list(SSE_HEADERS.items()) + cors_headers)
+        return stream_events(environ)
+    
     # Manejar /api/photos
     if path == '/api/photos' and method == 'GET':
         result, status_code = handle_list_photos(environ)
-        status = f'{status_code} OK' if status_code == 200 else f'{status_code} Error'
+        if status_code == 200:
+            # Comprimido según Accept-Encoding, con ETag (304 si no cambió)
+            status_code, body, headers = json_response(result, environ.get('HTTP_ACCEPT_ENCODING', ''),
+                                                       environ.get('HTTP_IF_NONE_MATCH', ''))
+            headers = list(headers.items())
+            if status_code == 304:
+                start_response('304 Not Modified', headers + cors_headers)
+                return []
+            headers.append(('Content-Length', str(len(body))))
+            start_response('200 OK', headers + cors_headers)
+            return [body]
+        
+        status = f'{status_code} Error'
         headers = [('Content-Type', 'application/json')] + cors_headers
         start_response(status, headers)
         return [json.dumps(result).encode('utf-8')]
     
+    # Hoja de contactos de una página de la galería
+    if path == '/api/photos/sheet' and method == 'GET':
+        result = handle_contact_sheet(environ)
+        if len(result) == 3:
+            data, cache_control, status_code = result
+            headers = [
+                ('Content-Type', 'image/jpeg'),
+                ('Content-Length', str(len(data))),
+                ('Cache-Control', cache_control),
+            ] + cors_headers
+            start_response('200 OK', headers)
+            return [data]
+        
+        result, status_code = result
+        if status_code == 200:
+            status_code, body, headers = json_response(result, environ.get('HTTP_ACCEPT_ENCODING', ''),
+                                                       environ.get('HTTP_IF_NONE_MATCH', ''))
+            headers = list(headers.items())
+            if status_code == 304:
+                start_response('304 Not Modified', headers + cors_headers)
+                return []
+            headers.append(('Content-Length', str(len(body))))
+            start_response('200 OK', headers + cors_headers)
+            return [body]
+        
+        start_response(f'{status_code} Error', [('Content-Type', 'application/json')] + cors_headers)
+        return [json.dumps(result).encode('utf-8')]
+    
+    # Métricas en formato Prometheus
+    if path == '/metrics' and method == 'GET':
+        start_response('200 OK', [('Content-Type', METRICS_CONTENT_TYPE)])
+        return [REGISTRY.render().encode('utf-8')]
+    
+    # Perfilado a pedido: POST lo arma, GET devuelve el estado y el último informe
+    if path == '/admin/profile':
+        status_code, result, content_type = profile_admin(
+            method, parse_qs(environ.get('QUERY_STRING', '')), environ.get('HTTP_X_ADMIN_TOKEN'))
+        body = json.dumps(result) if content_type == 'application/json' else result
+        start_response(f'{status_code} {"OK" if status_code == 200 else "Error"}',
+                       [('Content-Type', content_type)])
+        return [body.encode('utf-8')]
+    
     # Ruta no encontrada
     status = '404 Not Found'
     headers = [('Content-Type', 'application/json')] + cors_headers
@@ -7,7 +7,8 @@ Uso:
     python server.py
 
 El servidor escuchará en el puerto especificado por la variable de entorno PORT
-o en el puerto 5000 por defecto.
+o en el puerto 5000 por defecto. Con LASACAM_WORKERS=<n> atiende con n procesos
+(ver functions/lasacam/prefork.py).
 """
 
 import os
@@ -15,194 +16,489 @@ import sys
 import json
 import cgi
 import cgitb
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import socket
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 from datetime import datetime
 
+# Módulos compartidos con Firebase Functions (functions/lasacam)
+_BASE_DIR = Path(__file__).resolve().parent
+for _candidate in (_BASE_DIR / 'functions', _BASE_DIR.parent / 'functions'):
+    if _candidate.is_dir():
+        sys.path.insert(0, str(_candidate))
+        break
+
+from lasacam.instrumentation import REGISTRY, METRICS_CONTENT_TYPE, RequestTimer, stage, add_bytes
+from lasacam.profiling import profile_admin, ADMIN_HEADER
+from lasacam.storage import open_storage, content_type_for, ObjectNotFound
+from lasacam.resize import (available as resize_available, parse_resize_params,
+                            resized_image, resize_cache_from_env)
+from lasacam.variants import variant_settings_from_env, negotiated_variant
+from lasacam.ratelimit import limiter_from_env, trusted_proxies_from_env, client_key, check
+from lasacam.compression import json_response, wants_compact, compact_listing
+from lasacam.listing import (wants_ndjson, iter_photos, is_photo, ndjson_chunks, NDJSON_CONTENT_TYPE,
+                             parse_since, delta_listing, delta_payload, parse_window)
+from lasacam.ingest import ingest_policy, normalize_upload, archive_name
+from lasacam.uploads import (read_multipart, UploadRejected, LimitedBodyReader,
+                             ChunkedBodyReader, image_dimensions)
+from lasacam.live import (LiveFeed, SSEHub, SSE_HEADERS, upload_event, last_event_id,
+                          storage_replay)
+from lasacam.prefork import PreforkServer, workers_from_env, broadcast
+from lasacam.scan import scan_objects, window_photos
+from lasacam.batch_upload import BatchUpload, BATCH_FIELDS, batch_max_files, batch_payload
+from lasacam.placeholder import photo_metadata, listing_fields
+from lasacam.contact_sheet import (available as sheet_available, parse_sheet_params, plan_sheet,
+                                   sheet_map, sheet_image, sheet_cache_control)
+
 # Configuración
-UPLOAD_DIR = Path(__file__).parent / 'uploads'
-UPLOAD_DIR.mkdir(exist_ok=True)
+# LASACAM_STORAGE: directorio raíz (por defecto, junto a este archivo) o gs://<bucket>
+STORAGE = open_storage(os.environ.get('LASACAM_STORAGE', Path(__file__).parent))
+UPLOAD_PREFIX = 'uploads/'
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Normalización de subidas; LASACAM_EVENT elige la configuración por evento
+INGEST_POLICY = ingest_policy(os.environ.get('LASACAM_EVENT'))
+# Variantes WebP/AVIF para /uploads/ (ver lasacam/variants.py)
+VARIANT_FORMATS, VARIANT_CACHE = variant_settings_from_env(Path(__file__).parent)
+# Caché de /img/<archivo>?w=&h= (ver lasacam/resize.py)
+IMAGE_CACHE = resize_cache_from_env(Path(__file__).parent)
+# Límite de subidas por cliente (ver lasacam/ratelimit.py); X-Forwarded-For solo
+# cuenta con LASACAM_TRUSTED_PROXIES
+UPLOAD_LIMITER = limiter_from_env('upload')
+TRUSTED_PROXIES = trusted_proxies_from_env()
+# Novedades en vivo por SSE: un solo hilo atiende a todos los suscriptores (ver lasacam/live.py)
+LIVE = LiveFeed(SSEHub())
+THUMBNAIL_WIDTH = 400
 PORT = int(os.environ.get('PORT', 5000))
+# Procesos que atienden peticiones (ver lasacam/prefork.py)
+WORKERS = workers_from_env()
+# Conexiones persistentes (HTTP/1.1): segundos de espera por la próxima petición
+# y cantidad máxima de peticiones por conexión
+KEEPALIVE_TIMEOUT = float(os.environ.get('LASACAM_KEEPALIVE_TIMEOUT', 15))
+KEEPALIVE_MAX = int(os.environ.get('LASACAM_KEEPALIVE_MAX', 100))
+# Espera máxima entre lecturas mientras llega una petición (p. ej. una subida lenta)
+REQUEST_TIMEOUT = 60
+# Resto del cuerpo que se lee para reutilizar la conexión tras una subida
+DRAIN_LIMIT = 64 * 1024
+
+
+def _route_label(path):
+    """Etiqueta de ruta para las métricas (evita una serie por archivo)."""
+    if path.startswith('/uploads/'):
+        return '/uploads'
+    if path.startswith('/img/'):
+        return '/img'
+    if path in ('/api/upload', '/api/upload/batch', '/api/photos', '/api/photos/sheet',
+                '/api/events', '/metrics', '/admin/profile'):
+        return path
+    return 'other'
+
+
+def photo_event(base_url, filename, width=None, height=None):
+    """Datos del evento SSE de una foto."""
+    urls = {}
+    if resize_available():
+        urls['thumbnailUrl'] = f"{base_url}/img/{filename}?w={THUMBNAIL_WIDTH}"
+    return upload_event(filename, f"{base_url}/uploads/{filename}", width, height, **urls)
+
+
+def publish_photo(data):
+    """
+    Publica el evento de una foto y lo reenvía a los demás workers con su id,
+    para que un cliente que se reconecta a otro worker reanude desde el mismo.
+    """
+    event = LIVE.publish(data)
+    broadcast(json.dumps({'id': event.id, 'data': data}).encode('utf-8'))
+
+
+def _receive_photo(payload):
+    """Evento publicado por otro worker: se conserva el id que le asignó."""
+    message = json.loads(payload)
+    LIVE.publish(message['data'], message['id'])
+
+
+def save_upload(photo, base_url):
+    """
+    Normaliza y guarda una foto recibida (UploadedFile) y avisa a /api/events.
+    Devuelve {'filename', 'url'}.
+    """
+    # Normalización de ingesta (opcional)
+    with stage('normalize'):
+        file_data, filename, original = normalize_upload(photo.data, photo.filename,
+                                                         INGEST_POLICY)
+    file_ext = Path(filename).suffix.lower()
+
+    # Generar nombre único
+    timestamp = int(datetime.now().timestamp() * 1000)
+    unique_filename = f'lasacam-{timestamp}-{os.urandom(4).hex()}{file_ext}'
+
+    # Guardar archivo, con sus dimensiones y placeholder para los listados
+    STORAGE.put(UPLOAD_PREFIX + unique_filename, file_data,
+                content_type=content_type_for(unique_filename),
+                metadata=photo_metadata(file_data))
+    if original is not None:
+        archive = archive_name(INGEST_POLICY, unique_filename, photo.filename)
+        STORAGE.put(archive, original, content_type=content_type_for(archive))
+
+    # Avisar a los suscriptores de /api/events
+    width, height = image_dimensions(file_data)
+    publish_photo(photo_event(base_url, unique_filename, width, height))
+
+    return {'filename': unique_filename, 'url': f"{base_url}/uploads/{unique_filename}"}
+
+
+def photo_entry(base_url, obj):
+    """Entrada de una foto en los listados, con width, height y placeholder si los tiene."""
+    filename = obj.name[len(UPLOAD_PREFIX):]
+    return {'filename': filename, 'url': f"{base_url}/uploads/{filename}",
+            **listing_fields(obj.metadata)}
+
+
+def list_photos(base_url, compact=False, since=None, window=None):
+    """
+    Lista las fotos subidas (más recientes primero) con su URL pública.
+    Con `compact` la URL base va una sola vez (ver compact_listing); con
+    `since` (ms) solo los cambios desde entonces (ver delta_listing); con
+    `window` = (from_ms, to_ms) solo las subidas de ese horario.
+    """
+    delta = None
+
+    if window is not None:
+        with stage('list'):
+            objects = window_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, *window)
+    elif since is not None:
+        with stage('list'):
+            objects, *delta = delta_listing(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, since)
+    else:
+        # Los nombres incluyen el timestamp: orden inverso de nombre = más recientes primero
+        with stage('list'):
+            objects = [obj for obj in reversed(scan_objects(STORAGE, UPLOAD_PREFIX))
+                       if is_photo(obj, UPLOAD_PREFIX, ALLOWED_EXTENSIONS)]
+
+    photos = [photo_entry(base_url, obj) for obj in objects]
+    if compact:
+        photos = compact_listing(f"{base_url}/uploads/", photos)
+    return delta_payload(photos, *delta) if delta is not None else photos
 
 
 class LasaCamHandler(BaseHTTPRequestHandler):
     """Handler personalizado para manejar las peticiones de LasaCam."""
 
+    # HTTP/1.1: la galería pide todas las miniaturas por las mismas conexiones
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers y cuerpo salen en dos escrituras: sin Nagle la segunda no espera el ACK
+    disable_nagle_algorithm = True
+
+    _timer = None
+    _status = None
+    _requests = 0
+    _connection_sent = False
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        self._status = None
+        self._requests += 1
+        if self._requests >= KEEPALIVE_MAX:
+            self.close_connection = True
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        return True
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        # Entre peticiones rige la espera de keep-alive
+        if not self.close_connection:
+            self.connection.settimeout(self.timeout)
+
+    def _timed(self, handler):
+        """Ejecuta el handler de la petición midiendo sus etapas."""
+        path = urlparse(self.path).path
+        self._timer = RequestTimer(_route_label(path), self.command)
+        self._status = None
+        try:
+            with self._timer.activate():
+                handler(path)
+        finally:
+            self._timer.finish(self._status)
+            self._timer = None
+
+    def send_response(self, code, message=None):
+        self._status = code
+        self._connection_sent = False
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection':
+            self._connection_sent = True
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        if self._timer is not None:
+            self.send_header('Server-Timing', self._timer.server_timing())
+        # Avisar al cliente que no reutilice la conexión
+        if self.close_connection and not self._connection_sent:
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
     def _set_cors_headers(self):
         """Establece los headers CORS necesarios."""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
 
-    def _send_json_response(self, data, status_code=200):
+    def _send_json_response(self, data, status_code=200, headers=None):
         """Envía una respuesta JSON."""
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        body = json.dumps(data).encode('utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self._set_cors_headers()
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        add_bytes('out', len(body))
+        self.wfile.write(body)
+
+    def _send_encoded_json(self, data):
+        """Envía JSON comprimido según Accept-Encoding, con ETag (304 si no cambió)."""
+        status, body, headers = json_response(data, self.headers.get('Accept-Encoding', ''),
+                                              self.headers.get('If-None-Match', ''))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self._set_cors_headers()
+        self.end_headers()
+        add_bytes('out', len(body))
+        self.wfile.write(body)
 
     def _send_error(self, message, status_code=400):
         """Envía un error en formato JSON."""
+        if self._status is not None:
+            # La respuesta ya empezó: no hay forma de enviar otra, solo cortar la conexión
+            self.close_connection = True
+            return
         self._send_json_response({'error': message}, status_code)
 
     def do_OPTIONS(self):
         """Maneja peticiones OPTIONS para CORS."""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self._set_cors_headers()
         self.end_headers()
 
     def do_GET(self):
         """Maneja peticiones GET."""
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+        self._timed(self._route_get)
+
+    def do_POST(self):
+        """Maneja peticiones POST."""
+        self._timed(self._route_post)
 
+    def _route_get(self, path):
+        """Enruta las peticiones GET."""
         # Servir archivos de uploads
         if path.startswith('/uploads/'):
             self._serve_upload_file(path)
+        # Versiones redimensionadas
+        elif path.startswith('/img/'):
+            self._handle_resize(path)
         # Listar fotos
         elif path == '/api/photos':
             self._handle_list_photos()
+        # Hoja de contactos de una página de la galería
+        elif path == '/api/photos/sheet':
+            self._handle_contact_sheet()
+        # Novedades en vivo (Server-Sent Events)
+        elif path == '/api/events':
+            self._handle_events()
+        # Métricas en formato Prometheus
+        elif path == '/metrics':
+            self._handle_metrics()
+        # Perfilado a pedido
+        elif path == '/admin/profile':
+            self._handle_profile_admin()
         else:
             self._send_error('Ruta no encontrada', 404)
 
-    def do_POST(self):
-        """Maneja peticiones POST."""
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-
+    def _route_post(self, path):
+        """Enruta las peticiones POST."""
         if path == '/api/upload':
             self._handle_upload()
+        elif path == '/api/upload/batch':
+            self._handle_batch_upload()
+        elif path == '/admin/profile':
+            if self.headers.get('Content-Length', '0') != '0':
+                self.close_connection = True
+            self._handle_profile_admin()
         else:
+            # El cuerpo queda sin leer
+            self.close_connection = True
             self._send_error('Ruta no encontrada', 404)
 
+    def _handle_metrics(self):
+        """Expone histogramas de latencia y contadores de bytes."""
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_profile_admin(self):
+        """Arma el perfilador (POST) o devuelve su estado y último informe (GET)."""
+        params = parse_qs(urlparse(self.path).query)
+        status, result, content_type = profile_admin(self.command, params,
+                                                     self.headers.get(ADMIN_HEADER))
+        if content_type == 'application/json':
+            self._send_json_response(result, status)
+            return
+        body = result.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def _serve_upload_file(self, path):
         """Sirve un archivo de la carpeta uploads."""
         try:
             # Extraer el nombre del archivo de la ruta
             filename = path.replace('/uploads/', '')
-            file_path = UPLOAD_DIR / filename
+            object_name = UPLOAD_PREFIX + filename
 
-            if not file_path.exists() or not file_path.is_file():
+            info = STORAGE.stat(object_name)
+            if info is None:
                 self._send_error('Archivo no encontrado', 404)
                 return
 
+            # Variante WebP/AVIF si el cliente la acepta
+            variant = negotiated_variant(STORAGE, object_name, info, self.headers.get('Accept', ''),
+                                         VARIANT_FORMATS, VARIANT_CACHE)
+            if variant is not None:
+                data, content_type = variant
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Vary', 'Accept')
+                self._set_cors_headers()
+                self.end_headers()
+                self.wfile.write(data)
+                add_bytes('out', len(data))
+                return
+
             # Determinar content-type basado en extensión
-            ext = file_path.suffix.lower()
-            content_types = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif'
-            }
-            content_type = content_types.get(ext, 'application/octet-stream')
-
-            # Leer y enviar el archivo
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
+            content_type = content_type_for(filename)
 
             self.send_response(200)
             self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', str(len(file_data)))
+            self.send_header('Content-Length', str(info.size))
+            if VARIANT_CACHE is not None:
+                self.send_header('Vary', 'Accept')
             self._set_cors_headers()
             self.end_headers()
-            self.wfile.write(file_data)
+
+            # Enviar el archivo por bloques, sin cargarlo entero en memoria
+            with stage('read'):
+                for chunk in STORAGE.stream(object_name):
+                    self.wfile.write(chunk)
+            add_bytes('out', info.size)
 
         except Exception as e:
             self._send_error(f'Error al servir archivo: {str(e)}', 500)
 
-    def _handle_upload(self):
-        """Maneja la subida de una foto."""
+    def _handle_resize(self, path):
+        """Sirve una versión redimensionada: /img/<archivo>?w=&h=&q=&fmt=."""
         try:
-            # Verificar content-type
-            content_type = self.headers.get('Content-Type', '')
-            if not content_type.startswith('multipart/form-data'):
-                self._send_error('Content-Type debe ser multipart/form-data', 400)
+            if not resize_available():
+                self._send_error('Redimensionado no disponible (falta Pillow)', 501)
                 return
 
-            # Leer el contenido
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                self._send_error('No se recibió ningún archivo', 400)
+            try:
+                params = parse_qs(urlparse(self.path).query)
+                spec = parse_resize_params(params, self.headers.get('Accept', ''))
+            except ValueError as e:
+                self._send_error(str(e), 400)
                 return
 
-            if content_length > MAX_FILE_SIZE:
-                self._send_error(f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB', 400)
+            object_name = UPLOAD_PREFIX + path[len('/img/'):]
+            info = STORAGE.stat(object_name)
+            if info is None:
+                self._send_error('Archivo no encontrado', 404)
                 return
 
-            # Parsear el formulario multipart
-            post_data = self.rfile.read(content_length)
-            
-            # Crear un objeto FieldStorage para parsear multipart
-            # Necesitamos crear un archivo temporal o usar StringIO
-            import io
-            from email import message_from_bytes
-            from email.message import EmailMessage
-            
-            # Crear un mensaje email para parsear multipart
-            msg = EmailMessage()
-            msg['Content-Type'] = content_type
-            msg.set_payload(post_data)
-            
-            # Parsear manualmente el multipart
-            boundary = content_type.split('boundary=')[1]
-            parts = post_data.split(b'--' + boundary.encode())
-            
-            file_data = None
-            filename = None
-            
-            for part in parts:
-                if b'Content-Disposition: form-data' in part:
-                    # Buscar el nombre del campo
-                    if b'name="photo"' in part:
-                        # Extraer el nombre del archivo
-                        if b'filename=' in part:
-                            filename_line = [l for l in part.split(b'\r\n') if b'filename=' in l][0]
-                            filename = filename_line.decode('utf-8', errors='ignore').split('filename=')[1].strip('"')
-                        
-                        # Extraer los datos del archivo (después de la línea en blanco)
-                        file_start = part.find(b'\r\n\r\n') + 4
-                        file_end = part.rfind(b'\r\n')
-                        if file_end > file_start:
-                            file_data = part[file_start:file_end]
-            
-            if not file_data or not filename:
-                self._send_error('No se encontró el archivo "photo" en la petición', 400)
-                return
+            data, content_type = resized_image(STORAGE, object_name, info, spec, IMAGE_CACHE)
 
-            # Validar extensión
-            file_ext = Path(filename).suffix.lower()
-            if file_ext not in ALLOWED_EXTENSIONS:
-                self._send_error(f'Extensión no permitida. Use: {", ".join(ALLOWED_EXTENSIONS)}', 400)
-                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'public, max-age=86400')
+            self.send_header('Vary', 'Accept')
+            self._set_cors_headers()
+            self.end_headers()
+            self.wfile.write(data)
+            add_bytes('out', len(data))
 
-            # Validar tamaño
-            if len(file_data) > MAX_FILE_SIZE:
-                self._send_error(f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB', 400)
-                return
+        except ObjectNotFound:
+            self._send_error('Archivo no encontrado', 404)
+        except Exception as e:
+            self._send_error(f'Error al redimensionar imagen: {str(e)}', 500)
+
+    def _client_key(self):
+        return client_key(self.headers, self.client_address[0], TRUSTED_PROXIES)
+
+    def _rate_limited(self, key):
+        """Responde 429 si el cliente agotó su cuota de subidas; True si lo hizo."""
+        rejection = check(UPLOAD_LIMITER, key)
+        if rejection is None:
+            return False
+        message, retry_after = rejection
+        # El cuerpo queda sin leer: se cierra la conexión
+        self.close_connection = True
+        self._send_json_response({'error': message}, 429, {'Retry-After': str(retry_after)})
+        return True
 
-            # Generar nombre único
-            timestamp = int(datetime.now().timestamp() * 1000)
-            unique_filename = f'lasacam-{timestamp}-{os.urandom(4).hex()}{file_ext}'
-            file_path = UPLOAD_DIR / unique_filename
+    def _handle_upload(self):
+        """Maneja la subida de una foto."""
+        # Límite por cliente, antes de leer el cuerpo
+        if self._rate_limited(self._client_key()):
+            return
 
-            # Guardar archivo
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
+        try:
+            reader = self._body_reader()
+            if reader is None:
+                return
 
-            # Construir URL
-            host = self.headers.get('Host', 'localhost')
-            protocol = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
-            file_url = f"{protocol}://{host}/uploads/{unique_filename}"
+            def read(size):
+                data = reader.read(size)
+                add_bytes('in', len(data))
+                return data
+
+            # Leer, parsear y validar a medida que llega el cuerpo
+            with stage('receive'):
+                try:
+                    files, _ = read_multipart(read, self.headers.get('Content-Type', ''),
+                                              content_length=reader.length,
+                                              allowed_extensions=ALLOWED_EXTENSIONS,
+                                              max_file_size=MAX_FILE_SIZE)
+                except UploadRejected as e:
+                    # El resto del cuerpo queda sin leer: se cierra la conexión
+                    self.close_connection = True
+                    self._send_error(e.message, e.status)
+                    return
+                # Lo que siga al último delimitador; si es demasiado, se cierra la conexión
+                if not self._drain_body(reader):
+                    self.close_connection = True
+
+            if not files:
+                self._send_error('No se encontró el archivo "photo" en la petición', 400)
+                return
 
-            self._send_json_response({
-                'message': 'Foto subida con éxito',
-                'filename': unique_filename,
-                'url': file_url
-            }, 200)
+            saved = save_upload(files[0], self._base_url())
+            self._send_json_response({'message': 'Foto subida con éxito', **saved}, 200)
 
         except Exception as e:
             import traceback
@@ -211,28 +507,148 @@ class LasaCamHandler(BaseHTTPRequestHandler):
             print(traceback.format_exc(), file=sys.stderr)
             self._send_error(error_msg, 500)
 
-    def _handle_list_photos(self):
-        """Lista todas las fotos subidas."""
+    def _handle_batch_upload(self):
+        """Subida de varias fotos en una petición, con un resultado por archivo."""
+        key = self._client_key()
+        if self._rate_limited(key):
+            return
+
         try:
-            photos = []
+            reader = self._body_reader()
+            if reader is None:
+                return
+
+            def read(size):
+                data = reader.read(size)
+                add_bytes('in', len(data))
+                return data
+
+            def admit():
+                # Cada foto después de la primera consume su propia cuota
+                limited = check(UPLOAD_LIMITER, key)
+                return limited[0] if limited is not None else None
+
+            base_url = self._base_url()
+            batch = BatchUpload(lambda photo: save_upload(photo, base_url), admit)
+            try:
+                with stage('receive'):
+                    read_multipart(read, self.headers.get('Content-Type', ''),
+                                   content_length=reader.length, fields=BATCH_FIELDS,
+                                   max_files=batch_max_files(),
+                                   allowed_extensions=ALLOWED_EXTENSIONS,
+                                   max_file_size=MAX_FILE_SIZE,
+                                   on_file=batch.on_file, on_reject=batch.on_reject)
+                if not self._drain_body(reader):
+                    self.close_connection = True
+            except UploadRejected as e:
+                # Lo ya guardado queda guardado: el cliente recibe sus resultados
+                self.close_connection = True
+                self._send_json_response({'error': e.message, 'results': batch.results()},
+                                         e.status)
+                return
+
+            results = batch.results()
+            if not results:
+                self._send_error('No se encontró ningún archivo "photos" en la petición', 400)
+                return
+            payload, status = batch_payload(results)
+            self._send_json_response(payload, status)
 
-            if UPLOAD_DIR.exists():
-                # Obtener el host
-                host = self.headers.get('Host', 'localhost')
-                protocol = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
+        except Exception as e:
+            import traceback
+            error_msg = f'Error al subir fotos: {str(e)}'
+            print(f"Error: {error_msg}", file=sys.stderr)
+            print(traceback.format_exc(), file=sys.stderr)
+            self._send_error(error_msg, 500)
 
-                # Listar archivos ordenados por fecha (más recientes primero)
-                files = list(UPLOAD_DIR.glob('*'))
-                files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
+    def _base_url(self):
+        host = self.headers.get('Host', 'localhost')
+        protocol = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
+        return f"{protocol}://{host}"
+
+    def _body_reader(self):
+        """
+        Lector del cuerpo de una subida (Content-Length o Transfer-Encoding: chunked);
+        None si ya se respondió con un error.
+        """
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            self.close_connection = True
+            self._send_error('Content-Type debe ser multipart/form-data', 400)
+            return None
+
+        content_length = int(self.headers.get('Content-Length', 0)) or None
+        if content_length:
+            reader = LimitedBodyReader(self.rfile, content_length)
+        elif 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            reader = ChunkedBodyReader(self.rfile)
+        else:
+            self._send_error('No se recibió ningún archivo', 400)
+            return None
+        reader.length = content_length
+        return reader
+
+    @staticmethod
+    def _drain_body(reader):
+        """Lee hasta DRAIN_LIMIT bytes del resto del cuerpo; True si se terminó."""
+        drained = 0
+        while drained <= DRAIN_LIMIT:
+            data = reader.read(DRAIN_LIMIT)
+            if not data:
+                return True
+            drained += len(data)
+        return False
+
+    def _handle_events(self):
+        """Suscripción SSE a las fotos nuevas; la conexión pasa al hub de LIVE."""
+        host = self.headers.get('Host', 'localhost')
+        protocol = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
+        base_url = f"{protocol}://{host}"
+        params = parse_qs(urlparse(self.path).query)
+        last_id = last_event_id(self.headers.get('Last-Event-ID'), params)
+
+        def replay(since):
+            return storage_replay(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, since,
+                                  lambda filename, obj: photo_event(base_url, filename))
+
+        # El cuerpo termina cuando se cierra la conexión
+        self.close_connection = True
+        self.send_response(200)
+        for name, value in SSE_HEADERS.items():
+            self.send_header(name, value)
+        self._set_cors_headers()
+        self.end_headers()
+        self.wfile.flush()
 
-                for file_path in files:
-                    if file_path.is_file() and file_path.suffix.lower() in ALLOWED_EXTENSIONS:
-                        photos.append({
-                            'filename': file_path.name,
-                            'url': f"{protocol}://{host}/uploads/{file_path.name}"
-                        })
+        # El socket queda en manos del hub y este hilo vuelve a atender peticiones
+        LIVE.subscribe(socket.socket(fileno=self.connection.detach()), last_id, replay)
 
-            self._send_json_response(photos, 200)
+    def _handle_list_photos(self):
+        """Lista todas las fotos subidas."""
+        try:
+            # Obtener el host
+            host = self.headers.get('Host', 'localhost')
+            protocol = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
+
+            params = parse_qs(urlparse(self.path).query)
+            try:
+                window = parse_window(params)
+                since = parse_since(params)
+            except ValueError as e:
+                self._send_error(str(e), 400)
+                return
+            if window is not None and since is not None:
+                self._send_error('since no se puede combinar con from/to', 400)
+                return
+            if since is not None and wants_ndjson(params):
+                self._send_error('since no se puede combinar con format=ndjson', 400)
+                return
+            if wants_ndjson(params):
+                self._stream_photos_ndjson(f"{protocol}://{host}", window)
+                return
+            photos = list_photos(f"{protocol}://{host}", compact=wants_compact(params), since=since,
+                                 window=window)
+            self._send_encoded_json(photos)
 
         except Exception as e:
             import traceback
@@ -241,6 +657,77 @@ class LasaCamHandler(BaseHTTPRequestHandler):
             print(traceback.format_exc(), file=sys.stderr)
             self._send_error(error_msg, 500)
 
+    def _handle_contact_sheet(self):
+        """Mapa de una página de la galería (?page=&size=&tile=&cols=) o su hoja (image=1)."""
+        try:
+            if not sheet_available():
+                self._send_error('Hojas de contactos no disponibles (falta Pillow)', 501)
+                return
+
+            params = parse_qs(urlparse(self.path).query)
+            try:
+                spec = parse_sheet_params(params)
+            except ValueError as e:
+                self._send_error(str(e), 400)
+                return
+
+            plan = plan_sheet(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, spec)
+            if plan is None:
+                self._send_error('Página no encontrada', 404)
+                return
+
+            if params.get('image', [''])[0] != '1':
+                base_url = self._base_url()
+                self._send_encoded_json(sheet_map(plan, spec, UPLOAD_PREFIX,
+                                                  f"{base_url}/api/photos/sheet",
+                                                  lambda name: f"{base_url}/uploads/{name}"))
+                return
+
+            data = sheet_image(STORAGE, plan, spec, IMAGE_CACHE)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', sheet_cache_control(plan, params.get('v', [''])[0]))
+            self._set_cors_headers()
+            self.end_headers()
+            self.wfile.write(data)
+            add_bytes('out', len(data))
+
+        except Exception as e:
+            self._send_error(f'Error al armar la hoja de contactos: {str(e)}', 500)
+
+    def _stream_photos_ndjson(self, base_url, window=None):
+        """Listado en NDJSON, una foto por línea a medida que se recorre el almacenamiento."""
+        if window is not None:
+            objects = window_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS, *window)
+        else:
+            objects = iter_photos(STORAGE, UPLOAD_PREFIX, ALLOWED_EXTENSIONS)
+        entries = (photo_entry(base_url, obj) for obj in objects)
+
+        # Sin Content-Length: en HTTP/1.1 va por bloques (chunked) y la conexión
+        # sigue abierta; en HTTP/1.0 el fin del cuerpo lo marca el cierre
+        chunked = self.request_version != 'HTTP/1.0'
+        if not chunked:
+            self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', NDJSON_CONTENT_TYPE)
+        self.send_header('Cache-Control', 'no-cache')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self._set_cors_headers()
+        self.end_headers()
+
+        sent = 0
+        for chunk in ndjson_chunks(entries):
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+            sent += len(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        add_bytes('out', sent)
+
     def log_message(self, format, *args):
         """Override para personalizar los logs."""
         # Solo loguear errores importantes
@@ -248,15 +735,31 @@ class LasaCamHandler(BaseHTTPRequestHandler):
             super().log_message(format, *args)
 
 
+class LasaCamServer(ThreadingHTTPServer):
+    """
+    Un hilo por conexión: una conexión persistente inactiva no frena a las
+    demás. La cola de conexiones pendientes es más larga que la por defecto (5).
+    """
+    request_queue_size = 128
+
+
 def main():
     """Función principal que inicia el servidor."""
     server_address = ('', PORT)
-    httpd = HTTPServer(server_address, LasaCamHandler)
+    httpd = LasaCamServer(server_address, LasaCamHandler)
     
     print(f"Servidor LasaCam iniciado en http://localhost:{PORT}")
-    print(f"Directorio de uploads: {UPLOAD_DIR.absolute()}")
+    print(f"Almacenamiento: {STORAGE}")
+    if VARIANT_CACHE is not None:
+        print(f"Variantes {', '.join(VARIANT_FORMATS)}: {VARIANT_CACHE}")
     print("Presiona Ctrl+C para detener el servidor")
     
+    if WORKERS > 1:
+        print(f"Modo pre-fork: {WORKERS} workers")
+        PreforkServer(httpd, WORKERS, on_message=_receive_photo).serve_forever()
+        print("Servidor detenido.")
+        return
+    
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -0,0 +1,73 @@
+"""
+Imágenes de prueba para los benchmarks de LasaCam.
+
+Se generan en memoria con una semilla fija, así dos corridas en la misma
+máquina miden exactamente los mismos bytes.
+"""
+
+import io
+import random
+import functools
+
+from PIL import Image
+
+# nombre -> (formato, ancho, alto, modo)
+FIXTURE_SPECS = {
+    'jpeg_small': ('JPEG', 640, 480, 'RGB'),
+    'jpeg_medium': ('JPEG', 1920, 1080, 'RGB'),
+    'jpeg_large': ('JPEG', 4032, 3024, 'RGB'),
+    'png_rgba': ('PNG', 1080, 1920, 'RGBA'),
+    'gif_palette': ('GIF', 800, 600, 'P'),
+}
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+
+
+def _photo_like(width, height, seed):
+    """Imagen RGB con zonas suaves y ruido fino, parecida a una foto real."""
+    rnd = random.Random(seed)
+    low_w, low_h = max(width // 32, 2), max(height // 32, 2)
+    low = Image.frombytes('RGB', (low_w, low_h), rnd.randbytes(low_w * low_h * 3))
+    smooth = low.resize((width, height), Image.BICUBIC)
+    noise = Image.frombytes('RGB', (width, height), rnd.randbytes(width * height * 3))
+    return Image.blend(smooth, noise, 0.12)
+
+
+def _render(name, fmt, width, height, mode):
+    img = _photo_like(width, height, seed=name)
+
+    if mode == 'RGBA':
+        # Canal alfa en degradado, como un sticker con bordes transparentes
+        alpha = Image.linear_gradient('L').resize((width, height))
+        img = img.convert('RGBA')
+        img.putalpha(alpha)
+    elif mode == 'P':
+        img = img.quantize(colors=256)
+
+    output = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(output, format=fmt, quality=90)
+    else:
+        img.save(output, format=fmt)
+    return output.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def fixture(name):
+    """Bytes de la imagen de prueba `name`."""
+    fmt, width, height, mode = FIXTURE_SPECS[name]
+    return _render(name, fmt, width, height, mode)
+
+
+def fixture_filename(name):
+    fmt = FIXTURE_SPECS[name][0]
+    return f'{name}{EXTENSIONS[fmt]}'
+
+
+def multipart_body(filename, data, boundary, field='photo'):
+    """Arma un cuerpo multipart/form-data con un único archivo."""
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
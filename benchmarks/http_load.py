@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Carga HTTP contra backend/server.py levantado en un proceso aparte.
+
+Escenarios:
+    upload   Subidas concurrentes con la normalización de ingesta activada
+             (LASACAM_INGEST=1: decodificar, reducir y re-codificar con Pillow),
+             repetidas con 1, 2, 4... workers (LASACAM_WORKERS).
+    gallery  Carga de la galería: /api/photos y luego las N fotos con 6
+             conexiones en paralelo (como un navegador), abriendo una conexión
+             por petición (como con HTTP/1.0) o reutilizándolas (keep-alive).
+
+Uso:
+    python benchmarks/http_load.py                          # -> results/http_load.json
+    python benchmarks/http_load.py --workers 1,2,4,8 --concurrency 16
+    python benchmarks/http_load.py --photo jpeg_large --requests 100
+    python benchmarks/http_load.py --only gallery --gallery-size 100 --page-loads 20
+
+El servidor usa una carpeta temporal como almacenamiento. Con un solo núcleo
+disponible más workers no pueden escalar: se informa os.cpu_count() junto con
+los resultados.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / 'results'
+
+from fixtures import FIXTURE_SPECS, fixture, fixture_filename, multipart_body
+from run import _metadata, _percentile
+
+BOUNDARY = '----LasaCamLoadBoundary7MA4YWxkTrZu0gW'
+# Conexiones simultáneas por host de un navegador
+BROWSER_CONNECTIONS = 6
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """
+    backend/server.py (u otro `command` que escuche en $PORT) en un
+    subproceso, con su propio almacenamiento temporal.
+    """
+
+    def __init__(self, env=None, command=None):
+        self.port = _free_port()
+        self.storage = Path(tempfile.mkdtemp(prefix='lasacam-load-'))
+        self.env = dict(os.environ, PORT=str(self.port), LASACAM_STORAGE=str(self.storage),
+                        LASACAM_RATE_LIMIT_UPLOAD='0', LASACAM_REQUEST_LOG='0',
+                        **(env or {}))
+        self.command = command or [sys.executable, str(ROOT_DIR / 'backend' / 'server.py')]
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.command, cwd=ROOT_DIR, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__(None, None, None)
+        raise RuntimeError('El servidor no arrancó a tiempo')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.storage, ignore_errors=True)
+
+
+def _summary(latencies, errors, elapsed, extra=None):
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'req_per_s': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': _percentile(latencies, 50) * 1000 if latencies else None,
+        'p99_ms': _percentile(latencies, 99) * 1000 if latencies else None,
+    }
+    result.update(extra or {})
+    return result
+
+
+def upload_load(port, body, requests, concurrency):
+    """`requests` subidas repartidas entre `concurrency` clientes."""
+    content_type = f'multipart/form-data; boundary={BOUNDARY}'
+    pending = iter(range(requests))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def client():
+        while True:
+            with lock:
+                if next(pending, None) is None:
+                    return
+            t0 = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            try:
+                conn.request('POST', '/api/upload', body=body,
+                             headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                ok = False
+            finally:
+                conn.close()
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_upload(args):
+    data = fixture(args.photo)
+    body = multipart_body(fixture_filename(args.photo), data, BOUNDARY)
+    results = {}
+    for workers in args.workers:
+        with ServerProcess({'LASACAM_WORKERS': str(workers), 'LASACAM_INGEST': '1'}) as server:
+            # Calentamiento: imports de Pillow en cada worker
+            upload_load(server.port, body, workers * 2, workers)
+            result = upload_load(server.port, body, args.requests, args.concurrency)
+        name = f'upload[{args.photo},workers={workers}]'
+        results[name] = result
+        print(f'{name:<40} {result["req_per_s"]:7.2f} subidas/s  '
+              f'p50 {result["p50_ms"]:8.1f}ms  p99 {result["p99_ms"]:8.1f}ms  '
+              f'errores {result["errors"]}')
+    return results
+
+
+def _populate_gallery(root, count, data):
+    """`count` fotos en <root>/uploads con nombres como los de producción."""
+    directory = root / 'uploads'
+    directory.mkdir(parents=True, exist_ok=True)
+    base_ts = 1_700_000_000_000
+    for i in range(count):
+        (directory / f'lasacam-{base_ts + i * 1000}-{i:08x}.jpg').write_bytes(data)
+
+
+def page_load(port, keep_alive):
+    """Segundos hasta tener el listado y todas las fotos de la galería."""
+    headers = {} if keep_alive else {'Connection': 'close'}
+    started = time.perf_counter()
+
+    def fetch(conn, path):
+        if conn is None:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f'{path}: {response.status}')
+        if not keep_alive:
+            conn.close()
+            conn = None
+        return conn, body
+
+    conn, body = fetch(None, '/api/photos')
+    paths = [urlsplit(photo['url']).path for photo in json.loads(body)]
+    pending = iter(paths)
+    lock = threading.Lock()
+
+    def client(conn):
+        while True:
+            with lock:
+                path = next(pending, None)
+            if path is None:
+                break
+            conn, _ = fetch(conn, path)
+        if conn is not None:
+            conn.close()
+
+    threads = [threading.Thread(target=client, args=(conn if i == 0 else None,))
+               for i in range(BROWSER_CONNECTIONS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, len(paths) + 1
+
+
+def run_gallery(args):
+    data = fixture('jpeg_small')
+    results = {}
+    with ServerProcess() as server:
+        _populate_gallery(server.storage, args.gallery_size, data)
+        for keep_alive in (False, True):
+            mode = 'keep-alive' if keep_alive else 'close'
+            page_load(server.port, keep_alive)  # calentamiento
+            times, requests = [], 0
+            for _ in range(args.page_loads):
+                elapsed, requests = page_load(server.port, keep_alive)
+                times.append(elapsed)
+            name = f'gallery[{args.gallery_size},{mode}]'
+            results[name] = _summary(times, 0, sum(times), {'requests_per_page': requests})
+            # Para este escenario req_per_s son cargas de página por segundo
+            print(f'{name:<40} p50 {results[name]["p50_ms"]:8.1f}ms por página  '
+                  f'p99 {results[name]["p99_ms"]:8.1f}ms  ({requests} peticiones)')
+    return results
+
+
+SCENARIOS = {'upload': run_upload, 'gallery': run_gallery}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', choices=list(SCENARIOS), help='corre solo este escenario')
+    parser.add_argument('--workers', default='1,2,4',
+                        type=lambda value: [int(n) for n in value.split(',')])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=48)
+    parser.add_argument('--photo', default='jpeg_large', choices=list(FIXTURE_SPECS))
+    parser.add_argument('--gallery-size', type=int, default=100)
+    parser.add_argument('--page-loads', type=int, default=20)
+    parser.add_argument('--output', type=Path, default=RESULTS_DIR / 'http_load.json')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scenario in [args.only] if args.only else SCENARIOS:
+        results.update(SCENARIOS[scenario](args))
+
+    report = {'meta': _metadata(), 'results': results}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f'\nResultados guardados en {args.output} (cpu_count={os.cpu_count()})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
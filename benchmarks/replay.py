@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+Captura y reproducción de tráfico de una noche de evento.
+
+Los micro-benchmarks no reproducen la carga real: ráfagas de subidas después
+de cada foto grupal, galerías consultando el listado, una exportación en el
+medio. Este script arma trazas anónimas (ruta, tamaños, momento de llegada)
+y las reproduce a 1x–20x contra un servidor local.
+
+    capture  Convierte logs en una traza: las líneas JSON que escriben
+             backend/server.py y application.py por petición, o los logs de
+             las Functions exportados con
+             gcloud logging read 'jsonPayload.route:*' --format=json
+    synth    Genera una traza sintética de una noche de evento
+    replay   Reproduce una traza contra backend/server.py (server),
+             application.py en un servidor WSGI (wsgi) o las Functions sobre el
+             almacenamiento local (functions), e informa latencias por ruta,
+             errores, throughput y memoria (RSS) del servidor
+
+Uso:
+    python benchmarks/replay.py capture server.log -o trace.jsonl
+    python benchmarks/replay.py synth --minutes 10 --guests 80 -o trace.jsonl
+    python benchmarks/replay.py replay trace.jsonl --target wsgi --speed 10
+    python benchmarks/replay.py replay trace.jsonl --speed 20 --loops 5   # soak
+
+La traza solo guarda la ruta (sin nombres de archivo ni clientes), el método,
+el status, los bytes de entrada y salida, la duración y el momento relativo al
+comienzo. Con --loops N la traza se repite N veces y se marca crecimiento de
+memoria si el RSS al final de cada vuelta sube más que --max-growth-mb.
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / 'results'
+
+from fixtures import fixture, multipart_body
+from run import _metadata, _percentile
+from http_load import ServerProcess, BOUNDARY
+
+# Tipo de petición -> (ruta local, función del evento principal)
+KINDS = {
+    'upload': ('/api/upload', 'uploadPhoto'),
+    'batch': ('/api/upload/batch', 'uploadPhotoBatch'),
+    'list': ('/api/photos', 'listPhotos'),
+    'photo': ('/uploads', None),
+    'img': ('/img', 'resizeImage'),
+    'download': (None, 'downloadMultipleImages'),
+    'export': (None, 'exportImages'),
+    'events': ('/api/events', 'liveEvents'),
+    'delete': (None, 'deletePhotos'),
+    'metrics': ('/metrics', None),
+}
+# Las conexiones SSE duran lo que dure el cliente y los borrados achicarían
+# el conjunto de fotos: no se reproducen
+SKIPPED_KINDS = {'events', 'delete', 'other'}
+FUNCTION_VERBS = re.compile(r'^(upload|list|download|export|resize|live|delete)')
+
+PHOTO_FIXTURES = ('jpeg_small', 'jpeg_medium', 'jpeg_large')
+BATCH_MAX_FILES = 20
+DOWNLOAD_MAX_FILES = 50
+RSS_INTERVAL_S = 0.5
+
+
+def route_kind(route):
+    """Tipo de petición de una ruta local (/api/upload) o de una función (uploadProcigarPhoto)."""
+    for kind, (path, _) in KINDS.items():
+        if path is not None and route == path:
+            return kind
+    match = FUNCTION_VERBS.match(route)
+    if match is None:
+        return 'other'
+    verb = match.group(1)
+    if verb == 'upload':
+        return 'batch' if route.endswith('Batch') else 'upload'
+    return {'list': 'list', 'download': 'download', 'export': 'export',
+            'resize': 'img', 'live': 'events', 'delete': 'delete'}[verb]
+
+
+def function_event(route):
+    """Evento de una función: '' para el principal, 'Procigar' para uploadProcigarPhoto, etc."""
+    name = FUNCTION_VERBS.sub('', route)
+    return re.sub(r'(Multiple)?(Photo|Image)s?(Batch)?$|Events$', '', name)
+
+
+# --- capture ---------------------------------------------------------------
+
+def _log_records(path):
+    """Objetos JSON de un archivo de log: una línea por objeto o un array (gcloud)."""
+    text = Path(path).read_text(encoding='utf-8', errors='replace')
+    if text.lstrip().startswith('['):
+        yield from json.loads(text)
+        return
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('{'):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _record_start_ms(record, payload):
+    if 'start_ms' in payload:
+        return float(payload['start_ms'])
+    # Entrada de Cloud Logging: el timestamp es el del final de la petición
+    stamp = record.get('timestamp')
+    if not stamp:
+        return None
+    stamp = re.sub(r'(\.\d{6})\d+', r'\1', stamp.replace('Z', '+00:00'))
+    return datetime.fromisoformat(stamp).timestamp() * 1000 - payload['duration_ms']
+
+
+def capture(paths):
+    """Traza ordenada a partir de los logs de petición."""
+    entries = []
+    for path in paths:
+        for record in _log_records(path):
+            payload = record.get('jsonPayload', record)
+            if not isinstance(payload, dict) or 'route' not in payload or 'duration_ms' not in payload:
+                continue
+            start = _record_start_ms(record, payload)
+            if start is None:
+                continue
+            entries.append({
+                'start': start,
+                'route': payload['route'],
+                'kind': route_kind(payload['route']),
+                'method': payload.get('method', 'GET'),
+                'status': payload.get('status'),
+                'bytes_in': payload.get('bytes_in', 0),
+                'bytes_out': payload.get('bytes_out', 0),
+                'duration_ms': payload['duration_ms'],
+            })
+    entries.sort(key=lambda entry: entry['start'])
+    if not entries:
+        return []
+    origin = entries[0]['start']
+    for entry in entries:
+        entry['t_ms'] = round(entry.pop('start') - origin, 1)
+    return entries
+
+
+# --- synth -----------------------------------------------------------------
+
+def synth(minutes, guests, seed):
+    """Noche de evento: fotos grupales con ráfagas de subidas, galerías y una exportación."""
+    rnd = random.Random(seed)
+    end_ms = minutes * 60_000
+    entries = []
+
+    def add(t_ms, kind, method='GET', bytes_in=0, bytes_out=0):
+        if t_ms < end_ms:
+            route = KINDS[kind][0] or KINDS[kind][1]
+            entries.append({'t_ms': round(t_ms, 1), 'route': route, 'kind': kind, 'method': method,
+                            'status': 200, 'bytes_in': int(bytes_in), 'bytes_out': int(bytes_out),
+                            'duration_ms': None})
+
+    # Cada foto grupal: buena parte de los invitados sube en los 20 s siguientes
+    shot = rnd.uniform(20_000, 60_000)
+    while shot < end_ms:
+        for _ in range(int(guests * rnd.uniform(0.3, 0.8))):
+            at = shot + rnd.expovariate(1 / 6_000)
+            if rnd.random() < 0.1:
+                add(at, 'batch', 'POST', bytes_in=rnd.randint(2, 6) * 250_000)
+            else:
+                add(at, 'upload', 'POST', bytes_in=rnd.lognormvariate(13.5, 0.6))
+        shot += rnd.uniform(60_000, 120_000)
+
+    # Galerías abiertas: listado cada ~20 s y algunas miniaturas
+    for _ in range(max(1, guests // 3)):
+        at = rnd.uniform(0, 20_000)
+        while at < end_ms:
+            add(at, 'list', bytes_out=40_000)
+            for _ in range(rnd.randint(0, 6)):
+                add(at + rnd.uniform(50, 2_000), 'img', bytes_out=30_000)
+            at += rnd.uniform(15_000, 25_000)
+
+    # Una exportación a mitad de la noche
+    add(end_ms / 2, 'download', 'POST', bytes_out=DOWNLOAD_MAX_FILES * 250_000)
+
+    entries.sort(key=lambda entry: entry['t_ms'])
+    return entries
+
+
+# --- replay ----------------------------------------------------------------
+
+def _batch_body(data, count):
+    parts = [(f'--{BOUNDARY}\r\n'
+              f'Content-Disposition: form-data; name="photos"; filename="batch{i}.jpg"\r\n'
+              f'Content-Type: image/jpeg\r\n\r\n').encode() + data + b'\r\n'
+             for i in range(count)]
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def _rss_mb(pid):
+    """RSS en MB del proceso y sus hijos (workers de LASACAM_WORKERS), o None fuera de Linux."""
+    proc = Path('/proc')
+    if not proc.exists():
+        return None
+    pids = {pid}
+    for entry in proc.iterdir():
+        if entry.name.isdigit():
+            try:
+                if int((entry / 'stat').read_text().rsplit(')', 1)[1].split()[1]) == pid:
+                    pids.add(int(entry.name))
+            except (OSError, IndexError, ValueError):
+                continue
+    total = 0
+    for child in pids:
+        try:
+            for line in (proc / str(child) / 'status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+class RssMonitor:
+    """Muestrea el RSS del servidor en un hilo aparte."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(RSS_INTERVAL_S)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def now(self):
+        return _rss_mb(self.pid)
+
+
+class Replayer:
+    """Convierte cada entrada de la traza en una petición real y mide su latencia."""
+
+    def __init__(self, port, target, concurrency):
+        self.port = port
+        self.target = target
+        self.concurrency = concurrency
+        self.photos = {}
+        self._lock = threading.Lock()
+        self._rnd = random.Random(0)
+        self._uploads = []
+        for name in PHOTO_FIXTURES:
+            data = fixture(name)
+            self._uploads.append((len(data), multipart_body(f'{name}.jpg', data, BOUNDARY)))
+        self._batch_photo = fixture('jpeg_small')
+
+    def _send(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+            return response.status, data
+        finally:
+            conn.close()
+
+    def _remember(self, event, data):
+        try:
+            result = json.loads(data)
+        except ValueError:
+            return
+        results = result.get('results', [result]) if isinstance(result, dict) else []
+        with self._lock:
+            self.photos.setdefault(event, []).extend(
+                item['filename'] for item in results if isinstance(item, dict) and 'filename' in item)
+
+    def _pick(self, event, count=1):
+        with self._lock:
+            pool = self.photos.get(event) or []
+            if not pool:
+                return []
+            return self._rnd.sample(pool, min(count, len(pool)))
+
+    def _endpoint(self, entry):
+        """(ruta, evento) de la entrada en este destino, o None si no aplica."""
+        kind, route = entry['kind'], entry['route']
+        if self.target == 'functions':
+            if FUNCTION_VERBS.match(route):
+                return f'/{route}', function_event(route)
+            name = KINDS[kind][1]
+            return (f'/{name}', '') if name else None
+        path = KINDS[kind][0]
+        return (path, '') if path else None
+
+    def request_for(self, entry):
+        """(método, ruta, cuerpo, headers, evento) de una entrada, o None si no se reproduce."""
+        kind = entry['kind']
+        endpoint = None if kind in SKIPPED_KINDS else self._endpoint(entry)
+        if endpoint is None:
+            return None
+        path, event = endpoint
+        multipart = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+
+        if kind == 'upload':
+            # La foto de prueba de tamaño más parecido
+            size = entry.get('bytes_in') or 0
+            body = min(self._uploads, key=lambda item: abs(item[0] - size))[1]
+            return 'POST', path, body, multipart, event
+        if kind == 'batch':
+            count = max(1, min(BATCH_MAX_FILES, round((entry.get('bytes_in') or 0) /
+                                                      len(self._batch_photo))))
+            return 'POST', path, _batch_body(self._batch_photo, count), multipart, event
+        if kind in ('download', 'export'):
+            count = max(1, min(DOWNLOAD_MAX_FILES, round((entry.get('bytes_out') or 0) /
+                                                         len(self._batch_photo))))
+            names = self._pick(event, count)
+            if not names:
+                return None
+            body = json.dumps({'imageNames': names}).encode()
+            return 'POST', path, body, {'Content-Type': 'application/json'}, event
+        if kind in ('photo', 'img'):
+            names = self._pick(event)
+            if not names:
+                return None
+            if kind == 'photo':
+                return 'GET', f'{path}/{names[0]}', None, {}, event
+            if self.target == 'functions':
+                return 'GET', f'{path}?filename={names[0]}&w=400', None, {}, event
+            return 'GET', f'{path}/{names[0]}?w=400', None, {}, event
+        return 'GET', path, None, {}, event
+
+    def seed(self, trace, count):
+        """Sube `count` fotos por evento de la traza antes de medir."""
+        events = {self._endpoint(entry)[1] for entry in trace
+                  if entry['kind'] not in SKIPPED_KINDS and self._endpoint(entry) is not None}
+        for event in sorted(events or {''}):
+            path = f'/upload{event}Photo' if self.target == 'functions' else KINDS['upload'][0]
+            body = multipart_body('seed.jpg', self._batch_photo, BOUNDARY)
+            for _ in range(count):
+                status, data = self._send('POST', path, body, {
+                    'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+                if status == 200:
+                    self._remember(event, data)
+
+    def run(self, trace, speed):
+        """Reproduce la traza a `speed`x; latencias medidas desde el momento programado."""
+        results = {}
+        lock = threading.Lock()
+
+        def record(kind, latency, status):
+            with lock:
+                stats = results.setdefault(kind, {'latencies': [], 'errors': 0, 'status': {}})
+                stats['latencies'].append(latency)
+                stats['status'][status] = stats['status'].get(status, 0) + 1
+                if status == 'error' or status >= 400:
+                    stats['errors'] += 1
+
+        def send(entry, request, due):
+            method, path, body, headers, event = request
+            try:
+                status, data = self._send(method, path, body, headers)
+                if entry['kind'] in ('upload', 'batch') and status in (200, 207):
+                    self._remember(event, data)
+            except OSError:
+                status = 'error'
+            record(entry['kind'], time.perf_counter() - due, status)
+
+        skipped = {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for entry in trace:
+                due = started + entry['t_ms'] / 1000 / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                request = self.request_for(entry)
+                if request is None:
+                    skipped[entry['kind']] = skipped.get(entry['kind'], 0) + 1
+                    continue
+                pool.submit(send, entry, request, due)
+        elapsed = time.perf_counter() - started
+        return results, skipped, elapsed
+
+
+def _route_summary(stats):
+    latencies = sorted(stats['latencies'])
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': stats['errors'],
+        'error_rate': stats['errors'] / count if count else 0,
+        'status': {str(status): n for status, n in stats['status'].items()},
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p90_ms': _percentile(latencies, 90) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+TARGETS = {
+    'server': None,
+    'wsgi': [sys.executable, str(BENCH_DIR / 'serve.py'), 'wsgi'],
+    'functions': [sys.executable, str(BENCH_DIR / 'serve.py'), 'functions'],
+}
+
+
+def replay(args):
+    trace = [json.loads(line) for line in args.trace.read_text().splitlines() if line.strip()]
+    if not trace:
+        sys.exit('La traza está vacía')
+
+    env = {'LASACAM_RATE_LIMIT_UPLOAD': '0', 'LASACAM_RATE_LIMIT_EXPORT': '0', 'LASACAM_WORKERS': str(args.workers)}
+    if args.storage_latency_ms:
+        env['LASACAM_STORAGE_LATENCY_MS'] = str(args.storage_latency_ms)
+    server = ServerProcess(env, command=TARGETS[args.target])
+    # Cachés y buckets dentro de la carpeta temporal del servidor
+    server.env.update(LASACAM_LOCAL_STORAGE=str(server.storage),
+                      LASACAM_VARIANT_CACHE=str(server.storage / '.cache' / 'variants'),
+                      LASACAM_IMG_CACHE=str(server.storage / '.cache' / 'img'))
+
+    loops = []
+    with server:
+        replayer = Replayer(server.port, args.target, args.concurrency)
+        replayer.seed(trace, args.seed_photos)
+        with RssMonitor(server.process.pid) as monitor:
+            rss_start = monitor.now()
+            for loop in range(args.loops):
+                results, skipped, elapsed = replayer.run(trace, args.speed)
+                # Un momento para que termine lo que sigue en segundo plano (exportaciones)
+                time.sleep(1)
+                loops.append({'results': results, 'skipped': skipped, 'elapsed_s': elapsed,
+                              'rss_mb': monitor.now()})
+                done = sum(len(stats['latencies']) for stats in results.values())
+                print(f'vuelta {loop + 1}/{args.loops}: {done} peticiones en {elapsed:.1f}s, '
+                      f'RSS {loops[-1]["rss_mb"] or 0:.1f} MB')
+
+    routes = {}
+    for loop in loops:
+        for kind, stats in loop['results'].items():
+            merged = routes.setdefault(kind, {'latencies': [], 'errors': 0, 'status': {}})
+            merged['latencies'].extend(stats['latencies'])
+            merged['errors'] += stats['errors']
+            for status, n in stats['status'].items():
+                merged['status'][status] = merged['status'].get(status, 0) + n
+    routes = {kind: _route_summary(stats) for kind, stats in sorted(routes.items())}
+    requests = sum(route['requests'] for route in routes.values())
+    errors = sum(route['errors'] for route in routes.values())
+    elapsed = sum(loop['elapsed_s'] for loop in loops)
+
+    rss_loops = [loop['rss_mb'] for loop in loops]
+    report = {
+        'meta': dict(_metadata(), target=args.target, speed=args.speed, loops=args.loops,
+                     trace=str(args.trace), trace_entries=len(trace)),
+        'requests': requests,
+        'errors': errors,
+        'error_rate': errors / requests if requests else 0,
+        'elapsed_s': elapsed,
+        'req_per_s': requests / elapsed if elapsed else None,
+        'routes': routes,
+        'skipped': loops[0]['skipped'],
+        'rss_mb': {'start': rss_start, 'peak': max(monitor.samples, default=None),
+                   'per_loop': rss_loops},
+    }
+    if args.loops > 1 and None not in rss_loops:
+        growth = rss_loops[-1] - rss_loops[0]
+        # Fuga probable: crece de punta a punta y no baja en ninguna vuelta
+        rising = all(b >= a for a, b in zip(rss_loops, rss_loops[1:]))
+        report['soak'] = {'growth_mb': growth,
+                          'memory_growth': growth > args.max_growth_mb and rising}
+
+    print(f'\n{"ruta":<10} {"peticiones":>10} {"errores":>8} {"p50":>9} {"p90":>9} {"p99":>9}')
+    for kind, route in routes.items():
+        print(f'{kind:<10} {route["requests"]:>10} {route["errors"]:>8} '
+              f'{route["p50_ms"]:>7.1f}ms {route["p90_ms"]:>7.1f}ms {route["p99_ms"]:>7.1f}ms')
+    print(f'\n{requests} peticiones, {report["req_per_s"]:.1f}/s, errores {report["error_rate"]:.1%}, '
+          f'RSS pico {report["rss_mb"]["peak"] or 0:.1f} MB')
+    if report['skipped']:
+        print(f'sin reproducir: {report["skipped"]}')
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f'Resultados guardados en {args.output}')
+    if report.get('soak', {}).get('memory_growth'):
+        print(f'ATENCIÓN: la memoria creció {report["soak"]["growth_mb"]:.1f} MB en '
+              f'{args.loops} vueltas')
+        return 1
+    return 0
+
+
+def _write_trace(entries, output):
+    lines = ''.join(json.dumps(entry) + '\n' for entry in entries)
+    if output is None:
+        sys.stdout.write(lines)
+    else:
+        output.write_text(lines)
+        print(f'{len(entries)} peticiones en {output}', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    capture_parser = commands.add_parser('capture', help='traza a partir de logs de petición')
+    capture_parser.add_argument('logs', nargs='+', type=Path)
+    capture_parser.add_argument('-o', '--output', type=Path)
+
+    synth_parser = commands.add_parser('synth', help='traza sintética de una noche de evento')
+    synth_parser.add_argument('--minutes', type=float, default=10)
+    synth_parser.add_argument('--guests', type=int, default=60)
+    synth_parser.add_argument('--seed', type=int, default=1)
+    synth_parser.add_argument('-o', '--output', type=Path)
+
+    replay_parser = commands.add_parser('replay', help='reproduce una traza contra un servidor local')
+    replay_parser.add_argument('trace', type=Path)
+    replay_parser.add_argument('--target', choices=list(TARGETS), default='server')
+    replay_parser.add_argument('--speed', type=float, default=1,
+                               help='1 = tiempo real, 20 = veinte veces más rápido')
+    replay_parser.add_argument('--loops', type=int, default=1, help='vueltas (soak)')
+    replay_parser.add_argument('--max-growth-mb', type=float, default=20)
+    replay_parser.add_argument('--concurrency', type=int, default=64,
+                               help='peticiones simultáneas como máximo')
+    replay_parser.add_argument('--workers', type=int, default=1, help='LASACAM_WORKERS (server)')
+    replay_parser.add_argument('--seed-photos', type=int, default=20,
+                               help='fotos subidas antes de medir, por evento')
+    replay_parser.add_argument('--storage-latency-ms', type=float, default=0,
+                               help='latencia simulada del almacenamiento local')
+    replay_parser.add_argument('--output', type=Path, default=RESULTS_DIR / 'replay.json')
+    args = parser.parse_args(argv)
+
+    if args.command == 'capture':
+        _write_trace(capture(args.logs), args.output)
+        return 0
+    if args.command == 'synth':
+        _write_trace(synth(args.minutes, args.guests, args.seed), args.output)
+        return 0
+    if not 1 <= args.speed <= 100:
+        parser.error('--speed debe estar entre 1 y 100')
+    return replay(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de los caminos críticos de LasaCam: parseo multipart,
+conversión a JPG, exportación ZIP, listado local y listado por rangos paralelos.
+
+Uso:
+    python benchmarks/run.py                         # corre todo -> results/latest.json
+    python benchmarks/run.py --only convert          # solo los que contienen 'convert'
+    python benchmarks/run.py --save-baseline         # además guarda results/baseline.json
+    python benchmarks/run.py --baseline benchmarks/results/baseline.json
+
+Con --baseline compara la mediana (p50) y el pico de memoria contra la línea
+base y termina con código 1 si algo empeora más que --tolerance.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+from pathlib import Path
+from datetime import datetime
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / 'results'
+
+sys.path.insert(0, str(ROOT_DIR / 'functions'))
+
+from fixtures import FIXTURE_SPECS, fixture, fixture_filename, multipart_body
+from lasacam.storage import LocalStorage
+from lasacam.uploads import read_multipart
+from lasacam.scan import scan_objects
+
+BOUNDARY = '----LasaCamBenchBoundary7MA4YWxkTrZu0gW'
+LISTING_SIZES = (100, 1000)
+# Listado con la latencia de Storage simulada: N objetos, páginas de 1000
+SCAN_SIZE = 20000
+SCAN_LATENCY_MS = 30
+SCAN_PARTITIONS = (1, 8)
+ZIP_NAMES = ['jpeg_small', 'jpeg_medium', 'png_rgba', 'gif_palette'] * 5
+
+
+def _load_module(name, path):
+    """Importa un archivo .py por ruta (application.py y backend/server.py no son paquetes)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _load_functions_main():
+    """functions/main.py requiere firebase_functions/firebase_admin; None si no están."""
+    try:
+        import main
+    except ImportError as e:
+        print(f'Aviso: se omiten benchmarks de functions/main.py ({e})', file=sys.stderr)
+        return None
+    return main
+
+
+class _Request:
+    """Lo mínimo de https_fn.Request que usa _parse_multipart_form."""
+
+    def __init__(self, body, content_type):
+        self.headers = {'Content-Type': content_type}
+        self.content_length = len(body)
+        self._body = body
+
+    @property
+    def stream(self):
+        # Un stream nuevo por llamada: el parser lo consume
+        return io.BytesIO(self._body)
+
+
+class Benchmark:
+    """Un caso de benchmark: `run` se mide; `items`/`nbytes` dan el throughput."""
+
+    def __init__(self, name, run, items=1, nbytes=0, teardown=None):
+        self.name = name
+        self.run = run
+        self.items = items
+        self.nbytes = nbytes
+        self.teardown = teardown
+
+
+def _populate_upload_dir(root, count):
+    """Crea `count` archivos en <root>/uploads con nombres y mtimes como los de producción."""
+    directory = root / 'uploads'
+    directory.mkdir(parents=True, exist_ok=True)
+    base_ts = 1_700_000_000_000
+    for i in range(count):
+        path = directory / f'lasacam-{base_ts + i * 1000}-{i:08x}.jpg'
+        path.write_bytes(b'\xff\xd8\xff\xe0')
+        os.utime(path, (base_ts / 1000 + i, base_ts / 1000 + i))
+
+
+def build_benchmarks():
+    benchmarks = []
+    main = _load_functions_main()
+    application = _load_module('lasacam_application', ROOT_DIR / 'application.py')
+    server = _load_module('lasacam_server', ROOT_DIR / 'backend' / 'server.py')
+    content_type = f'multipart/form-data; boundary={BOUNDARY}'
+
+    for name in FIXTURE_SPECS:
+        data = fixture(name)
+        body = multipart_body(fixture_filename(name), data, BOUNDARY)
+
+        if main is not None:
+            request = _Request(body, content_type)
+            benchmarks.append(Benchmark(
+                f'parse_multipart_form[{name}]',
+                lambda request=request: main._parse_multipart_form(request),
+                nbytes=len(body)))
+
+            benchmarks.append(Benchmark(
+                f'convert_to_jpg[{name}]',
+                lambda data=data: main._convert_to_jpg(data),
+                nbytes=len(data)))
+
+        benchmarks.append(Benchmark(
+            f'read_multipart[{name}]',
+            lambda body=body: read_multipart(io.BytesIO(body).read, content_type,
+                                             content_length=len(body),
+                                             allowed_extensions=application.ALLOWED_EXTENSIONS,
+                                             max_file_size=application.MAX_FILE_SIZE),
+            nbytes=len(body)))
+
+    if main is not None:
+        images = {f'{n}-{i}{Path(fixture_filename(n)).suffix}': fixture(n)
+                  for i, n in enumerate(ZIP_NAMES)}
+        names = list(images)
+        benchmarks.append(Benchmark(
+            f'zip_export[{len(names)}]',
+            lambda: main._build_zip(names, images.get),
+            items=len(names),
+            nbytes=sum(len(d) for d in images.values())))
+
+    for count in LISTING_SIZES:
+        tmp = Path(tempfile.mkdtemp(prefix='lasacam-bench-'))
+        _populate_upload_dir(tmp, count)
+        store = LocalStorage(tmp)
+        environ = {'HTTP_HOST': 'bench.local'}
+
+        def run_application(store=store):
+            application.STORAGE = store
+            return application.handle_list_photos(environ)
+
+        def run_server(store=store):
+            server.STORAGE = store
+            return server.list_photos('http://bench.local')
+
+        cleanup = lambda tmp=tmp: shutil.rmtree(tmp, ignore_errors=True)
+        benchmarks.append(Benchmark(f'application.handle_list_photos[{count}]',
+                                    run_application, items=count))
+        benchmarks.append(Benchmark(f'server.list_photos[{count}]',
+                                    run_server, items=count, teardown=cleanup))
+
+    tmp = Path(tempfile.mkdtemp(prefix='lasacam-bench-'))
+    _populate_upload_dir(tmp, SCAN_SIZE)
+    store = LocalStorage(tmp, latency_ms=SCAN_LATENCY_MS)
+    for partitions in SCAN_PARTITIONS:
+        last = partitions == SCAN_PARTITIONS[-1]
+        benchmarks.append(Benchmark(
+            f'scan_objects[{SCAN_SIZE},partitions={partitions}]',
+            lambda partitions=partitions: scan_objects(store, 'uploads/', partitions=partitions),
+            items=SCAN_SIZE,
+            teardown=(lambda: shutil.rmtree(tmp, ignore_errors=True)) if last else None))
+
+    return benchmarks
+
+
+def _percentile(sorted_samples, pct):
+    """Percentil por rango más cercano."""
+    index = max(0, min(len(sorted_samples) - 1,
+                       int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def measure(benchmark, min_time, min_iterations, max_iterations, warmup):
+    for _ in range(warmup):
+        benchmark.run()
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_iterations:
+        t0 = time.perf_counter()
+        benchmark.run()
+        samples.append(time.perf_counter() - t0)
+        if len(samples) >= min_iterations and time.perf_counter() - started >= min_time:
+            break
+
+    # Pico de memoria en una corrida aparte: tracemalloc distorsiona los tiempos
+    tracemalloc.start()
+    benchmark.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    result = {
+        'iterations': len(samples),
+        'mean_ms': mean * 1000,
+        'min_ms': samples[0] * 1000,
+        'p50_ms': _percentile(samples, 50) * 1000,
+        'p90_ms': _percentile(samples, 90) * 1000,
+        'p99_ms': _percentile(samples, 99) * 1000,
+        'ops_per_s': 1 / mean if mean else None,
+        'items_per_s': benchmark.items / mean if mean else None,
+        'peak_memory_bytes': peak,
+    }
+    if benchmark.nbytes:
+        result['mb_per_s'] = benchmark.nbytes / mean / 1024 / 1024 if mean else None
+        result['input_bytes'] = benchmark.nbytes
+    return result
+
+
+def _metadata():
+    try:
+        import PIL
+        pillow = PIL.__version__
+    except ImportError:
+        pillow = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pillow': pillow,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Imprime la comparación contra la línea base; devuelve la lista de regresiones."""
+    regressions = []
+    print(f'\nComparación contra línea base ({baseline["meta"].get("timestamp")}):')
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'  {name:<45} (nuevo)')
+            continue
+        time_ratio = current['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+        mem_ratio = (current['peak_memory_bytes'] / base['peak_memory_bytes']
+                     if base['peak_memory_bytes'] else 1.0)
+        flags = []
+        if time_ratio > 1 + tolerance:
+            flags.append('TIEMPO')
+        if mem_ratio > 1 + tolerance:
+            flags.append('MEMORIA')
+        if flags:
+            regressions.append((name, flags))
+        mark = ' <-- REGRESIÓN ' + '/'.join(flags) if flags else ''
+        print(f'  {name:<45} p50 x{time_ratio:5.2f}  mem x{mem_ratio:5.2f}{mark}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', help='corre solo los benchmarks cuyo nombre contiene este texto')
+    parser.add_argument('--output', type=Path, default=RESULTS_DIR / 'latest.json')
+    parser.add_argument('--baseline', type=Path, help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='guarda también los resultados como results/baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='empeoramiento relativo permitido antes de marcar regresión (0.15 = 15%%)')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='segundos mínimos de medición por benchmark')
+    parser.add_argument('--min-iterations', type=int, default=5)
+    parser.add_argument('--max-iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    benchmarks = build_benchmarks()
+    if args.only:
+        benchmarks = [b for b in benchmarks if args.only in b.name]
+
+    results = {}
+    try:
+        for benchmark in benchmarks:
+            result = measure(benchmark, args.min_time, args.min_iterations,
+                             args.max_iterations, args.warmup)
+            results[benchmark.name] = result
+            print(f'{benchmark.name:<45} p50 {result["p50_ms"]:9.2f}ms  '
+                  f'p99 {result["p99_ms"]:9.2f}ms  '
+                  f'peak {result["peak_memory_bytes"] / 1024 / 1024:7.1f}MB')
+    finally:
+        for benchmark in benchmarks:
+            if benchmark.teardown:
+                benchmark.teardown()
+
+    report = {'meta': _metadata(), 'results': results}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f'\nResultados guardados en {args.output}')
+
+    if args.save_baseline:
+        baseline_path = RESULTS_DIR / 'baseline.json'
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f'Línea base guardada en {baseline_path}')
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regresiones por encima de {args.tolerance:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Levanta application.py o las Functions de functions/main.py como servidores
+HTTP locales en $PORT, para las pruebas de carga (ver replay.py).
+
+    python benchmarks/serve.py wsgi        application.py en un servidor WSGI con hilos
+    python benchmarks/serve.py functions   cada función HTTP de main.py en /<nombre>
+
+Las Functions usan LASACAM_LOCAL_STORAGE como almacenamiento (requiere
+firebase_functions y firebase_admin instalados).
+"""
+
+import os
+import sys
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def functions_app():
+    """App WSGI que enruta /<nombre> a la función HTTP homónima de main.py."""
+    sys.path.insert(0, str(ROOT_DIR / 'functions'))
+    import main
+    from flask import Flask, request
+
+    app = Flask('lasacam-functions')
+
+    @app.route('/<name>', methods=['GET', 'POST', 'DELETE', 'OPTIONS'])
+    def dispatch(name):
+        handler = getattr(main, name, None)
+        if name.startswith('_') or not callable(handler):
+            return {'error': 'Función no encontrada'}, 404
+        return handler(request)
+
+    return app
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    target = argv[0] if argv else 'wsgi'
+    if target == 'wsgi':
+        sys.path.insert(0, str(ROOT_DIR))
+        from application import application as app
+    elif target == 'functions':
+        app = functions_app()
+    else:
+        sys.exit(f'Destino desconocido: {target} (wsgi o functions)')
+
+    port = int(os.environ.get('PORT', 8080))
+    make_server('127.0.0.1', port, app, server_class=ThreadingWSGIServer,
+                handler_class=QuietHandler).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+Módulos compartidos de LasaCam.
+
+Los usan las Firebase Functions (functions/main.py) y los servidores locales
+(backend/server.py y application.py), que agregan el directorio functions/ al
+path. Solo dependen de la librería estándar; Pillow es opcional.
+"""
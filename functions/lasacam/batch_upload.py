@@ -0,0 +1,87 @@
+"""
+Subida de varias fotos en una sola petición (p. ej. un kiosco que vacía su cola).
+
+Cada parte `photos` (o `photo`) se valida mientras llega, igual que en la
+subida individual, pero una foto inválida no corta la petición: queda con su
+error en los resultados y se sigue con la próxima. Las fotos válidas se
+guardan en paralelo mientras se sigue leyendo el cuerpo, con a lo sumo
+BATCH_WORKERS a la vez; si se acumulan, la lectura espera, así la memoria
+queda acotada aunque el lote sea grande.
+
+La respuesta trae un resultado por archivo, en el orden del cuerpo:
+    {"originalName": ..., "filename": ..., "url": ...}   guardada
+    {"originalName": ..., "error": ...}                  rechazada
+con estado 200 si se guardaron todas y 207 si alguna falló.
+
+Variables de entorno:
+    LASACAM_BATCH_MAX_FILES   Fotos por petición (20)
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_FIELDS = ('photos', 'photo')
+BATCH_WORKERS = 4
+
+
+def batch_max_files():
+    return int(os.environ.get('LASACAM_BATCH_MAX_FILES', 20))
+
+
+class BatchUpload:
+    """
+    Recibe los archivos de read_multipart (on_file / on_reject) y los guarda con
+    `save(UploadedFile)`, que devuelve el resultado de la foto (dict).
+    `admit()` se consulta por cada foto después de la primera y devuelve None o
+    el motivo del rechazo (p. ej. el límite por cliente).
+    """
+
+    def __init__(self, save, admit=None, max_workers=BATCH_WORKERS):
+        self.save = save
+        self.admit = admit
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        # Fotos recibidas esperando turno: más allá de esto, la lectura espera
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._entries = []
+
+    def on_file(self, uploaded):
+        if self.admit is not None and self._entries:
+            reason = self.admit()
+            if reason is not None:
+                self._entries.append({'originalName': uploaded.filename, 'error': reason})
+                return
+        self._slots.acquire()
+        self._entries.append(self._pool.submit(self._save, uploaded))
+
+    def on_reject(self, field, filename, message):
+        self._entries.append({'originalName': filename, 'error': message})
+
+    def _save(self, uploaded):
+        try:
+            result = self.save(uploaded)
+            return {'originalName': uploaded.filename, **result}
+        except Exception as e:
+            print(f'Error guardando {uploaded.filename}: {str(e)}')
+            return {'originalName': uploaded.filename, 'error': f'Error al subir foto: {str(e)}'}
+        finally:
+            # Los bytes ya no hacen falta; read_multipart conserva el objeto
+            uploaded.data = b''
+            self._slots.release()
+
+    def results(self):
+        """Espera a las fotos pendientes y devuelve un resultado por archivo."""
+        self._pool.shutdown(wait=True)
+        return [entry if isinstance(entry, dict) else entry.result() for entry in self._entries]
+
+
+def batch_payload(results):
+    """(cuerpo, estado) de la respuesta de una subida múltiple."""
+    saved = sum(1 for result in results if 'error' not in result)
+    payload = {
+        'message': f'{saved} de {len(results)} fotos subidas',
+        'uploaded': saved,
+        'failed': len(results) - saved,
+        'results': results,
+    }
+    return payload, 200 if saved == len(results) else 207
@@ -0,0 +1,119 @@
+"""
+Respuestas JSON comprimidas según Accept-Encoding (brotli o gzip).
+
+El cuerpo comprimido se guarda en memoria junto al hash del JSON, así los
+clientes que repiten el mismo listado (polling) no lo vuelven a comprimir:
+mientras las fotos no cambien solo se serializa y se calcula el hash. El
+mismo hash se usa como ETag, y un If-None-Match que coincide recibe 304.
+
+brotli es opcional (paquete `Brotli`); sin él se usa gzip.
+"""
+
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Por debajo de este tamaño no vale la pena comprimir
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHE_ENTRIES = 32
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' o None según el header Accept-Encoding (respeta q=0)."""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and params[2:] in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressedBodyCache:
+    """Últimos cuerpos comprimidos, por (hash del JSON, encoding)."""
+
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, digest, encoding, body):
+        key = (digest, encoding)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        data = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+
+BODY_CACHE = CompressedBodyCache()
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return etag in tags or etag[2:] in tags
+
+
+def json_response(data, accept_encoding='', if_none_match='', cache=BODY_CACHE):
+    """
+    Serializa `data` y negocia la compresión.
+    Devuelve (status, cuerpo, headers) con status 200 o 304.
+    """
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha1(body).hexdigest()
+    etag = f'W/"{digest}"'
+    headers = {'Content-Type': 'application/json', 'ETag': etag, 'Vary': 'Accept-Encoding'}
+
+    if _etag_matches(if_none_match, etag):
+        return 304, b'', headers
+
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding is not None:
+        body = cache.get(digest, encoding, body)
+        headers['Content-Encoding'] = encoding
+    return 200, body, headers
+
+
+def wants_compact(params):
+    """True si la petición pide la forma compacta (?shape=compact)."""
+    value = params.get('shape')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value == 'compact'
+
+
+def compact_listing(base_url, photos):
+    """Forma compacta de un listado: la URL base una sola vez y cada foto sin su `url`."""
+    return {'baseUrl': base_url,
+            'photos': [{key: value for key, value in photo.items() if key != 'url'}
+                       for photo in photos]}
@@ -0,0 +1,213 @@
+"""
+Hojas de contactos: una página de la galería en una sola imagen.
+
+GET /api/photos/sheet?page=&size=&tile=&cols= devuelve el mapa de la página
+en JSON (posición de cada miniatura en la hoja, su archivo y su URL) y la URL
+de la hoja; con image=1 devuelve la hoja en JPEG. Una pantalla de galería
+cuesta así dos peticiones en vez de una por foto.
+
+Las páginas se cuentan desde la foto más antigua (page=1 son las primeras
+`size` subidas) y sin page se devuelve la última, la más reciente: al subir
+fotos solo cambia la última página y las completas quedan estables. Cada
+página tiene una versión (hash de sus nombres y generaciones) que va en la URL
+de la hoja; con la versión vigente la hoja se sirve como inmutable y al
+cambiar la página cambia la URL. Las hojas y las miniaturas de cada foto se
+guardan en el mismo caché que las versiones redimensionadas (resize.py), así
+que rehacer una página que cambió solo decodifica las fotos nuevas.
+"""
+
+import io
+import math
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+from .instrumentation import stage
+from .resize import _FLIGHTS
+from .scan import scan_objects
+from .storage import ObjectNotFound
+from .variants import VariantCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow es opcional en los servidores locales
+    Image = None
+
+DEFAULT_SIZE = 60
+MAX_SIZE = 200
+DEFAULT_TILE = 160
+MIN_TILE = 32
+MAX_TILE = 400
+DEFAULT_COLS = 6
+MAX_COLS = 20
+# Lado máximo de la hoja en píxeles
+MAX_SHEET_EDGE = 8192
+SHEET_QUALITY = 80
+TILE_QUALITY = 85
+# Fotos que se decodifican a la vez al armar una hoja
+TILE_WORKERS = 8
+# Color de la miniatura de una foto que no se puede leer
+BROKEN_TILE = (200, 200, 200)
+
+SheetSpec = namedtuple('SheetSpec', 'page size tile cols')
+# `photos`: ObjectInfo de la página, de la más reciente a la más antigua
+SheetPlan = namedtuple('SheetPlan', 'page pages total version photos cols width height')
+
+
+def available():
+    return Image is not None
+
+
+def parse_sheet_params(params):
+    """
+    SheetSpec a partir de page, size, tile y cols (dict de str o de listas);
+    page es None si no se pide (la última). Lanza ValueError con un mensaje
+    para el cliente si algún parámetro es inválido.
+    """
+    def number(name, default, low, high):
+        raw = params.get(name)
+        if isinstance(raw, list):
+            raw = raw[0] if raw else None
+        if raw in (None, ''):
+            return default
+        try:
+            value = int(raw)
+        except ValueError:
+            raise ValueError(f'Parámetro {name} inválido: {raw}')
+        if not low <= value <= high:
+            raise ValueError(f'El parámetro {name} debe estar entre {low} y {high}')
+        return value
+
+    spec = SheetSpec(
+        page=number('page', None, 1, 10 ** 9),
+        size=number('size', DEFAULT_SIZE, 1, MAX_SIZE),
+        tile=number('tile', DEFAULT_TILE, MIN_TILE, MAX_TILE),
+        cols=number('cols', DEFAULT_COLS, 1, MAX_COLS),
+    )
+    if spec.cols * spec.tile > MAX_SHEET_EDGE or \
+            math.ceil(spec.size / spec.cols) * spec.tile > MAX_SHEET_EDGE:
+        raise ValueError(f'La hoja no puede superar {MAX_SHEET_EDGE} px de lado')
+    return spec
+
+
+def plan_sheet(store, prefix, extensions, spec):
+    """
+    SheetPlan de la página pedida, o None si no hay fotos o la página no existe.
+    """
+    with stage('list'):
+        objects = [obj for obj in scan_objects(store, prefix)
+                   if '/' not in obj.name[len(prefix):]
+                   and Path(obj.name).suffix.lower() in extensions]
+    total = len(objects)
+    pages = math.ceil(total / spec.size)
+    page = pages if spec.page is None else spec.page
+    if not 1 <= page <= pages:
+        return None
+
+    chunk = objects[(page - 1) * spec.size:page * spec.size]
+    photos = chunk[::-1]
+    version = VariantCache.key('sheet', spec.tile, spec.cols, SHEET_QUALITY,
+                               *(f'{obj.name}#{obj.generation}' for obj in photos))
+    cols = min(spec.cols, len(photos))
+    rows = math.ceil(len(photos) / cols)
+    return SheetPlan(page, pages, total, version, photos, cols, cols * spec.tile, rows * spec.tile)
+
+
+def sheet_map(plan, spec, prefix, sheet_url, photo_url):
+    """
+    Mapa JSON de la hoja. `sheet_url` es la URL del endpoint (sin query) y
+    `photo_url(filename)` la URL pública de cada foto.
+    """
+    query = {'page': plan.page, 'size': spec.size, 'tile': spec.tile, 'cols': spec.cols,
+             'image': 1, 'v': plan.version}
+    tiles = []
+    for index, obj in enumerate(plan.photos):
+        filename = obj.name[len(prefix):]
+        row, col = divmod(index, plan.cols)
+        tiles.append({'filename': filename, 'url': photo_url(filename),
+                      'x': col * spec.tile, 'y': row * spec.tile})
+    return {
+        'page': plan.page,
+        'pages': plan.pages,
+        'total': plan.total,
+        'size': spec.size,
+        'tile': spec.tile,
+        'cols': plan.cols,
+        'width': plan.width,
+        'height': plan.height,
+        'version': plan.version,
+        'sheet': f'{sheet_url}?{urlencode(query)}',
+        'tiles': tiles,
+    }
+
+
+def _render_tile(data, tile):
+    """Miniatura cuadrada (recorte centrado) de una foto, en RGB."""
+    img = Image.open(io.BytesIO(data))
+    img.draft('RGB', (tile, tile))
+    img = ImageOps.exif_transpose(img)
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    return ImageOps.fit(img, (tile, tile), Image.LANCZOS)
+
+
+def _load_tile(store, obj, tile, cache):
+    """Miniatura de `obj`, del caché o decodificando el original."""
+    key = VariantCache.key('tile', obj.name, obj.generation, tile)
+    data = cache.get(key)
+    if data:
+        return Image.open(io.BytesIO(data))
+    try:
+        img = _render_tile(store.get(obj.name), tile)
+    except ObjectNotFound:
+        # Borrada mientras se armaba la hoja: la próxima versión ya no la incluye
+        return Image.new('RGB', (tile, tile), BROKEN_TILE)
+    except Exception:
+        # Foto dañada: se recuerda una miniatura gris para no volver a intentarlo
+        img = Image.new('RGB', (tile, tile), BROKEN_TILE)
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=TILE_QUALITY)
+    cache.put(key, output.getvalue())
+    return img
+
+
+def sheet_image(store, plan, spec, cache, flight=_FLIGHTS):
+    """Bytes JPEG de la hoja de `plan`, del caché o armándola."""
+    with stage('cache'):
+        data = cache.get(plan.version)
+    if data is not None:
+        return data
+
+    def produce():
+        cached = cache.get(plan.version)
+        if cached is not None:
+            return cached
+        with stage('resize'):
+            with ThreadPoolExecutor(max_workers=TILE_WORKERS) as pool:
+                tiles = list(pool.map(lambda obj: _load_tile(store, obj, spec.tile, cache),
+                                      plan.photos))
+            sheet = Image.new('RGB', (plan.width, plan.height), (255, 255, 255))
+            for index, img in enumerate(tiles):
+                row, col = divmod(index, plan.cols)
+                sheet.paste(img, (col * spec.tile, row * spec.tile))
+            output = io.BytesIO()
+            sheet.save(output, format='JPEG', quality=SHEET_QUALITY, optimize=True, progressive=True)
+        result = output.getvalue()
+        cache.put(plan.version, result)
+        return result
+
+    return flight.do(plan.version, produce)
+
+
+def sheet_cache_control(plan, requested_version):
+    """Cache-Control de la hoja: inmutable si la URL trae la versión vigente."""
+    if requested_version == plan.version:
+        return 'public, max-age=31536000, immutable'
+    return 'no-cache'
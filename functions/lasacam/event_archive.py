@@ -0,0 +1,281 @@
+"""
+ZIP del evento completo, mantenido a medida que llegan las fotos.
+
+Cada subida agrega su foto (en JPG) como una entrada suelta: un objeto con el
+encabezado local de ZIP seguido de los datos, sin comprimir. Cuando se juntan
+SEGMENT_ENTRIES entradas sin sellar se concatenan en un segmento con
+`compose` (en GCS ocurre del lado de Storage, sin descargar nada) y se
+escribe un índice con la posición de cada foto dentro del segmento.
+
+"Descargar todo" no vuelve a armar el ZIP: envía los segmentos y las
+entradas sueltas tal como están y agrega al final un directorio central
+calculado solo a partir de los índices y los tamaños. Las fotos borradas se
+omiten del directorio central (sus bytes quedan en el segmento, pero ningún
+lector de ZIP las ve) y las que falten en el archivo se agregan en ese momento.
+
+Objetos, en el bucket del evento:
+    event-zip/entries/<foto>.<crc32>  Entrada suelta
+    event-zip/segments/<id>.bin       Entradas concatenadas
+    event-zip/segments/<id>.json      Índice del segmento (se escribe después del .bin)
+
+Las entradas ya selladas se borran recién después de SEALED_GRACE segundos,
+para no cortar una descarga que empezó antes del sellado.
+"""
+
+import re
+import json
+import time
+import zlib
+import hashlib
+import struct
+import threading
+from pathlib import Path
+from collections import namedtuple
+
+from .instrumentation import stage
+from .storage import ObjectNotFound, MAX_COMPOSE_SOURCES
+from .scan import scan_objects
+
+ARCHIVE_PREFIX = 'event-zip/'
+SEGMENT_ENTRIES = MAX_COMPOSE_SOURCES
+SEALED_GRACE = 60 * 60
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+_END_LOCATOR64 = struct.Struct('<IIQI')
+_UTF8_FLAG = 0x0800
+_ZIP32_MAX = 0xFFFFFFFF
+
+# Entrada dentro de un segmento (o suelta, con offset 0)
+Entry = namedtuple('Entry', 'photo arcname crc size offset')
+
+
+def arcname_for(photo):
+    """Nombre de la foto dentro del ZIP (siempre JPG)."""
+    return Path(photo).stem + '.jpg'
+
+
+def _dos_datetime(photo):
+    """Fecha y hora (UTC) del timestamp del nombre, en el formato de ZIP."""
+    match = re.match(r'lasacam-(\d{13})-', photo)
+    if not match:
+        return 0, (1 << 5) | 1  # 1980-01-01
+    t = time.gmtime(int(match.group(1)) / 1000)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def local_header(photo, arcname, crc, size):
+    name = arcname.encode('utf-8')
+    dos_time, dos_date = _dos_datetime(photo)
+    return _LOCAL_HEADER.pack(0x04034b50, 20, _UTF8_FLAG, 0, dos_time, dos_date,
+                              crc, size, size, len(name), 0) + name
+
+
+def _header_size(arcname):
+    return _LOCAL_HEADER.size + len(arcname.encode('utf-8'))
+
+
+def central_directory(entries, start):
+    """
+    Directorio central y registros de fin para `entries` [(Entry, offset absoluto)],
+    que empieza en el byte `start` del archivo. Usa ZIP64 si hace falta.
+    """
+    records = []
+    for entry, offset in entries:
+        name = entry.arcname.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(entry.photo)
+        extra = b''
+        version = 20
+        if offset >= _ZIP32_MAX:
+            extra = struct.pack('<HHQ', 0x0001, 8, offset)
+            offset, version = _ZIP32_MAX, 45
+        records.append(_CENTRAL_HEADER.pack(
+            0x02014b50, version, version, _UTF8_FLAG, 0, dos_time, dos_date,
+            entry.crc, entry.size, entry.size, len(name), len(extra), 0, 0, 0, 0, offset
+        ) + name + extra)
+
+    directory = b''.join(records)
+    count, size = len(records), len(directory)
+    if start + size >= _ZIP32_MAX or count >= 0xFFFF:
+        end64_offset = start + size
+        directory += _END_RECORD64.pack(0x06064b50, 44, 45, 45, 0, 0, count, count, size, start)
+        directory += _END_LOCATOR64.pack(0x07064b50, 0, end64_offset, 1)
+        count, size_field, start_field = 0xFFFF, _ZIP32_MAX, _ZIP32_MAX
+    else:
+        size_field, start_field = size, start
+    return directory + _END_RECORD.pack(0x06054b50, 0, 0, count, count, size_field, start_field, 0)
+
+
+# Los índices de segmento no cambian una vez escritos: se leen una vez por instancia
+_INDEX_CACHE = {}
+_INDEX_LOCK = threading.Lock()
+
+
+class EventArchive:
+    """ZIP incremental de todas las fotos de un bucket."""
+
+    def __init__(self, store, convert, uploads_prefix='uploads/', extensions=None,
+                 prefix=ARCHIVE_PREFIX):
+        self.store = store
+        self.convert = convert
+        self.uploads_prefix = uploads_prefix
+        self.extensions = extensions
+        self.prefix = prefix
+
+    # --- entradas ---
+
+    def append(self, photo, data, seal=True):
+        """Agrega `photo` (bytes ya guardados en uploads/) como entrada suelta."""
+        if Path(photo).suffix.lower() not in JPEG_EXTENSIONS:
+            with stage('convert'):
+                data = self.convert(data)
+        arcname = arcname_for(photo)
+        crc = zlib.crc32(data)
+        header = local_header(photo, arcname, crc, len(data))
+        self.store.put(f'{self.prefix}entries/{photo}.{crc:08x}', header + data,
+                       content_type='application/octet-stream')
+        if seal:
+            self.seal_pending()
+
+    def _loose_entries(self):
+        """(Entry, nombre de objeto, ObjectInfo) de las entradas sueltas."""
+        entries = []
+        for obj in self.store.iter_objects(prefix=f'{self.prefix}entries/'):
+            photo, _, crc = obj.name[len(self.prefix) + len('entries/'):].rpartition('.')
+            arcname = arcname_for(photo)
+            try:
+                entry = Entry(photo, arcname, int(crc, 16), obj.size - _header_size(arcname), 0)
+            except ValueError:
+                continue
+            entries.append((entry, obj.name, obj))
+        return entries
+
+    # --- segmentos ---
+
+    def _segments(self):
+        """[(nombre del .bin, tamaño, índice)] de los segmentos completos, por nombre."""
+        bins, indexes = {}, []
+        for obj in self.store.iter_objects(prefix=f'{self.prefix}segments/'):
+            if obj.name.endswith('.bin'):
+                bins[obj.name[:-4]] = obj.size
+            elif obj.name.endswith('.json'):
+                indexes.append(obj.name)
+
+        bucket = str(self.store)
+        missing = [name for name in indexes if (bucket, name) not in _INDEX_CACHE]
+        if missing:
+            results = self.store.batch(('get', name) for name in missing)
+            with _INDEX_LOCK:
+                for name, data in zip(missing, results):
+                    if isinstance(data, bytes):
+                        _INDEX_CACHE[(bucket, name)] = json.loads(data)
+
+        segments = []
+        for name in sorted(indexes):
+            base = name[:-5]
+            index = _INDEX_CACHE.get((bucket, name))
+            if base in bins and index is not None:
+                segments.append((base + '.bin', bins[base], index))
+        return segments
+
+    def seal_pending(self):
+        """Sella en segmentos las entradas sueltas pendientes y limpia las ya selladas."""
+        segments = self._segments()
+        sealed_at = {}
+        for _, _, index in segments:
+            for entry in index['entries']:
+                sealed_at[entry[0]] = index['sealedAt']
+
+        loose = self._loose_entries()
+        pending = [item for item in loose if item[0].photo not in sealed_at]
+        pending.sort(key=lambda item: item[0].photo)
+        for start in range(0, len(pending) - SEGMENT_ENTRIES + 1, SEGMENT_ENTRIES):
+            self._seal(pending[start:start + SEGMENT_ENTRIES])
+
+        expired = [name for entry, name, _ in loose
+                   if time.time() - sealed_at.get(entry.photo, time.time()) > SEALED_GRACE]
+        if expired:
+            self.store.batch(('delete', name) for name in expired)
+
+    def _seal(self, batch):
+        names = [name for _, name, _ in batch]
+        # El id depende de todas las entradas: dos sellados distintos nunca se pisan
+        digest = hashlib.sha1('\n'.join(names).encode()).hexdigest()[:8]
+        base = f'{self.prefix}segments/{Path(batch[0][0].photo).stem}-{digest}'
+        try:
+            self.store.compose(names, base + '.bin')
+        except ObjectNotFound:
+            # Otra instancia ya selló (y limpió) estas entradas
+            return
+
+        entries, offset = [], 0
+        for entry, _, obj in batch:
+            entries.append([entry.photo, entry.arcname, entry.crc, entry.size, offset])
+            offset += obj.size
+        index = {'sealedAt': time.time(), 'entries': entries}
+        # El índice confirma el segmento: sin él, el .bin se ignora
+        self.store.put(base + '.json', json.dumps(index).encode('utf-8'),
+                       content_type='application/json')
+
+    # --- descarga ---
+
+    def _photos(self):
+        photos = []
+        for obj in scan_objects(self.store, self.uploads_prefix):
+            photo = obj.name[len(self.uploads_prefix):]
+            if photo and '/' not in photo and (
+                    self.extensions is None or Path(photo).suffix.lower() in self.extensions):
+                photos.append(photo)
+        return photos
+
+    def layout(self):
+        """
+        Partes a concatenar [(objeto, tamaño)] y el directorio central final.
+        Agrega primero las fotos que todavía no estén en el archivo.
+        """
+        with stage('list'):
+            photos = set(self._photos())
+            segments = self._segments()
+            loose = self._loose_entries()
+
+        archived = {entry[0] for _, _, index in segments for entry in index['entries']}
+        archived.update(entry.photo for entry, _, _ in loose)
+        missing = sorted(photos - archived)
+        if missing:
+            for photo in missing:
+                try:
+                    with stage('download'):
+                        data = self.store.get(self.uploads_prefix + photo)
+                    self.append(photo, data, seal=False)
+                except ObjectNotFound:
+                    photos.discard(photo)
+            loose = self._loose_entries()
+
+        parts, directory, seen, offset = [], [], set(), 0
+        for name, size, index in segments:
+            for photo, arcname, crc, entry_size, entry_offset in index['entries']:
+                if photo in photos and photo not in seen:
+                    seen.add(photo)
+                    directory.append((Entry(photo, arcname, crc, entry_size, entry_offset),
+                                      offset + entry_offset))
+            parts.append((name, size))
+            offset += size
+        for entry, name, obj in loose:
+            if entry.photo in photos and entry.photo not in seen:
+                seen.add(entry.photo)
+                directory.append((entry, offset))
+                parts.append((name, obj.size))
+                offset += obj.size
+
+        return parts, central_directory(directory, offset)
+
+    def stream(self, parts, directory):
+        """Bloques del ZIP: las partes tal como están y luego el directorio central."""
+        for name, _ in parts:
+            yield from self.store.stream(name)
+        yield directory
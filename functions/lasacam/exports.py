@@ -0,0 +1,196 @@
+"""
+Exportaciones asíncronas: un ZIP de muchas fotos armado fuera de la petición.
+
+El cliente envía la lista de fotos (o pide el evento completo, o un horario
+con from/to) y recibe un
+id de trabajo; consulta el progreso con ese id y, al terminar, recibe la URL
+del ZIP guardado en el mismo bucket. Si el cliente se desconecta o la
+petición vence, el trabajo sigue: el estado vive en el bucket.
+
+El id del trabajo es un hash de los nombres elegidos y sus generaciones, y el
+ZIP se guarda con ese mismo nombre. Volver a pedir las mismas fotos sin
+cambios devuelve el ZIP existente al instante, y dos pedidos iguales en
+paralelo comparten el trabajo.
+
+Objetos:
+    exports/jobs/<id>.json     Estado del trabajo
+    exports/archives/<id>.zip  ZIP terminado
+"""
+
+import json
+import time
+import hashlib
+import zipfile
+from pathlib import Path
+
+from .instrumentation import stage
+from .storage import ObjectNotFound
+from .scan import scan_objects
+
+JOBS_PREFIX = 'exports/jobs/'
+ARCHIVES_PREFIX = 'exports/archives/'
+# Un trabajo sin avances durante este tiempo se considera perdido y se reencola
+STALE_AFTER = 15 * 60
+# Cada cuánto se guarda el progreso (segundos)
+PROGRESS_INTERVAL = 2.0
+
+# Campos del estado que se devuelven al cliente
+PUBLIC_FIELDS = ('id', 'status', 'total', 'processed', 'missing', 'url', 'error',
+                 'createdAt', 'updatedAt')
+
+
+def export_key(infos):
+    """Hash de los nombres y generaciones de las fotos (independiente del orden)."""
+    digest = hashlib.sha256()
+    for info in sorted(infos, key=lambda i: i.name):
+        digest.update(f'{info.name}\0{info.generation}\n'.encode())
+    return digest.hexdigest()[:40]
+
+
+def public_status(job):
+    return {field: job.get(field) for field in PUBLIC_FIELDS}
+
+
+class ExportJobs:
+    """Trabajos de exportación guardados en un backend de almacenamiento."""
+
+    def __init__(self, store, prefix='uploads/'):
+        self.store = store
+        self.prefix = prefix
+
+    def _job_name(self, job_id):
+        return f'{JOBS_PREFIX}{job_id}.json'
+
+    def _archive_name(self, job_id):
+        return f'{ARCHIVES_PREFIX}{job_id}.zip'
+
+    def get(self, job_id):
+        """Estado del trabajo `job_id`, o None si no existe."""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            return json.loads(self.store.get(self._job_name(job_id)))
+        except ObjectNotFound:
+            return None
+
+    def _save(self, job):
+        job['updatedAt'] = time.time()
+        self.store.put(self._job_name(job['id']), json.dumps(job).encode('utf-8'),
+                       content_type='application/json')
+
+    def resolve(self, image_names=None):
+        """
+        ObjectInfo de las fotos a exportar y cuántas de las pedidas no existen.
+        Sin `image_names` se exporta todo el evento.
+        """
+        if image_names is None:
+            with stage('list'):
+                infos = [obj for obj in scan_objects(self.store, self.prefix)
+                         if '/' not in obj.name[len(self.prefix):] and obj.name != self.prefix]
+            return infos, 0
+
+        names = list(dict.fromkeys(image_names))
+        with stage('stat'):
+            results = self.store.batch(('stat', self.prefix + name) for name in names)
+        infos = [info for info in results if info is not None and not isinstance(info, Exception)]
+        return infos, len(names) - len(infos)
+
+    def submit(self, image_names=None):
+        """
+        Crea (o reutiliza) el trabajo para `image_names`.
+        Devuelve (estado, encolar): `encolar` es True si hay que lanzar run().
+        """
+        infos, missing = self.resolve(image_names)
+        job_id = export_key(infos)
+
+        job = self.get(job_id)
+        if job is not None:
+            if job['status'] == 'done' and self.store.exists(self._archive_name(job_id)):
+                return job, False
+            stale = time.time() - job.get('updatedAt', 0) > STALE_AFTER
+            if job['status'] in ('pending', 'running') and not stale:
+                return job, False
+
+        now = time.time()
+        job = {
+            'id': job_id,
+            'status': 'pending',
+            'total': len(infos),
+            'processed': 0,
+            'missing': missing,
+            'unresolved': missing,
+            'url': None,
+            'error': None,
+            'createdAt': now,
+            'names': sorted(info.name[len(self.prefix):] for info in infos),
+        }
+
+        if not infos:
+            return job, False
+
+        # El ZIP pudo quedar de un trabajo anterior cuyo estado se perdió
+        archive = self._archive_name(job_id)
+        if self.store.exists(archive):
+            job.update(status='done', processed=len(infos), url=self.store.public_url(archive))
+            self._save(job)
+            return job, False
+
+        self._save(job)
+        return job, True
+
+    def fail(self, job, error):
+        """Marca `job` como fallido: el próximo pedido igual crea un trabajo nuevo."""
+        job.update(status='error', error=error)
+        self._save(job)
+        return job
+
+    def run(self, job_id, convert=None, arcname=None):
+        """
+        Arma el ZIP del trabajo y lo guarda en el bucket.
+        `convert(bytes)` transforma cada foto (p. ej. a JPG) y `arcname(nombre)`
+        da su nombre dentro del ZIP. Es idempotente: un trabajo terminado no se rehace.
+        """
+        job = self.get(job_id)
+        if job is None or job['status'] == 'done':
+            return job
+
+        job.update(status='running', processed=0, missing=job.get('unresolved', 0), error=None)
+        self._save(job)
+        last_save = time.monotonic()
+
+        archive_name = self._archive_name(job_id)
+        try:
+            # El ZIP va directo al bucket a medida que se arma: en memoria solo
+            # queda la foto en curso y el bloque pendiente de subir
+            with self.store.writer(archive_name, content_type='application/zip', public=True) as out, \
+                    zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name in job['names']:
+                    try:
+                        with stage('download'):
+                            data = self.store.get(self.prefix + name)
+                        if convert is not None:
+                            with stage('convert'):
+                                data = convert(data)
+                        with stage('zip'):
+                            archive.writestr(arcname(name) if arcname else name, data)
+                    except ObjectNotFound:
+                        job['missing'] += 1
+                    except Exception as e:
+                        print(f'Error procesando {name}: {str(e)}')
+                        job['missing'] += 1
+
+                    job['processed'] += 1
+                    if time.monotonic() - last_save >= PROGRESS_INTERVAL:
+                        self._save(job)
+                        last_save = time.monotonic()
+
+            job.update(status='done', url=self.store.public_url(archive_name))
+        except Exception as e:
+            job.update(status='error', error=f'Error al armar el ZIP: {str(e)}')
+        self._save(job)
+        return job
+
+
+def jpg_arcname(name):
+    """Nombre dentro del ZIP de una foto convertida a JPG."""
+    return Path(name).stem + '.jpg'
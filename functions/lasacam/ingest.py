@@ -0,0 +1,126 @@
+"""
+Normalización de fotos al momento de la subida (opcional, por evento).
+
+Con la política activa, cada foto se guarda:
+- reducida a un lado largo máximo,
+- con la orientación EXIF aplicada a los píxeles,
+- sin metadatos (EXIF, XMP, comentarios; se conserva el perfil ICC),
+- como JPEG progresivo con la calidad configurada.
+
+Los GIF animados se guardan tal cual. El original se conserva bajo un
+prefijo de archivo solo si está configurado.
+
+Variables de entorno (cada una admite un sufijo por evento que tiene
+prioridad, p. ej. LASACAM_INGEST_PROCIGAR o LASACAM_INGEST_MAX_EDGE_PCA):
+    LASACAM_INGEST               '1' activa la normalización (desactivada)
+    LASACAM_INGEST_MAX_EDGE      Lado largo máximo en píxeles (2560)
+    LASACAM_INGEST_QUALITY       Calidad JPEG (85)
+    LASACAM_INGEST_ARCHIVE       Prefijo donde conservar el original, p. ej.
+                                 'originals/' (vacío = no se conserva)
+
+Requiere Pillow; sin Pillow las fotos se guardan sin cambios.
+"""
+
+import io
+import os
+import sys
+from pathlib import Path
+from collections import namedtuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow es opcional en los servidores locales
+    Image = None
+
+DEFAULT_MAX_EDGE = 2560
+DEFAULT_QUALITY = 85
+
+IngestPolicy = namedtuple('IngestPolicy', 'enabled max_edge quality archive_prefix')
+
+
+def _setting(name, event, default):
+    if event:
+        value = os.environ.get(f'{name}_{event.upper()}')
+        if value is not None:
+            return value
+    return os.environ.get(name, default)
+
+
+def ingest_policy(event=None):
+    """Política de ingesta del evento `event` (None = configuración global)."""
+    return IngestPolicy(
+        enabled=_setting('LASACAM_INGEST', event, '0') == '1',
+        max_edge=int(_setting('LASACAM_INGEST_MAX_EDGE', event, DEFAULT_MAX_EDGE)),
+        quality=int(_setting('LASACAM_INGEST_QUALITY', event, DEFAULT_QUALITY)),
+        archive_prefix=_setting('LASACAM_INGEST_ARCHIVE', event, ''),
+    )
+
+
+def _flatten(img):
+    """RGB sobre fondo blanco, como _convert_to_jpg."""
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def normalize_image(data, policy):
+    """
+    Aplica la política a los bytes de una imagen.
+    Devuelve los bytes JPEG normalizados, o None si la imagen se guarda tal cual.
+    """
+    if not policy.enabled or Image is None:
+        return None
+
+    img = Image.open(io.BytesIO(data))
+    if getattr(img, 'n_frames', 1) > 1:
+        return None
+
+    # El perfil ICC solo sirve si los píxeles siguen en RGB (no CMYK)
+    icc_profile = img.info.get('icc_profile') if img.mode in ('RGB', 'RGBA', 'P') else None
+    # En JPEG, draft decodifica directamente a una escala reducida
+    img.draft('RGB', (policy.max_edge, policy.max_edge))
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > policy.max_edge:
+        img.thumbnail((policy.max_edge, policy.max_edge), Image.LANCZOS)
+    img = _flatten(img)
+
+    output = io.BytesIO()
+    options = {'quality': policy.quality, 'progressive': True, 'optimize': True}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    img.save(output, format='JPEG', **options)
+    return output.getvalue()
+
+
+def normalize_upload(data, filename, policy):
+    """
+    Normaliza una subida según la política.
+
+    Devuelve (datos, nombre, original): el nombre pasa a .jpg si la imagen se
+    re-codificó, y `original` son los bytes recibidos cuando hay que
+    archivarlos (None en otro caso). Si la imagen no se puede procesar se
+    guarda sin cambios.
+    """
+    try:
+        normalized = normalize_image(data, policy)
+    except Exception as e:
+        print(f'Aviso: no se pudo normalizar {filename}: {e}', file=sys.stderr)
+        normalized = None
+
+    if normalized is None:
+        return data, filename, None
+
+    original = data if policy.archive_prefix else None
+    return normalized, str(Path(filename).with_suffix('.jpg')), original
+
+
+def archive_name(policy, unique_filename, original_filename):
+    """Nombre del objeto donde se conserva el original de `unique_filename`."""
+    return (f'{policy.archive_prefix}{Path(unique_filename).stem}'
+            f'{Path(original_filename).suffix.lower()}')
@@ -0,0 +1,326 @@
+"""
+Instrumentación de latencia por etapa para LasaCam.
+
+Cada petición crea un RequestTimer que mide sus etapas (parseo, validación,
+subida a Storage, make_public, conversión, ZIP...). Al terminar:
+- las etapas se exponen en el header Server-Timing,
+- se escribe una línea de log estructurada (JSON) por petición,
+- las latencias y bytes se acumulan en histogramas/contadores que se
+  publican en formato Prometheus en la ruta /metrics.
+
+Variables de entorno:
+    LASACAM_SLOW_REQUEST_MS  Umbral para marcar una petición como lenta (1000)
+    LASACAM_REQUEST_LOG      '0' para loguear solo las peticiones lentas
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+from .profiling import PROFILER, PROFILE_HEADER, arm_from_headers
+
+SLOW_REQUEST_MS = float(os.environ.get('LASACAM_SLOW_REQUEST_MS', 1000))
+REQUEST_LOG = os.environ.get('LASACAM_REQUEST_LOG', '1') != '0'
+
+# Límites de los buckets de los histogramas (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """Registro de histogramas y contadores con etiquetas, seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """Devuelve todas las métricas en formato de texto de Prometheus."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {histogram.count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram.total:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + [(k, v) for k, v in extra.items()]
+    if not items:
+        return ''
+    body = ','.join(f'{k}="{v}"' for k, v in items)
+    return '{' + body + '}'
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe('lasacam_request_duration_seconds', 'Duración total de la petición')
+REGISTRY.describe('lasacam_stage_duration_seconds', 'Duración de cada etapa de la petición')
+REGISTRY.describe('lasacam_bytes_total', 'Bytes recibidos (in) y enviados (out)')
+REGISTRY.describe('lasacam_requests_total', 'Peticiones atendidas por ruta y status')
+REGISTRY.describe('lasacam_slow_requests_total', 'Peticiones por encima del umbral de lentitud')
+
+_current = threading.local()
+
+
+class RequestTimer:
+    """Mide las etapas de una petición y publica el resultado al terminar."""
+
+    def __init__(self, route, method='', registry=REGISTRY):
+        self.route = route
+        self.method = method
+        self.registry = registry
+        self.status = None
+        self.stages = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._start = time.perf_counter()
+        self._started_at = time.time()
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name):
+        """Mide una etapa; se puede repetir (p. ej. una por imagen del ZIP)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def add_bytes(self, direction, amount):
+        if direction == 'in':
+            self.bytes_in += amount
+        else:
+            self.bytes_out += amount
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def stage_totals(self):
+        """Suma la duración de las etapas con el mismo nombre, en orden de aparición."""
+        totals = {}
+        for name, duration in self.stages:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def server_timing(self):
+        """Valor del header Server-Timing (duraciones en milisegundos)."""
+        metrics = [f'{name};dur={duration * 1000:.1f}'
+                   for name, duration in self.stage_totals().items()]
+        metrics.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(metrics)
+
+    @contextmanager
+    def activate(self):
+        """Hace de este timer el actual del hilo (ver stage() y current_timer())."""
+        previous = getattr(_current, 'timer', None)
+        _current.timer = self
+        # Desarmado, el perfilador cuesta la lectura de un atributo
+        profiled = PROFILER.begin(self.route) if PROFILER.armed else None
+        try:
+            yield self
+        finally:
+            if profiled is not None:
+                PROFILER.end(profiled)
+            _current.timer = previous
+
+    def finish(self, status=None):
+        """Registra métricas y escribe la línea de log. Idempotente."""
+        if self._finished:
+            return
+        self._finished = True
+        if status is not None:
+            self.status = status
+
+        total = self.elapsed()
+        status_label = str(self.status or 0)
+        self.registry.observe('lasacam_request_duration_seconds', total,
+                              route=self.route, status=status_label)
+        self.registry.inc('lasacam_requests_total', route=self.route, status=status_label)
+        for name, duration in self.stage_totals().items():
+            self.registry.observe('lasacam_stage_duration_seconds', duration,
+                                  route=self.route, stage=name)
+        if self.bytes_in:
+            self.registry.inc('lasacam_bytes_total', self.bytes_in,
+                              route=self.route, direction='in')
+        if self.bytes_out:
+            self.registry.inc('lasacam_bytes_total', self.bytes_out,
+                              route=self.route, direction='out')
+
+        slow = total * 1000 >= SLOW_REQUEST_MS
+        if slow:
+            self.registry.inc('lasacam_slow_requests_total', route=self.route)
+        if slow or REQUEST_LOG:
+            self._log(total, slow)
+
+    def _log(self, total, slow):
+        # Cloud Logging interpreta las líneas JSON como logs estructurados
+        entry = {
+            'severity': 'WARNING' if slow else 'INFO',
+            'message': f'{self.method} {self.route} {self.status} {total * 1000:.1f}ms',
+            'route': self.route,
+            'method': self.method,
+            'status': self.status,
+            'start_ms': int(self._started_at * 1000),
+            'duration_ms': round(total * 1000, 1),
+            'stages_ms': {name: round(duration * 1000, 1)
+                          for name, duration in self.stage_totals().items()},
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'slow': slow,
+        }
+        print(json.dumps(entry), file=sys.stderr, flush=True)
+
+
+class TimedBody:
+    """
+    Cuerpo WSGI que se genera al enviarse (NDJSON, SSE, archivos por bloques).
+    El timer sigue activo mientras se produce cada bloque, cuenta los bytes
+    que salen y termina en close(), cuando el servidor ya envió todo o el
+    cliente cortó, no al devolverse el cuerpo.
+    """
+
+    def __init__(self, body, timer):
+        self._body = body
+        self._chunks = iter(body)
+        self._timer = timer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        previous = getattr(_current, 'timer', None)
+        _current.timer = self._timer
+        try:
+            chunk = next(self._chunks)
+        finally:
+            _current.timer = previous
+        self._timer.add_bytes('out', len(chunk))
+        return chunk
+
+    def close(self):
+        try:
+            close = getattr(self._body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._timer.finish()
+
+
+def current_timer():
+    """Timer de la petición en curso en este hilo, o None."""
+    return getattr(_current, 'timer', None)
+
+
+@contextmanager
+def stage(name):
+    """Mide una etapa en el timer actual; no hace nada si no hay timer activo."""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def add_bytes(direction, amount):
+    """Suma bytes al timer actual, si lo hay."""
+    timer = current_timer()
+    if timer is not None:
+        timer.add_bytes(direction, amount)
+
+
+def instrument_handler(route):
+    """
+    Decorador para handlers estilo Flask (Firebase Functions).
+
+    Activa un RequestTimer durante el handler, agrega Server-Timing a la
+    respuesta y registra métricas y log al terminar.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(request):
+            timer = RequestTimer(route, request.method)
+            if PROFILE_HEADER in request.headers:
+                arm_from_headers(request.headers)
+            if request.content_length:
+                timer.add_bytes('in', request.content_length)
+            response = None
+            try:
+                with timer.activate():
+                    response = func(request)
+            finally:
+                status = response.status_code if response is not None else 500
+                if response is not None:
+                    length = response.calculate_content_length()
+                    if length:
+                        timer.add_bytes('out', length)
+                    response.headers['Server-Timing'] = timer.server_timing()
+                timer.finish(status)
+            return response
+        return wrapper
+    return decorator
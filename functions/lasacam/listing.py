@@ -0,0 +1,230 @@
+"""
+Listados de fotos que se emiten a medida que se recorre el almacenamiento.
+
+Los nombres de las subidas llevan el timestamp en milisegundos
+(uploads/lasacam-<ms>-<hex>.ext), así que un rango de tiempo es un rango de
+nombres. GCS solo lista en orden ascendente; para entregar primero las fotos
+más nuevas se recorre el bucket en ventanas [start_offset, end_offset) hacia
+atrás, cada una del doble de duración que la anterior. Solo se tiene en
+memoria una ventana a la vez y el cliente recibe las primeras fotos sin
+esperar al resto del listado.
+
+Con ?format=ndjson los listados responden una foto por línea
+(application/x-ndjson). Si el listado falla a mitad de camino, la última
+línea es {"error": ...}.
+
+Con ?from=&to= (timestamp en ms o fecha ISO 8601; sin zona horaria, la de
+LASACAM_TIMEZONE) solo se listan las fotos subidas en ese horario: el rango de
+nombres [lasacam-<from>, lasacam-<to>), así el costo depende de la ventana y
+no del tamaño del evento. Las descargas aceptan los mismos "from"/"to" en el
+cuerpo JSON.
+
+Con ?since=<timestamp en ms o cursor> solo se listan las fotos nuevas (un
+listado por rango desde `lasacam-<since>`) y los nombres borrados desde
+entonces, que se registran como lápidas (tombstones/<ms>-<archivo>). La
+respuesta trae el `cursor` para la próxima consulta. El cursor retrocede
+COMMIT_WINDOW_MS porque el nombre se genera antes de terminar la subida: una
+foto puede aparecer en dos consultas seguidas y el cliente la deduplica por
+nombre. Si `since` es más viejo que las lápidas que se conservan, la
+respuesta trae `reset: true` y el listado completo.
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+from datetime import datetime, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    ZoneInfo = None
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# Prefijo de los nombres generados al subir (lasacam-<ms>-<hex>.ext)
+NAME_STEM = 'lasacam-'
+# Duración de la primera ventana; cada una siguiente dura el doble
+FIRST_WINDOW_MS = 60 * 60 * 1000
+# Líneas por bloque escrito (el primer bloque sale con la primera línea)
+NDJSON_BATCH = 100
+
+TOMBSTONE_PREFIX = 'tombstones/'
+# Tiempo que se conservan las lápidas de fotos borradas
+TOMBSTONE_TTL_MS = 7 * 24 * 60 * 60 * 1000
+# Margen entre el timestamp del nombre y el momento en que la foto queda guardada
+COMMIT_WINDOW_MS = 60 * 1000
+
+
+def wants_ndjson(params):
+    """True si la petición pide el listado en NDJSON (?format=ndjson)."""
+    value = params.get('format')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value == 'ndjson'
+
+
+def parse_since(params):
+    """Timestamp en ms de ?since= (timestamp o cursor), o None. Lanza ValueError si es inválido."""
+    value = params.get('since')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value:
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        raise ValueError(f'Parámetro since inválido: {value}')
+    if since < 0:
+        raise ValueError(f'Parámetro since inválido: {value}')
+    return since
+
+
+def _window_bound(name, value):
+    """Timestamp en ms de un extremo de la ventana (ms o ISO 8601)."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    try:
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Parámetro {name} inválido: {text} (use ms o ISO 8601, p. ej. 2025-03-01T20:00)')
+    if moment.tzinfo is None:
+        zone_name = os.environ.get('LASACAM_TIMEZONE')
+        zone = ZoneInfo(zone_name) if zone_name and ZoneInfo is not None else timezone.utc
+        moment = moment.replace(tzinfo=zone)
+    return int(moment.timestamp() * 1000)
+
+
+def parse_window(params):
+    """
+    (from_ms, to_ms) de from/to (dict de str, de listas o JSON), o None si no
+    viene ninguno. Un extremo que falta queda en None (sin límite).
+    Lanza ValueError si alguno es inválido.
+    """
+    start_ms = _window_bound('from', params.get('from'))
+    end_ms = _window_bound('to', params.get('to'))
+    if start_ms is None and end_ms is None:
+        return None
+    if start_ms is not None and end_ms is not None and start_ms >= end_ms:
+        raise ValueError('El parámetro from debe ser anterior a to')
+    return start_ms, end_ms
+
+
+def name_at(prefix, timestamp_ms):
+    """Nombre de objeto que ordena justo antes de las subidas de `timestamp_ms`."""
+    return f'{prefix}{NAME_STEM}{max(0, int(timestamp_ms)):013d}'
+
+
+def iter_newest_first(store, prefix, first_window_ms=FIRST_WINDOW_MS, now_ms=None):
+    """ObjectInfo bajo `prefix` en orden inverso de nombre, ventana por ventana."""
+    oldest, _ = store.list_page(prefix=prefix, max_results=1)
+    if not oldest:
+        return
+    oldest_name = oldest[0].name
+
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    window = first_window_ms
+    end_ms = now_ms
+    end_offset = None  # la primera ventana incluye lo que ordene después de "ahora"
+    while True:
+        start_ms = end_ms - window
+        start_offset = name_at(prefix, start_ms)
+        last = start_ms <= 0 or oldest_name >= start_offset
+        if last:
+            start_offset = None
+
+        objects = list(store.iter_objects(prefix=prefix, start_offset=start_offset,
+                                          end_offset=end_offset))
+        yield from reversed(objects)
+
+        if last:
+            return
+        end_ms, end_offset = start_ms, start_offset
+        window *= 2
+
+
+def is_photo(obj, prefix, extensions):
+    """True si `obj` es una foto directamente bajo `prefix` con una de `extensions`."""
+    filename = obj.name[len(prefix):]
+    return bool(filename) and '/' not in filename and Path(filename).suffix.lower() in extensions
+
+
+def iter_photos(store, prefix, extensions):
+    """ObjectInfo de las fotos (con su metadata), más recientes primero."""
+    for obj in iter_newest_first(store, prefix):
+        if is_photo(obj, prefix, extensions):
+            yield obj
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def record_deletions(store, filenames, now_ms=None):
+    """Registra lápidas para `filenames` y purga las vencidas."""
+    now_ms = _now_ms() if now_ms is None else now_ms
+    operations = [('put', f'{TOMBSTONE_PREFIX}{now_ms:013d}-{filename}', b'', 'text/plain')
+                  for filename in filenames]
+    expired = store.iter_objects(prefix=TOMBSTONE_PREFIX,
+                                 end_offset=f'{TOMBSTONE_PREFIX}{now_ms - TOMBSTONE_TTL_MS:013d}')
+    operations.extend(('delete', obj.name) for obj in expired)
+    store.batch(operations)
+
+
+def deleted_since(store, since_ms):
+    """Nombres borrados desde `since_ms` (según las lápidas)."""
+    deleted = []
+    for obj in store.iter_objects(prefix=TOMBSTONE_PREFIX,
+                                  start_offset=f'{TOMBSTONE_PREFIX}{since_ms:013d}'):
+        _, _, filename = obj.name[len(TOMBSTONE_PREFIX):].partition('-')
+        if filename:
+            deleted.append(filename)
+    return deleted
+
+
+def delta_listing(store, prefix, extensions, since_ms, now_ms=None):
+    """
+    Cambios desde `since_ms`: (ObjectInfo de las fotos nuevas, más recientes
+    primero; nombres borrados; cursor; reset). Con `reset` las fotos son el
+    listado completo.
+    """
+    now_ms = _now_ms() if now_ms is None else now_ms
+    cursor = str(max(0, now_ms - COMMIT_WINDOW_MS))
+    if since_ms < now_ms - TOMBSTONE_TTL_MS:
+        return list(iter_photos(store, prefix, extensions)), [], cursor, True
+
+    photos = [obj for obj in store.iter_objects(prefix=prefix, start_offset=name_at(prefix, since_ms))
+              if is_photo(obj, prefix, extensions)]
+    photos.reverse()
+    return photos, deleted_since(store, since_ms), cursor, False
+
+
+def ndjson_chunks(items, batch_size=NDJSON_BATCH):
+    """Codifica `items` como NDJSON, en bloques de bytes de hasta `batch_size` líneas."""
+    lines = []
+    first = True
+    try:
+        for item in items:
+            lines.append(json.dumps(item, separators=(',', ':')))
+            # El primer bloque sale enseguida para que el cliente empiece a pintar
+            if first or len(lines) >= batch_size:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+                first = False
+    except Exception as e:
+        lines.append(json.dumps({'error': f'Error al listar fotos: {e}'}))
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def delta_payload(listing, deleted, cursor, reset):
+    """Respuesta de ?since=: un listado (completo o compacto) más borradas, cursor y reset."""
+    payload = dict(listing) if isinstance(listing, dict) else {'photos': listing}
+    payload.update(deleted=deleted, cursor=cursor, reset=reset)
+    return payload
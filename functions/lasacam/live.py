@@ -0,0 +1,427 @@
+"""
+Novedades en vivo con Server-Sent Events (/api/events).
+
+Cada subida guardada publica un evento `upload` con el nombre, las URLs y
+las dimensiones de la foto. El id de cada evento es un timestamp en ms, así
+que un cliente que se reconecta con Last-Event-ID recibe lo que se perdió:
+del búfer en memoria si todavía lo cubre o, si no (p. ej. tras reiniciar el
+servidor), de un listado por rango del almacenamiento. En ese caso una foto
+puede llegar dos veces; el cliente la deduplica por `filename`.
+
+- backend/server.py: la conexión de cada suscriptor se entrega a SSEHub, un
+  único hilo con `selectors` que escribe en todos los sockets sin bloquear.
+  Cientos de suscriptores inactivos no ocupan hilos.
+- application.py (WSGI): cada suscriptor ocupa un worker mientras dura la
+  respuesta; la cantidad se limita con LASACAM_SSE_MAX_WSGI.
+- Firebase Functions: StoragePoller consulta el bucket una vez por segundo por
+  instancia (no por suscriptor) y reparte lo nuevo a las respuestas abiertas,
+  que se cierran tras LIVE_HOLD_SECONDS; EventSource se reconecta solo.
+
+Variables de entorno:
+    LASACAM_SSE_MAX_WSGI   Suscriptores simultáneos en la app WSGI (50)
+"""
+
+import os
+import json
+import time
+import socket
+import selectors
+import threading
+from pathlib import Path
+from collections import deque, namedtuple
+
+from .listing import name_at, COMMIT_WINDOW_MS
+
+EVENT_CONTENT_TYPE = 'text/event-stream'
+EVENT_BUFFER = 1000
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+# Bytes pendientes por suscriptor antes de darlo por perdido
+MAX_CLIENT_BUFFER = 1024 * 1024
+# Functions: tiempo que se mantiene abierta cada respuesta y frecuencia del sondeo
+LIVE_HOLD_SECONDS = 25
+POLL_SECONDS = 1.0
+
+SSE_HEADERS = {
+    'Content-Type': EVENT_CONTENT_TYPE,
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+LiveEvent = namedtuple('LiveEvent', 'id data')
+
+
+def format_event(event):
+    payload = json.dumps(event.data, separators=(',', ':'))
+    return f'id: {event.id}\nevent: upload\ndata: {payload}\n\n'.encode('utf-8')
+
+
+def stream_preamble():
+    """Primer bloque de la respuesta: el tiempo de reconexión para EventSource."""
+    return f'retry: {RETRY_MS}\n\n'.encode('utf-8')
+
+
+HEARTBEAT = b': ping\n\n'
+
+
+def last_event_id(header_value, params=None):
+    """Id desde Last-Event-ID (o ?lastEventId=, para la primera conexión); None si no hay."""
+    value = header_value
+    if not value and params:
+        value = params.get('lastEventId')
+        if isinstance(value, list):
+            value = value[0] if value else None
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def upload_event(filename, url, width=None, height=None, **urls):
+    """Datos del evento de una foto subida."""
+    data = {'filename': filename, 'url': url}
+    data.update(urls)
+    if width and height:
+        data['width'], data['height'] = width, height
+    return data
+
+
+class EventLog:
+    """
+    Últimos eventos en memoria. Los ids son timestamps en ms: el worker que
+    recibe la subida asigna uno creciente y los que reenvían los demás workers
+    conservan el suyo, así el mismo evento tiene el mismo id en todos. Como un
+    id reenviado puede ser menor que el último local, las respuestas abiertas
+    siguen el orden de llegada (`seq`), no los ids.
+    """
+
+    def __init__(self, maxlen=EVENT_BUFFER):
+        self._events = deque(maxlen=maxlen)  # (seq, LiveEvent)
+        self._condition = threading.Condition()
+        self._last_id = 0
+        self._seq = 0
+        self.started = int(time.time() * 1000)
+
+    def publish(self, data, event_id=None):
+        """Agrega un evento; sin `event_id` se le asigna uno mayor que todos los vistos."""
+        with self._condition:
+            if event_id is None:
+                event_id = max(self._last_id + 1, int(time.time() * 1000))
+            self._last_id = max(self._last_id, event_id)
+            self._seq += 1
+            event = LiveEvent(event_id, data)
+            self._events.append((self._seq, event))
+            self._condition.notify_all()
+        return event
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def since(self, last_id):
+        """
+        (eventos posteriores a `last_id` ordenados por id, completo, seq).
+        `completo` es False si el búfer ya no cubre ese id y hay que completar
+        desde el almacenamiento; `seq` es desde dónde seguir con wait().
+        """
+        with self._condition:
+            events = sorted((e for _, e in self._events if e.id > last_id), key=lambda e: e.id)
+            oldest = min(e.id for _, e in self._events) if self._events else None
+            evicted = len(self._events) == self._events.maxlen
+            seq = self._seq
+        # Sin expulsiones, el búfer tiene todo lo publicado desde que arrancó el proceso
+        covered = last_id >= oldest if evicted else last_id >= self.started
+        return events, covered, seq
+
+    def wait(self, seq, timeout):
+        """(eventos llegados después de `seq`, nuevo seq), esperando hasta `timeout` segundos."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > seq, timeout)
+            return [e for s, e in self._events if s > seq], self._seq
+
+
+def _is_photo(filename, extensions):
+    return bool(filename) and '/' not in filename and Path(filename).suffix.lower() in extensions
+
+
+def _timestamp(filename):
+    parts = filename.split('-')
+    if len(parts) >= 3 and parts[0] == 'lasacam' and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+def storage_replay(store, prefix, extensions, since_ms, event_for):
+    """
+    Eventos de las fotos guardadas desde `since_ms`, leídos del almacenamiento
+    (más viejas primero). `event_for(nombre, ObjectInfo)` arma los datos.
+    """
+    events = []
+    start = name_at(prefix, since_ms - COMMIT_WINDOW_MS)
+    for obj in store.iter_objects(prefix=prefix, start_offset=start):
+        filename = obj.name[len(prefix):]
+        if _is_photo(filename, extensions):
+            events.append(LiveEvent(_timestamp(filename) or since_ms, event_for(filename, obj)))
+    return events
+
+
+def iter_events(log, last_id, replay, heartbeat=HEARTBEAT_SECONDS, hold=None):
+    """
+    Cuerpo de una respuesta SSE que espera en `log` (un hilo por respuesta).
+    `replay(last_id)` completa desde el almacenamiento lo que el búfer no cubre.
+    Con `hold` la respuesta termina a los `hold` segundos.
+    """
+    # El cursor se toma antes del primer bloque: lo que se publique mientras
+    # tanto no se pierde; con Last-Event-ID sale junto con lo repuesto
+    cursor = log.seq
+    events = []
+    if last_id is not None:
+        events, covered, cursor = log.since(last_id)
+        if not covered:
+            events = replay(last_id)
+    yield stream_preamble()
+    for event in events:
+        yield format_event(event)
+
+    deadline = time.monotonic() + hold if hold else None
+    while deadline is None or time.monotonic() < deadline:
+        timeout = heartbeat if deadline is None else min(heartbeat, max(0.0, deadline - time.monotonic()))
+        events, cursor = log.wait(cursor, timeout)
+        if events:
+            yield b''.join(format_event(event) for event in events)
+        elif deadline is None or time.monotonic() < deadline:
+            yield HEARTBEAT
+
+
+# --- Servidor local: un hilo para todos los suscriptores ---
+
+class _Subscriber:
+    __slots__ = ('sock', 'buffer', 'mask')
+
+    def __init__(self, sock, initial):
+        self.sock = sock
+        self.buffer = bytearray(initial)
+        self.mask = 0
+
+
+class SSEHub:
+    """Mantiene las conexiones SSE con un selector en un solo hilo."""
+
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        # El selector y el socketpair se crean al arrancar el hilo: así cada
+        # proceso del modo pre-fork tiene los suyos
+        self._selector = None
+        self._wake_r = self._wake_w = None
+        self._thread = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _wake(self):
+        if self._wake_w is None:
+            return
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _start(self):
+        if self._thread is None:
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._thread = threading.Thread(target=self._run, name='sse-hub', daemon=True)
+            self._thread.start()
+
+    def attach(self, sock, initial=b''):
+        """Toma posesión de `sock` (con los headers ya enviados) y le escribe `initial`."""
+        sock.setblocking(False)
+        with self._lock:
+            self._start()
+            subscriber = _Subscriber(sock, initial)
+            self._subscribers[sock.fileno()] = subscriber
+            subscriber.mask = self._mask(subscriber)
+            self._selector.register(sock, subscriber.mask, subscriber)
+        self._wake()
+
+    def broadcast(self, payload):
+        with self._lock:
+            for subscriber in self._subscribers.values():
+                subscriber.buffer += payload
+        self._wake()
+
+    @staticmethod
+    def _mask(subscriber):
+        return selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.buffer else 0)
+
+    def _drop(self, subscriber):
+        self._subscribers.pop(subscriber.sock.fileno(), None)
+        try:
+            self._selector.unregister(subscriber.sock)
+        except (KeyError, ValueError):
+            pass
+        subscriber.sock.close()
+
+    def _flush(self, subscriber):
+        try:
+            sent = subscriber.sock.send(subscriber.buffer)
+            del subscriber.buffer[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(subscriber)
+            return
+        if len(subscriber.buffer) > MAX_CLIENT_BUFFER:
+            self._drop(subscriber)
+
+    def _run(self):
+        last_beat = time.monotonic()
+        while True:
+            ready = self._selector.select(timeout=self.heartbeat)
+            with self._lock:
+                for key, mask in ready:
+                    subscriber = key.data
+                    if subscriber is None:
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    if subscriber.sock.fileno() not in self._subscribers:
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        # Un cliente SSE no envía nada: leer b'' es que se desconectó
+                        try:
+                            if not subscriber.sock.recv(4096):
+                                self._drop(subscriber)
+                                continue
+                        except BlockingIOError:
+                            pass
+                        except OSError:
+                            self._drop(subscriber)
+                            continue
+
+                if time.monotonic() - last_beat >= self.heartbeat:
+                    last_beat = time.monotonic()
+                    for subscriber in self._subscribers.values():
+                        subscriber.buffer += HEARTBEAT
+
+                for subscriber in list(self._subscribers.values()):
+                    if subscriber.buffer:
+                        self._flush(subscriber)
+                    mask = self._mask(subscriber)
+                    if mask != subscriber.mask and subscriber.sock.fileno() in self._subscribers:
+                        subscriber.mask = mask
+                        self._selector.modify(subscriber.sock, mask, subscriber)
+
+
+class LiveFeed:
+    """Búfer de eventos más, en el servidor local, el hub de conexiones."""
+
+    def __init__(self, hub=None):
+        self.log = EventLog()
+        self.hub = hub
+        self._lock = threading.Lock()
+
+    def publish(self, data, event_id=None):
+        with self._lock:
+            event = self.log.publish(data, event_id)
+            if self.hub is not None:
+                self.hub.broadcast(format_event(event))
+        return event
+
+    def subscribe(self, sock, last_id, replay):
+        """Entrega `sock` al hub con los eventos posteriores a `last_id`."""
+        initial = stream_preamble()
+        # Bajo el lock: ningún evento se publica entre la reposición y el attach
+        with self._lock:
+            if last_id is not None:
+                events, covered, _ = self.log.since(last_id)
+                if not covered:
+                    events = replay(last_id)
+                initial += b''.join(format_event(event) for event in events)
+            self.hub.attach(sock, initial)
+
+
+# --- Firebase Functions: un sondeo por instancia ---
+
+class StoragePoller:
+    """
+    Consulta el bucket mientras haya suscriptores y publica las fotos nuevas
+    en un EventLog compartido por todas las respuestas de la instancia.
+    """
+
+    def __init__(self, store, prefix, extensions, event_for, interval=POLL_SECONDS):
+        self.store = store
+        self.prefix = prefix
+        self.extensions = extensions
+        self.event_for = event_for
+        self.interval = interval
+        self.log = EventLog()
+        self._lock = threading.Lock()
+        self._subscribers = 0
+        self._thread = None
+        self._seen = None
+        self._stopped = None
+
+    def subscribe(self):
+        with self._lock:
+            self._subscribers += 1
+            if self._thread is None:
+                # Tras una pausa más larga que la ventana del sondeo pudo perderse
+                # alguna foto: el búfer nuevo obliga a reponer desde el bucket
+                if self._stopped is not None and time.monotonic() - self._stopped > COMMIT_WINDOW_MS / 1000:
+                    self.log = EventLog()
+                    self._seen = None
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def _window(self):
+        start = name_at(self.prefix, int(time.time() * 1000) - COMMIT_WINDOW_MS)
+        return self.store.iter_objects(prefix=self.prefix, start_offset=start)
+
+    def _run(self):
+        if self._seen is None:
+            # Lo anterior al búfer ya no es nuevo; lo posterior se publica en el primer sondeo
+            started = self.log.started
+            self._seen = {obj.name for obj in self._window()
+                          if (_timestamp(obj.name[len(self.prefix):]) or 0) < started}
+        while True:
+            with self._lock:
+                if self._subscribers <= 0:
+                    self._thread = None
+                    self._stopped = time.monotonic()
+                    return
+            time.sleep(self.interval)
+            try:
+                self._poll()
+            except Exception as e:
+                print(f'Aviso: sondeo de novedades falló ({e})')
+
+    def _poll(self):
+        current = set()
+        for obj in self._window():
+            current.add(obj.name)
+            filename = obj.name[len(self.prefix):]
+            if obj.name not in self._seen and _is_photo(filename, self.extensions):
+                self.log.publish(self.event_for(filename, obj), _timestamp(filename))
+        # Solo se recuerdan los nombres de la ventana que se vuelve a listar
+        self._seen = current
+
+
+def sse_wsgi_limit():
+    return int(os.environ.get('LASACAM_SSE_MAX_WSGI', 50))
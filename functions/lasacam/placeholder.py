@@ -0,0 +1,180 @@
+"""
+Placeholders de las fotos para pintar la galería antes de que lleguen.
+
+Al subir cada foto se guardan en su metadata el ancho y alto (ya con la
+orientación EXIF aplicada) y una miniatura de PLACEHOLDER_EDGE px como data
+URI (WebP, o JPEG si Pillow no tiene WebP; ~150 bytes). Los listados los
+devuelven en cada foto (width, height, placeholder): el cliente arma la
+grilla con las proporciones correctas y pinta la miniatura borrosa con un
+<img src> o un background-image, sin pedir nada más.
+
+Las fotos subidas antes no los tienen; este módulo los completa:
+
+    cd functions && python -m lasacam.placeholder /home/usuario/lasacam --dry-run
+    cd functions && python -m lasacam.placeholder gs://<bucket>
+
+Solo actualiza la metadata (la foto y su generación no cambian, así que los
+cachés de variantes siguen valiendo). Sin Pillow solo se guardan el ancho y
+el alto.
+"""
+
+import io
+import sys
+import json
+import base64
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrumentation import stage
+from .storage import open_storage, ObjectNotFound, BATCH_WORKERS
+from .scan import scan_objects
+from .uploads import image_dimensions
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - Pillow es opcional en los servidores locales
+    Image = None
+
+PLACEHOLDER_EDGE = 16
+PLACEHOLDER_QUALITY = 40
+UPLOADS_PREFIX = 'uploads/'
+PHOTO_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
+# Orientaciones EXIF que giran la foto 90°: ancho y alto se intercambian
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _placeholder_format():
+    if Image is not None and features.check('webp'):
+        return 'WEBP', 'image/webp'
+    return 'JPEG', 'image/jpeg'
+
+
+def photo_metadata(data):
+    """
+    Metadata de una foto para los listados: width, height y, con Pillow,
+    placeholder (como str, que es lo que admite la metadata de Storage).
+    None si no se pueden leer las dimensiones.
+    """
+    if Image is None:
+        width, height = image_dimensions(data)
+        if not width or not height:
+            return None
+        return {'width': str(width), 'height': str(height)}
+
+    try:
+        with stage('placeholder'):
+            img = Image.open(io.BytesIO(data))
+            width, height = img.size
+            if img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            img.draft('RGB', (PLACEHOLDER_EDGE, PLACEHOLDER_EDGE))
+            img = ImageOps.exif_transpose(img)
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            if img.mode in ('RGBA', 'LA'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((PLACEHOLDER_EDGE, PLACEHOLDER_EDGE), Image.LANCZOS)
+
+            pil_format, content_type = _placeholder_format()
+            output = io.BytesIO()
+            img.save(output, format=pil_format, quality=PLACEHOLDER_QUALITY)
+    except Exception:
+        # Pillow no la entiende: al menos las dimensiones del encabezado
+        width, height = image_dimensions(data)
+        if not width or not height:
+            return None
+        return {'width': str(width), 'height': str(height)}
+
+    encoded = base64.b64encode(output.getvalue()).decode('ascii')
+    return {'width': str(width), 'height': str(height),
+            'placeholder': f'data:{content_type};base64,{encoded}'}
+
+
+def listing_fields(metadata):
+    """Campos width, height y placeholder de una foto para su entrada en un listado."""
+    fields = {}
+    if not metadata:
+        return fields
+    try:
+        fields['width'] = int(metadata['width'])
+        fields['height'] = int(metadata['height'])
+    except (KeyError, ValueError):
+        fields = {}
+    if metadata.get('placeholder'):
+        fields['placeholder'] = metadata['placeholder']
+    return fields
+
+
+def _missing(obj, prefix, extensions, force):
+    filename = obj.name[len(prefix):]
+    if '/' in filename or Path(filename).suffix.lower() not in extensions:
+        return False
+    metadata = obj.metadata or {}
+    if force or 'width' not in metadata:
+        return True
+    return Image is not None and 'placeholder' not in metadata
+
+
+def _backfill_one(store, obj):
+    """Calcula y guarda la metadata de `obj`: True si se actualizó, o la excepción."""
+    try:
+        metadata = photo_metadata(store.get(obj.name))
+        if metadata is None:
+            raise ValueError('no se pudieron leer las dimensiones')
+        return store.update_metadata(obj.name, metadata)
+    except ObjectNotFound:
+        return False
+    except Exception as e:
+        return e
+
+
+def backfill(store, prefix=UPLOADS_PREFIX, extensions=PHOTO_EXTENSIONS, dry_run=False,
+             force=False, limit=None):
+    """
+    Completa width, height y placeholder de las fotos que no los tienen.
+    Con `force` los recalcula en todas. Devuelve un informe (dict).
+    """
+    pending = [obj for obj in scan_objects(store, prefix)
+               if _missing(obj, prefix, extensions, force)]
+    if limit is not None:
+        pending = pending[:limit]
+
+    report = {'storage': str(store), 'dryRun': dry_run, 'pending': len(pending),
+              'updated': 0, 'errors': [], 'errorCount': 0}
+    if dry_run:
+        report['sample'] = [obj.name for obj in pending[:20]]
+        return report
+
+    # Cada foto es una descarga y un decode: se procesan de a BATCH_WORKERS
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+        for obj, result in zip(pending, pool.map(lambda obj: _backfill_one(store, obj), pending)):
+            if isinstance(result, Exception):
+                report['errorCount'] += 1
+                if len(report['errors']) < 20:
+                    report['errors'].append(f'{obj.name}: {result}')
+            elif result:
+                report['updated'] += 1
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Completa el placeholder, ancho y alto de las fotos')
+    parser.add_argument('storage', help='directorio raíz o gs://<bucket>')
+    parser.add_argument('--dry-run', action='store_true', help='solo contar, sin cambios')
+    parser.add_argument('--force', action='store_true', help='recalcular también las que ya los tienen')
+    parser.add_argument('--limit', type=int, help='procesar como máximo N fotos')
+    args = parser.parse_args(argv)
+
+    store = open_storage(args.storage)
+    report = backfill(store, dry_run=args.dry_run, force=args.force, limit=args.limit)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report['errorCount'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
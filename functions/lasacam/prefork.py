@@ -0,0 +1,215 @@
+"""
+Modo pre-fork para backend/server.py: varios procesos atienden el mismo socket.
+
+El proceso maestro abre el socket de escucha y crea los workers con fork();
+cada uno hereda el descriptor y corre su propio serve_forever, así el trabajo
+con Pillow (normalización, miniaturas, variantes) usa todos los núcleos en
+lugar de uno solo. El maestro no atiende peticiones: reinicia los workers que
+terminan inesperadamente y, con SIGTERM o SIGINT, les pide que dejen de
+aceptar conexiones y terminen la petición en curso. Los que siguen vivos
+después de DRAIN_SECONDS reciben SIGKILL.
+
+Los workers pueden avisarse entre sí con broadcast() (p. ej. los eventos de
+/api/events): el maestro reenvía cada mensaje a los demás.
+
+Cada worker tiene su propia memoria: los límites por cliente en memoria, las
+métricas de /metrics y los suscriptores SSE son por proceso.
+
+Variables de entorno:
+    LASACAM_WORKERS         Cantidad de procesos (1 = sin fork, el modo de siempre)
+    LASACAM_DRAIN_SECONDS   Espera máxima al detener los workers (30)
+
+Requiere os.fork (Linux, macOS).
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import selectors
+import threading
+import traceback
+
+DRAIN_SECONDS = 30
+# Un worker que muere antes de este tiempo se reinicia con una pausa igual
+RESTART_BACKOFF = 1.0
+MAX_MESSAGE = 64 * 1024
+
+# En un worker: el socket hacia el maestro
+_channel = None
+
+
+def workers_from_env():
+    """Cantidad de workers de LASACAM_WORKERS (1 si no está o no hay fork)."""
+    if not hasattr(os, 'fork'):
+        return 1
+    return max(1, int(os.environ.get('LASACAM_WORKERS', 1)))
+
+
+def drain_seconds_from_env():
+    return float(os.environ.get('LASACAM_DRAIN_SECONDS', DRAIN_SECONDS))
+
+
+def broadcast(payload):
+    """Envía `payload` (bytes) a los demás workers. Sin pre-fork no hace nada."""
+    if _channel is None:
+        return
+    try:
+        _channel.send(payload)
+    except OSError as e:
+        print(f'Aviso: no se pudo avisar a los demás workers ({e})', file=sys.stderr)
+
+
+class PreforkServer:
+    """
+    Supervisa `workers` procesos que corren `server.serve_forever()`.
+    `on_start()` corre en cada worker recién creado y `on_message(bytes)` recibe
+    lo que los demás envían con broadcast().
+    """
+
+    def __init__(self, server, workers, on_start=None, on_message=None, drain_seconds=None):
+        self.server = server
+        self.workers = workers
+        self.on_start = on_start
+        self.on_message = on_message
+        self.drain_seconds = drain_seconds_from_env() if drain_seconds is None else drain_seconds
+        self._children = {}  # pid -> (slot, socket del maestro, inicio)
+        self._selector = None
+        self._stopping = False
+
+    # --- maestro ---
+
+    def serve_forever(self):
+        # Los workers compiten por accept(): el que pierde no debe quedar bloqueado
+        self.server.socket.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+        try:
+            while not self._stopping:
+                for key, _ in self._selector.select(timeout=1.0):
+                    self._forward(key.fileobj)
+                self._reap()
+        finally:
+            self._drain()
+            self.server.server_close()
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _spawn(self, slot):
+        master_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        pid = os.fork()
+        if pid == 0:
+            master_end.close()
+            self._worker(worker_end)
+        worker_end.close()
+        master_end.setblocking(False)
+        self._selector.register(master_end, selectors.EVENT_READ)
+        self._children[pid] = (slot, master_end, time.monotonic())
+        print(f'Worker {slot} iniciado (pid {pid})')
+
+    def _forward(self, source):
+        try:
+            payload = source.recv(MAX_MESSAGE)
+        except (BlockingIOError, OSError):
+            return
+        for _, channel, _ in self._children.values():
+            if channel is not source:
+                try:
+                    channel.send(payload)
+                except OSError:
+                    # Worker saturado o muriendo: se pierde el aviso, no el servidor
+                    pass
+
+    def _forget(self, pid):
+        slot, channel, started = self._children.pop(pid)
+        self._selector.unregister(channel)
+        channel.close()
+        return slot, started
+
+    def _reap(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0 or pid not in self._children:
+                return
+            slot, started = self._forget(pid)
+            if self._stopping:
+                continue
+            print(f'Worker {slot} (pid {pid}) terminó con código '
+                  f'{os.waitstatus_to_exitcode(status)}; reiniciando', file=sys.stderr)
+            if time.monotonic() - started < RESTART_BACKOFF:
+                time.sleep(RESTART_BACKOFF)
+            self._spawn(slot)
+
+    def _drain(self):
+        """Pide a los workers que terminen y espera hasta drain_seconds."""
+        print('Deteniendo workers...')
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.drain_seconds
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self._children):
+            print(f'Worker {self._children[pid][0]} no terminó a tiempo; se mata', file=sys.stderr)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._forget(pid)
+
+    # --- worker ---
+
+    def _worker(self, channel):
+        """Cuerpo del proceso hijo; nunca vuelve."""
+        global _channel
+        code = 0
+        try:
+            # Ctrl+C llega a todo el grupo: el que decide cuándo parar es el maestro
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, self._worker_stop)
+            for _, other, _ in self._children.values():
+                other.close()
+            self._children = {}
+            _channel = channel
+            if self.on_message is not None:
+                threading.Thread(target=self._receive, args=(channel,), daemon=True).start()
+            if self.on_start is not None:
+                self.on_start()
+            self.server.serve_forever()
+            # Espera a las peticiones en curso (hilos de un ThreadingHTTPServer)
+            self.server.server_close()
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _worker_stop(self, signum, frame):
+        # shutdown() espera a que termine serve_forever, que corre en este mismo hilo
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _receive(self, channel):
+        while True:
+            try:
+                payload = channel.recv(MAX_MESSAGE)
+            except OSError:
+                return
+            try:
+                self.on_message(payload)
+            except Exception as e:
+                print(f'Aviso: mensaje de otro worker ignorado ({e})', file=sys.stderr)
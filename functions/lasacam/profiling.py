@@ -0,0 +1,326 @@
+"""
+Perfilado a pedido en una instancia en producción.
+
+Un administrador arma el perfilador para las próximas N peticiones o T
+segundos. Mientras está armado, un hilo muestrea cada pocos milisegundos la
+pila de los hilos que atienden esas peticiones (sys._current_frames) y, si se
+pide, tracemalloc compara la memoria antes y después. Al terminar queda un
+informe con las funciones donde más muestras cayeron y los sitios que más
+memoria asignaron, en un archivo JSON, en las pilas en formato "folded" (para
+flamegraph.pl o speedscope) y en una línea de log estructurada.
+
+Desarmado, cada petición solo lee un atributo (ver RequestTimer.activate).
+
+Cómo se arma:
+- backend/server.py y application.py: POST /admin/profile?requests=50&seconds=60
+  con el header X-Admin-Token; GET /admin/profile devuelve el estado y el
+  último informe (?format=folded: las pilas).
+- Firebase Functions: cualquier petición a un endpoint instrumentado con los
+  headers X-Admin-Token y X-LasaCam-Profile: requests=50; seconds=60 arma la
+  instancia que la atiende; el informe sale en Cloud Logging.
+
+Variables de entorno:
+    LASACAM_ADMIN_TOKEN     Token de administración (sin él, el perfilado está deshabilitado)
+    LASACAM_PROFILE_DIR     Carpeta de los informes (<tmp>/lasacam-profiles)
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+ADMIN_TOKEN = os.environ.get('LASACAM_ADMIN_TOKEN', '')
+ADMIN_HEADER = 'X-Admin-Token'
+PROFILE_HEADER = 'X-LasaCam-Profile'
+
+DEFAULT_REQUESTS = 50
+MAX_SECONDS = 600
+DEFAULT_INTERVAL_MS = 10
+MAX_DEPTH = 64
+TOP = 25
+# Cuadros que guarda tracemalloc por asignación
+TRACE_FRAMES = 10
+
+
+def admin_authorized(token):
+    """True si `token` es el token de administración configurado."""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((token or '').encode(), ADMIN_TOKEN.encode())
+
+
+def profile_dir():
+    return Path(os.environ.get('LASACAM_PROFILE_DIR') or
+                Path(tempfile.gettempdir()) / 'lasacam-profiles')
+
+
+class ProfilerBusy(Exception):
+    """Ya hay un perfilado en curso."""
+
+
+def _frame_label(code):
+    return f'{Path(code.co_filename).name}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+class Profiler:
+    """Perfilador por muestreo de las peticiones en curso, armado por un administrador."""
+
+    def __init__(self):
+        # Se lee sin lock en cada petición: es lo único que cuesta desarmado
+        self.armed = False
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._stop = threading.Event()
+        self._sampler = None
+        self._last_folded = ''
+
+    def status(self):
+        with self._lock:
+            if not self.armed:
+                return {'armed': False}
+            return {
+                'armed': True,
+                'remainingRequests': self._remaining,
+                'remainingSeconds': round(self._deadline - time.monotonic(), 1),
+                'requests': self._requests,
+                'samples': self._sample_count,
+            }
+
+    def arm(self, requests=None, seconds=None, memory=True, interval_ms=DEFAULT_INTERVAL_MS):
+        """
+        Perfila las próximas `requests` peticiones o `seconds` segundos, lo que
+        ocurra primero; nunca más de MAX_SECONDS.
+        """
+        if requests is None and seconds is None:
+            requests = DEFAULT_REQUESTS
+        seconds = min(float(seconds), MAX_SECONDS) if seconds is not None else MAX_SECONDS
+        with self._lock:
+            if self.armed or (self._sampler is not None and self._sampler.is_alive()):
+                raise ProfilerBusy('Ya hay un perfilado en curso')
+            self._remaining = requests
+            self._deadline = time.monotonic() + seconds
+            self._interval = max(1, interval_ms) / 1000
+            self._memory = memory
+            self._requests = 0
+            self._in_flight = 0
+            self._routes = Counter()
+            self._stacks = Counter()
+            self._sample_count = 0
+            self._started_at = datetime.now(timezone.utc)
+            self._started = time.monotonic()
+
+            self._own_tracing = False
+            self._before = None
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACE_FRAMES)
+                    self._own_tracing = True
+                self._before = tracemalloc.take_snapshot()
+
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._run, name='lasacam-profiler', daemon=True)
+            self.armed = True
+            self._sampler.start()
+        return self.status()
+
+    def begin(self, route):
+        """Marca el hilo actual para muestrear; devuelve un token para end(), o None."""
+        ident = threading.get_ident()
+        with self._lock:
+            if not self.armed or self._remaining == 0 or ident in self._threads:
+                return None
+            if self._remaining is not None:
+                self._remaining -= 1
+            self._threads[ident] = route
+            self._in_flight += 1
+            self._requests += 1
+            self._routes[route] += 1
+        return ident
+
+    def end(self, ident):
+        with self._lock:
+            self._threads.pop(ident, None)
+            self._in_flight -= 1
+            done = self._remaining == 0 and self._in_flight == 0
+        if done:
+            self._stop.set()
+
+    def _run(self):
+        frames_of = sys._current_frames
+        while not self._stop.wait(self._interval):
+            if time.monotonic() >= self._deadline:
+                break
+            with self._lock:
+                threads = list(self._threads.items())
+            if not threads:
+                continue
+            frames = frames_of()
+            for ident, route in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(route)
+                    self._stacks[tuple(reversed(stack))] += 1
+                    self._sample_count += 1
+            del frames
+
+        with self._lock:
+            self.armed = False
+            self._threads.clear()
+        self._finish()
+
+    def _finish(self):
+        report = {
+            'pid': os.getpid(),
+            'started': self._started_at.isoformat(timespec='seconds'),
+            'durationSeconds': round(time.monotonic() - self._started, 2),
+            'requests': self._requests,
+            'routes': dict(self._routes),
+            'intervalMs': round(self._interval * 1000),
+            'samples': self._sample_count,
+            'topFunctions': self._top_functions(),
+        }
+        if self._memory:
+            report['memory'] = self._memory_report()
+        folded = ''.join(f'{";".join(stack)} {count}\n' for stack, count in self._stacks.items())
+        report['files'] = self._write(report, folded)
+        self.last_report = report
+        self._last_folded = folded
+
+        summary = {key: report[key] for key in ('pid', 'durationSeconds', 'requests', 'samples')}
+        summary['topFunctions'] = report['topFunctions'][:10]
+        if 'memory' in report:
+            summary['topAllocations'] = report['memory']['topAllocations'][:10]
+        print(json.dumps({'severity': 'NOTICE',
+                          'message': f'perfil listo: {self._requests} peticiones, '
+                                     f'{self._sample_count} muestras',
+                          'profile': summary, 'files': report['files']}),
+              file=sys.stderr, flush=True)
+
+    def last_folded(self):
+        return self._last_folded
+
+    def _top_functions(self):
+        own = Counter()
+        total = Counter()
+        for stack, count in self._stacks.items():
+            # La raíz es la ruta, no una función
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        samples = self._sample_count or 1
+        return [{'function': label, 'self': own[label], 'total': count,
+                 'selfPct': round(own[label] * 100 / samples, 1),
+                 'totalPct': round(count * 100 / samples, 1)}
+                for label, count in sorted(total.items(), key=lambda item: (-own[item[0]], -item[1]))[:TOP]]
+
+    def _memory_report(self):
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._own_tracing:
+            tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+        diff = after.filter_traces(ignore).compare_to(self._before.filter_traces(ignore), 'lineno')
+        self._before = None
+        return {
+            'tracedKb': round(current / 1024, 1),
+            'peakKb': round(peak / 1024, 1),
+            'topAllocations': [
+                {'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                 'sizeKb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff}
+                for stat in diff[:TOP]
+            ],
+        }
+
+    def _write(self, report, folded):
+        directory = profile_dir()
+        stem = f'profile-{os.getpid()}-{self._started_at:%Y%m%d-%H%M%S}'
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f'{stem}.json').write_text(json.dumps(report, indent=2))
+            (directory / f'{stem}.folded').write_text(folded)
+        except OSError as e:
+            print(f'No se pudo guardar el perfil en {directory}: {e}', file=sys.stderr, flush=True)
+            return {}
+        return {'json': str(directory / f'{stem}.json'), 'folded': str(directory / f'{stem}.folded')}
+
+
+PROFILER = Profiler()
+
+
+def _options(values):
+    """Opciones de arm() desde un dict de parámetros (valores sueltos o listas de parse_qs)."""
+    def get(name):
+        value = values.get(name)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        return value if value not in (None, '') else None
+
+    try:
+        requests = get('requests')
+        seconds = get('seconds')
+        interval = get('interval_ms')
+        options = {
+            'requests': int(requests) if requests is not None else None,
+            'seconds': float(seconds) if seconds is not None else None,
+            'memory': get('memory') not in ('0', 'false', 'no'),
+            'interval_ms': int(interval) if interval is not None else DEFAULT_INTERVAL_MS,
+        }
+    except ValueError:
+        raise ValueError('requests, seconds e interval_ms deben ser números')
+    if (options['requests'] is not None and options['requests'] < 1) or \
+            (options['seconds'] is not None and options['seconds'] <= 0):
+        raise ValueError('requests y seconds deben ser mayores que 0')
+    return options
+
+
+def profile_admin(method, params, token):
+    """
+    /admin/profile de los servidores locales: (status, cuerpo, content-type).
+    POST arma el perfilador con params; GET devuelve estado y último informe.
+    """
+    if not ADMIN_TOKEN:
+        return 404, {'error': 'Ruta no encontrada'}, 'application/json'
+    if not admin_authorized(token):
+        return 403, {'error': 'Token de administración inválido'}, 'application/json'
+
+    if method == 'POST':
+        try:
+            return 200, PROFILER.arm(**_options(params)), 'application/json'
+        except ValueError as e:
+            return 400, {'error': str(e)}, 'application/json'
+        except ProfilerBusy as e:
+            return 409, {'error': str(e), **PROFILER.status()}, 'application/json'
+    if method == 'GET':
+        fmt = params.get('format')
+        if (fmt[0] if isinstance(fmt, list) else fmt) == 'folded':
+            return 200, PROFILER.last_folded(), 'text/plain; charset=utf-8'
+        return 200, {**PROFILER.status(), 'lastReport': PROFILER.last_report}, 'application/json'
+    return 405, {'error': 'Método no permitido'}, 'application/json'
+
+
+def arm_from_headers(headers):
+    """
+    Arma el perfilador si la petición trae X-LasaCam-Profile (p. ej.
+    "requests=50; seconds=60") con un X-Admin-Token válido (Firebase Functions).
+    """
+    if not admin_authorized(headers.get(ADMIN_HEADER)):
+        return
+    values = dict(part.strip().split('=', 1) for part in headers.get(PROFILE_HEADER, '').split(';')
+                  if '=' in part)
+    try:
+        PROFILER.arm(**_options(values))
+    except (ValueError, ProfilerBusy) as e:
+        print(json.dumps({'severity': 'WARNING', 'message': f'perfilado no armado: {e}'}),
+              file=sys.stderr, flush=True)
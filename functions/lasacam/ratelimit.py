@@ -0,0 +1,183 @@
+"""
+Control de admisión por cliente con token buckets.
+
+Cada cliente (su IP) tiene un balde por tipo de operación que se recarga a `rate` tokens por segundo hasta `burst`.
+Cada petición consume tokens según su costo (un ZIP de N imágenes cuesta N);
+si no alcanzan se responde 429 con Retry-After sin hacer ningún trabajo.
+
+- MemoryRateLimiter: en proceso (backend/server.py, application.py).
+- FirestoreRateLimiter: compartido entre instancias de Firebase Functions.
+  Los documentos llevan `expireAt` para poder limpiarlos con una política TTL.
+
+Variables de entorno ('<tokens por segundo>/<burst>'; '0' desactiva):
+    LASACAM_RATE_LIMIT_UPLOAD    Subidas (2/60)
+    LASACAM_RATE_LIMIT_EXPORT    Imágenes exportadas (20/500)
+    LASACAM_RATE_LIMIT_STORE     'memory' o 'firestore' (Functions: firestore)
+    LASACAM_TRUSTED_PROXIES      Proxies de confianza delante del servidor
+                                 (0; Functions: 1, el front end de Google)
+"""
+
+import os
+import sys
+import math
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_LIMITS = {
+    'upload': '2/60',
+    'export': '20/500',
+}
+FIRESTORE_COLLECTION = 'rate_limits'
+# Cada cuántas llamadas se purgan los baldes llenos del limitador en memoria
+PURGE_EVERY = 1000
+
+
+def parse_limit(value):
+    """(rate, burst) a partir de '<rate>/<burst>', o None si está desactivado."""
+    value = (value or '').strip()
+    if value in ('', '0', 'off'):
+        return None
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst <= 0:
+        return None
+    return rate, burst
+
+
+def limit_from_env(name):
+    return parse_limit(os.environ.get(f'LASACAM_RATE_LIMIT_{name.upper()}', DEFAULT_LIMITS[name]))
+
+
+def trusted_proxies_from_env(default=0):
+    """Cantidad de proxies de confianza delante del servidor (LASACAM_TRUSTED_PROXIES)."""
+    try:
+        return max(0, int(os.environ.get('LASACAM_TRUSTED_PROXIES', default)))
+    except ValueError:
+        return default
+
+
+def client_key(headers, remote_addr='', trusted_proxies=0):
+    """
+    Identificador del cliente: su IP. Sin proxies de confianza es la IP remota
+    y X-Forwarded-For se ignora; con `trusted_proxies` = N es la IP que agregó
+    el más externo (la N-ésima desde el final). Lo que está antes lo escribe el
+    cliente y no sirve para identificarlo: cambiándolo tendría un balde nuevo.
+    """
+    if trusted_proxies:
+        forwarded = headers.get('X-Forwarded-For') or ''
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return f'ip:{hops[-trusted_proxies]}'
+    return f'ip:{remote_addr or "unknown"}'
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def _decide(tokens, cost, rate, burst):
+    """(permitido, tokens restantes, segundos a esperar)."""
+    # Un costo mayor que el burst nunca alcanzaría: se exige el balde lleno
+    cost = min(cost, burst)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class MemoryRateLimiter:
+    """Token buckets en memoria del proceso, seguros entre hilos."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._calls = 0
+
+    def acquire(self, key, cost=1):
+        """Consume `cost` tokens de `key`. Devuelve (permitido, segundos para reintentar)."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = _refill(tokens, updated, now, self.rate, self.burst)
+            allowed, tokens, retry_after = _decide(tokens, cost, self.rate, self.burst)
+            self._buckets[key] = (tokens, now)
+
+            self._calls += 1
+            if self._calls % PURGE_EVERY == 0:
+                self._purge(now)
+        return allowed, retry_after
+
+    def _purge(self, now):
+        full_after = self.burst / self.rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+
+
+class FirestoreRateLimiter:
+    """Token buckets en Firestore (una transacción por petición)."""
+
+    def __init__(self, rate, burst, name, collection=FIRESTORE_COLLECTION):
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self.collection = collection
+        self._client = None
+
+    def _db(self):
+        if self._client is None:
+            from firebase_admin import firestore
+            self._client = firestore.client()
+        return self._client
+
+    def acquire(self, key, cost=1):
+        from google.cloud import firestore as gcf
+
+        rate, burst = self.rate, self.burst
+
+        @gcf.transactional
+        def update(transaction, ref):
+            now = time.time()
+            snapshot = ref.get(transaction=transaction)
+            state = snapshot.to_dict() if snapshot.exists else {}
+            tokens = _refill(state.get('tokens', burst), state.get('updated', now), now, rate, burst)
+            allowed, tokens, retry_after = _decide(tokens, cost, rate, burst)
+            expire_at = datetime.now(timezone.utc) + timedelta(seconds=burst / rate)
+            transaction.set(ref, {'tokens': tokens, 'updated': now, 'expireAt': expire_at})
+            return allowed, retry_after
+
+        try:
+            db = self._db()
+            ref = db.collection(self.collection).document(f'{self.name}:{key}'.replace('/', '_'))
+            return update(db.transaction(), ref)
+        except Exception as e:
+            # Si Firestore falla, se deja pasar: mejor sin límite que sin servicio
+            print(f'Aviso: rate limit no disponible ({e})', file=sys.stderr)
+            return True, 0.0
+
+
+def limiter_from_env(name, default_store='memory'):
+    """Limitador para el tipo de operación `name` ('upload' o 'export'), o None si está desactivado."""
+    limit = limit_from_env(name)
+    if limit is None:
+        return None
+    rate, burst = limit
+    store = os.environ.get('LASACAM_RATE_LIMIT_STORE', default_store)
+    if store == 'firestore':
+        return FirestoreRateLimiter(rate, burst, name)
+    return MemoryRateLimiter(rate, burst)
+
+
+def check(limiter, key, cost=1):
+    """
+    None si la petición puede seguir; si no, (mensaje, segundos de Retry-After).
+    """
+    if limiter is None:
+        return None
+    allowed, retry_after = limiter.acquire(key, cost)
+    if allowed:
+        return None
+    seconds = max(1, math.ceil(retry_after))
+    return f'Demasiadas peticiones. Intenta de nuevo en {seconds} s', seconds
@@ -0,0 +1,211 @@
+"""
+Versiones redimensionadas de las fotos bajo demanda (/img/<archivo>?w=&h=&q=&fmt=).
+
+Cada variante se genera la primera vez que se pide y se guarda en un caché:
+en los servidores locales, un VariantCache en disco con límite de bytes
+(LRU); en Firebase Functions, un prefijo del mismo bucket (StorageCache).
+Las peticiones simultáneas por la misma variante todavía no cacheada se
+agrupan en un único render (SingleFlight).
+
+Variables de entorno (servidores locales):
+    LASACAM_IMG_CACHE      Carpeta del caché (<raíz>/.cache/img)
+    LASACAM_IMG_CACHE_MB   Tamaño máximo del caché en MB (512)
+"""
+
+import io
+import os
+import threading
+from pathlib import Path
+from collections import namedtuple
+
+from .instrumentation import stage
+from .storage import ObjectNotFound
+from .variants import VariantCache, negotiate, supported_formats
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow es opcional en los servidores locales
+    Image = None
+
+MAX_EDGE = 4096
+DEFAULT_QUALITY = 82
+DEFAULT_CACHE_MB = 512
+# Prefijo del caché de variantes dentro del bucket (Functions)
+STORAGE_CACHE_PREFIX = 'cache/img/'
+
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+    'avif': ('AVIF', 'image/avif'),
+    'png': ('PNG', 'image/png'),
+}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+ResizeSpec = namedtuple('ResizeSpec', 'width height quality fmt')
+
+
+def available():
+    return Image is not None
+
+
+def parse_resize_params(params, accept=''):
+    """
+    ResizeSpec a partir de los parámetros w, h, q y fmt (dict de str o de listas).
+    fmt=auto elige WebP/AVIF según `accept`. Lanza ValueError con un mensaje
+    para el cliente si algún parámetro es inválido.
+    """
+    def value(name):
+        raw = params.get(name)
+        if isinstance(raw, list):
+            raw = raw[0] if raw else None
+        return raw or None
+
+    def dimension(name):
+        raw = value(name)
+        if raw is None:
+            return None
+        try:
+            number = int(raw)
+        except ValueError:
+            raise ValueError(f'Parámetro {name} inválido: {raw}')
+        if not 1 <= number <= MAX_EDGE:
+            raise ValueError(f'El parámetro {name} debe estar entre 1 y {MAX_EDGE}')
+        return number
+
+    width, height = dimension('w'), dimension('h')
+    if width is None and height is None:
+        raise ValueError('Se requiere w o h')
+
+    quality = value('q')
+    try:
+        quality = int(quality) if quality is not None else DEFAULT_QUALITY
+    except ValueError:
+        raise ValueError(f'Parámetro q inválido: {quality}')
+    if not 1 <= quality <= 100:
+        raise ValueError('El parámetro q debe estar entre 1 y 100')
+
+    fmt = (value('fmt') or 'jpeg').lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt == 'auto':
+        fmt = negotiate(accept, supported_formats(['avif', 'webp'])) or 'jpeg'
+    if fmt not in OUTPUT_FORMATS or (fmt in ('webp', 'avif') and not supported_formats([fmt])):
+        raise ValueError(f'Formato no soportado: {fmt}')
+
+    return ResizeSpec(width, height, quality, fmt)
+
+
+def render(data, spec):
+    """Redimensiona (sin agrandar) manteniendo la proporción y codifica en spec.fmt."""
+    img = Image.open(io.BytesIO(data))
+    box = (spec.width or MAX_EDGE, spec.height or MAX_EDGE)
+    img.draft('RGB', box)
+    img = ImageOps.exif_transpose(img)
+    if img.width > box[0] or img.height > box[1]:
+        img.thumbnail(box, Image.LANCZOS)
+
+    pil_format = OUTPUT_FORMATS[spec.fmt][0]
+    if pil_format == 'JPEG' and img.mode != 'RGB':
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        else:
+            img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        img = img.convert('RGB')
+
+    output = io.BytesIO()
+    options = {'optimize': True} if pil_format == 'PNG' else {'quality': spec.quality}
+    if pil_format == 'JPEG':
+        options['progressive'] = True
+    img.save(output, format=pil_format, **options)
+    return output.getvalue()
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event()}
+
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = func()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class StorageCache:
+    """Caché de variantes en un prefijo del bucket (misma interfaz que VariantCache)."""
+
+    def __init__(self, store, prefix=STORAGE_CACHE_PREFIX):
+        self.store = store
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.store.get(self.prefix + key)
+        except ObjectNotFound:
+            return None
+
+    def put(self, key, data):
+        self.store.put(self.prefix + key, data, content_type='application/octet-stream')
+
+
+def resize_cache_from_env(default_root):
+    """VariantCache en disco para los servidores locales."""
+    root = os.environ.get('LASACAM_IMG_CACHE') or Path(default_root) / '.cache' / 'img'
+    max_bytes = int(float(os.environ.get('LASACAM_IMG_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024)
+    return VariantCache(root, max_bytes)
+
+
+_FLIGHTS = SingleFlight()
+
+
+def resized_image(store, object_name, info, spec, cache, flight=_FLIGHTS):
+    """
+    Bytes y content-type de `object_name` redimensionado según `spec`.
+    Lanza ObjectNotFound si el original desaparece antes de leerlo.
+    """
+    key = VariantCache.key(object_name, info.generation, *spec)
+    content_type = OUTPUT_FORMATS[spec.fmt][1]
+
+    with stage('cache'):
+        data = cache.get(key)
+    if data is not None:
+        return data, content_type
+
+    def produce():
+        # Otro render pudo terminar mientras se esperaba el turno
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        with stage('download'):
+            original = store.get(object_name)
+        with stage('resize'):
+            result = render(original, spec)
+        cache.put(key, result)
+        return result
+
+    return flight.do(key, produce), content_type
@@ -0,0 +1,321 @@
+"""
+Retención por evento: archivar, pasar a una clase más fría y purgar fotos viejas.
+
+Sin retención nada sale de uploads/ y cada listado, exportación o ZIP recorre
+más objetos evento tras evento. La política de cada evento tiene tres plazos,
+en días desde la subida (el timestamp del nombre lasacam-<ms>-...):
+
+- archive_days: la foto sale de uploads/ hacia el prefijo de archivo y, si
+  hay clase configurada, queda en esa clase de GCS (NEARLINE, COLDLINE,
+  ARCHIVE). Sin prefijo, la foto se queda en la galería y solo cambia de
+  clase. Los originales que conserva la ingesta (LASACAM_INGEST_ARCHIVE)
+  también pasan a la clase configurada.
+- renditions_days: se borran las variantes derivadas, que se regeneran si se
+  vuelven a pedir: el caché de /img del bucket (cache/img/) y, en los
+  servidores locales, los cachés en disco de /img y de WebP/AVIF sin uso en
+  ese plazo.
+- purge_days: se borran la foto (en uploads/ o ya archivada) y su original.
+
+Las fotos que salen de uploads/ se registran como lápidas: los listados
+incrementales (?since=) las informan como borradas y el ZIP del evento las
+omite. Como los nombres ordenan por fecha, solo se listan los objetos
+anteriores al corte. Las operaciones se envían en lotes de BATCH_SIZE con
+store.batch (en paralelo); con dry_run no se modifica nada y el informe dice
+qué se haría.
+
+Variables de entorno (cada una admite un sufijo por evento que tiene
+prioridad, p. ej. LASACAM_RETENTION_PURGE_DAYS_PROCIGAR):
+    LASACAM_RETENTION_ARCHIVE_DAYS     Días hasta archivar (0 = nunca)
+    LASACAM_RETENTION_ARCHIVE          Prefijo de archivo ('archive/'; vacío = no se mueve)
+    LASACAM_RETENTION_STORAGE_CLASS    Clase de GCS de lo archivado (vacío = sin cambio)
+    LASACAM_RETENTION_RENDITIONS_DAYS  Días hasta borrar variantes derivadas (0 = nunca)
+    LASACAM_RETENTION_PURGE_DAYS       Días hasta borrar la foto (0 = nunca)
+    LASACAM_RETENTION_DRY_RUN          '1': solo informar
+
+Uso (cPanel, p. ej. desde un cron diario; también acepta gs://<bucket>):
+    cd functions && python -m lasacam.retention /home/usuario/lasacam --dry-run
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from pathlib import Path
+from collections import namedtuple
+
+from .storage import open_storage
+from .listing import name_at, record_deletions
+from .scan import scan_objects, name_timestamp
+from .ingest import ingest_policy, _setting
+from .resize import STORAGE_CACHE_PREFIX, resize_cache_from_env
+from .variants import VariantCache
+
+UPLOADS_PREFIX = 'uploads/'
+DEFAULT_ARCHIVE_PREFIX = 'archive/'
+DAY_MS = 24 * 60 * 60 * 1000
+BATCH_SIZE = 200
+# Nombres de ejemplo por acción en el informe
+SAMPLE_SIZE = 20
+
+RetentionPolicy = namedtuple('RetentionPolicy',
+                             'archive_days archive_prefix storage_class renditions_days purge_days')
+
+
+def retention_policy(event=None):
+    """Política de retención del evento `event` (None = configuración global)."""
+    archive_prefix = _setting('LASACAM_RETENTION_ARCHIVE', event, DEFAULT_ARCHIVE_PREFIX)
+    if archive_prefix and not archive_prefix.endswith('/'):
+        archive_prefix += '/'
+    if archive_prefix == UPLOADS_PREFIX:
+        raise ValueError('LASACAM_RETENTION_ARCHIVE no puede ser uploads/')
+    return RetentionPolicy(
+        archive_days=float(_setting('LASACAM_RETENTION_ARCHIVE_DAYS', event, 0)),
+        archive_prefix=archive_prefix,
+        storage_class=_setting('LASACAM_RETENTION_STORAGE_CLASS', event, '').upper() or None,
+        renditions_days=float(_setting('LASACAM_RETENTION_RENDITIONS_DAYS', event, 0)),
+        purge_days=float(_setting('LASACAM_RETENTION_PURGE_DAYS', event, 0)),
+    )
+
+
+def enabled(policy):
+    return bool(policy.archive_days or policy.renditions_days or policy.purge_days)
+
+
+def dry_run_from_env():
+    return os.environ.get('LASACAM_RETENTION_DRY_RUN') == '1'
+
+
+def uploaded_at_ms(obj):
+    """Momento de la subida: el timestamp del nombre o, si no lo tiene, la última escritura."""
+    timestamp = name_timestamp(obj.name)
+    if timestamp is not None:
+        return timestamp
+    return int((obj.updated or 0) * 1000)
+
+
+def iter_older(store, prefix, cutoff_ms):
+    """ObjectInfo bajo `prefix` subidos antes de `cutoff_ms`."""
+    # Los nombres generados ordenan por fecha: se lista hasta el corte (en rangos
+    # paralelos) y, aparte, todo lo que ordena desde el corte. Ahí también caen
+    # los nombres sin timestamp (p. ej. lasacam-abc.jpg), que se filtran por
+    # su última escritura
+    older = scan_objects(store, prefix, end_ms=cutoff_ms)
+    rest = store.iter_objects(prefix=prefix, start_offset=name_at(prefix, cutoff_ms))
+    for obj in itertools.chain(older, rest):
+        if uploaded_at_ms(obj) < cutoff_ms:
+            yield obj
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rendition_caches(default_root):
+    """Cachés en disco de /img y de WebP/AVIF de los servidores locales."""
+    variants_root = (os.environ.get('LASACAM_VARIANT_CACHE')
+                     or Path(default_root) / '.cache' / 'variants')
+    return [resize_cache_from_env(default_root), VariantCache(variants_root, 0)]
+
+
+class RetentionReport:
+    """Lo que hizo (o haría, con dry_run) un RetentionJob."""
+
+    ACTIONS = ('purge', 'archive', 'storage_class', 'renditions')
+
+    def __init__(self, store, policy, dry_run):
+        self.store = store
+        self.policy = policy
+        self.dry_run = dry_run
+        self.actions = {action: {'objects': 0, 'bytes': 0, 'sample': []}
+                        for action in self.ACTIONS}
+        self.errors = []
+        self.started = time.monotonic()
+
+    def add(self, action, name, size, count=1):
+        entry = self.actions[action]
+        entry['objects'] += count
+        entry['bytes'] += size or 0
+        if len(entry['sample']) < SAMPLE_SIZE:
+            entry['sample'].append(name)
+
+    def error(self, name, error):
+        self.errors.append(f'{name}: {str(error)}')
+
+    def as_dict(self):
+        return {
+            'storage': str(self.store),
+            'dryRun': self.dry_run,
+            'policy': self.policy._asdict(),
+            'actions': self.actions,
+            'errors': self.errors[:SAMPLE_SIZE],
+            'errorCount': len(self.errors),
+            'elapsedSeconds': round(time.monotonic() - self.started, 2),
+        }
+
+
+class RetentionJob:
+    """
+    Aplica `policy` a un almacenamiento. `ingest_archive` es el prefijo donde la
+    ingesta conserva los originales y `caches`, los VariantCache en disco.
+    """
+
+    def __init__(self, store, policy, ingest_archive='', caches=(), dry_run=False, now_ms=None):
+        self.store = store
+        self.policy = policy
+        self.ingest_archive = ingest_archive
+        self.caches = caches
+        self.dry_run = dry_run
+        self.now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        self.report = RetentionReport(store, policy, dry_run)
+        # Con dry_run lo purgado sigue ahí: no se cuenta también como archivado
+        self._purged = set()
+
+    def run(self):
+        # Primero la purga: lo que se va a borrar no se archiva
+        if self.policy.purge_days:
+            self._purge(self._cutoff(self.policy.purge_days))
+        if self.policy.archive_days:
+            self._archive(self._cutoff(self.policy.archive_days))
+        if self.policy.renditions_days:
+            self._drop_renditions(self._cutoff(self.policy.renditions_days))
+        return self.report
+
+    def _cutoff(self, days):
+        return self.now_ms - int(days * DAY_MS)
+
+    def _apply(self, action, planned):
+        """
+        Ejecuta en paralelo [(ObjectInfo, operación)] y devuelve los ObjectInfo
+        procesados. Con dry_run no ejecuta nada y los da a todos por procesados.
+        """
+        if self.dry_run:
+            done = [obj for obj, _ in planned]
+        else:
+            results = self.store.batch(operation for _, operation in planned)
+            done = []
+            for (obj, _), result in zip(planned, results):
+                if isinstance(result, Exception):
+                    self.report.error(obj.name, result)
+                elif result is not False:
+                    done.append(obj)
+        for obj in done:
+            self.report.add(action, obj.name, obj.size)
+        return done
+
+    def _left_uploads(self, objects):
+        """Lápidas para las fotos que salieron de uploads/."""
+        if self.dry_run or not objects:
+            return
+        try:
+            record_deletions(self.store, [obj.name[len(UPLOADS_PREFIX):] for obj in objects],
+                             now_ms=self.now_ms)
+        except Exception as e:
+            self.report.error('tombstones', e)
+
+    def _purge(self, cutoff_ms):
+        prefixes = [UPLOADS_PREFIX]
+        for prefix in (self.policy.archive_prefix, self.ingest_archive):
+            if prefix and prefix not in prefixes:
+                prefixes.append(prefix)
+        for prefix in prefixes:
+            for chunk in _chunks(iter_older(self.store, prefix, cutoff_ms), BATCH_SIZE):
+                done = self._apply('purge', [(obj, ('delete', obj.name)) for obj in chunk])
+                if prefix == UPLOADS_PREFIX:
+                    self._left_uploads(done)
+                if self.dry_run:
+                    self._purged.update(obj.name for obj in done)
+
+    def _older(self, prefix, cutoff_ms):
+        return (obj for obj in iter_older(self.store, prefix, cutoff_ms)
+                if obj.name not in self._purged)
+
+    def _archive(self, cutoff_ms):
+        archive_prefix, storage_class = self.policy.archive_prefix, self.policy.storage_class
+        for chunk in _chunks(self._older(UPLOADS_PREFIX, cutoff_ms), BATCH_SIZE):
+            if archive_prefix:
+                copied = self._apply('archive', [
+                    (obj, ('copy', obj.name,
+                           archive_prefix + obj.name[len(UPLOADS_PREFIX):], storage_class))
+                    for obj in chunk
+                ])
+                if self.dry_run:
+                    continue
+                # La foto sale de uploads/ solo si la copia quedó guardada
+                results = self.store.batch(('delete', obj.name) for obj in copied)
+                removed = []
+                for obj, result in zip(copied, results):
+                    if isinstance(result, Exception):
+                        self.report.error(obj.name, result)
+                    else:
+                        removed.append(obj)
+                self._left_uploads(removed)
+            elif storage_class:
+                self._set_class(chunk, storage_class)
+
+        if storage_class and self.ingest_archive:
+            for chunk in _chunks(self._older(self.ingest_archive, cutoff_ms), BATCH_SIZE):
+                self._set_class(chunk, storage_class)
+
+    def _set_class(self, objects, storage_class):
+        # En el disco no hay clases (storage_class es None)
+        pending = [obj for obj in objects
+                   if obj.storage_class is not None and obj.storage_class != storage_class]
+        self._apply('storage_class', [(obj, ('set_storage_class', obj.name, storage_class))
+                                      for obj in pending])
+
+    def _drop_renditions(self, cutoff_ms):
+        # Las claves del caché son hashes: la edad es la de la escritura
+        renditions = (obj for obj in self.store.iter_objects(prefix=STORAGE_CACHE_PREFIX)
+                      if (obj.updated or 0) * 1000 < cutoff_ms)
+        for chunk in _chunks(renditions, BATCH_SIZE):
+            self._apply('renditions', [(obj, ('delete', obj.name)) for obj in chunk])
+
+        for cache in self.caches:
+            try:
+                count, size = cache.expire(cutoff_ms / 1000, dry_run=self.dry_run)
+            except OSError as e:
+                self.report.error(str(cache), e)
+                continue
+            if count:
+                self.report.add('renditions', str(cache.root), size, count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('storage', nargs='?', default=os.environ.get('LASACAM_STORAGE'),
+                        help='directorio raíz o gs://<bucket> (LASACAM_STORAGE)')
+    parser.add_argument('--event', default=os.environ.get('LASACAM_EVENT'),
+                        help='evento cuya configuración se usa (LASACAM_EVENT)')
+    parser.add_argument('--dry-run', action='store_true', help='solo informar, sin cambios')
+    args = parser.parse_args(argv)
+    if not args.storage:
+        parser.error('Falta el almacenamiento: un directorio o gs://<bucket>')
+
+    try:
+        policy = retention_policy(args.event)
+    except ValueError as e:
+        parser.error(str(e))
+    if not enabled(policy):
+        print('La retención no está configurada (LASACAM_RETENTION_*_DAYS)', file=sys.stderr)
+        return 0
+
+    caches = [] if args.storage.startswith('gs://') else rendition_caches(args.storage)
+    job = RetentionJob(open_storage(args.storage), policy,
+                       ingest_archive=ingest_policy(args.event).archive_prefix,
+                       caches=caches, dry_run=args.dry_run or dry_run_from_env())
+    report = job.run()
+    print(json.dumps(report.as_dict(), indent=2, ensure_ascii=False))
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
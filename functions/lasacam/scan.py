@@ -0,0 +1,150 @@
+"""
+Listado completo de un prefijo en rangos paralelos.
+
+Storage lista de a una página (1000 objetos) por ida y vuelta y solo en orden
+ascendente: recorrer uploads/ de un evento grande es una cadena de páginas
+secuenciales. Como los nombres llevan el timestamp (lasacam-<ms>-<hex>), el
+espacio de nombres se parte en rangos de tiempo [start_offset, end_offset)
+que se listan a la vez y se concatenan en orden.
+
+Las fotos de un evento se concentran en pocas horas, así que los rangos
+iniciales (partes iguales entre la primera foto y ahora) quedan
+desbalanceados. Cuando un rango devuelve una página llena, lo que le falta
+se reparte en tramos del mismo largo en tiempo que esa página (donde se
+espera otra página parecida) entre los demás workers, y el último tramo se
+queda con el resto. Los rangos de los extremos incluyen los nombres que no
+siguen el formato.
+
+Variables de entorno:
+    LASACAM_SCAN_PARTITIONS   Rangos y listados simultáneos (8; 1 = secuencial)
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .listing import NAME_STEM, name_at, is_photo
+
+SCAN_PARTITIONS = 8
+PAGE_SIZE = 1000
+# Un rango más corto que esto no se divide
+MIN_SPLIT_MS = 1000
+
+
+def partitions_from_env():
+    return max(1, int(os.environ.get('LASACAM_SCAN_PARTITIONS', SCAN_PARTITIONS)))
+
+
+def name_timestamp(name):
+    """Timestamp en ms de un nombre lasacam-<ms>-..., o None si no sigue el formato."""
+    filename = name.rsplit('/', 1)[-1]
+    if not filename.startswith(NAME_STEM):
+        return None
+    timestamp = filename[len(NAME_STEM):].split('-', 1)[0]
+    return int(timestamp) if timestamp.isdigit() else None
+
+
+class _PartitionedScan:
+    def __init__(self, store, prefix, workers):
+        self.store = store
+        self.prefix = prefix
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def submit(self, start_ms, end_ms, start_offset, end_offset):
+        future = self._pool.submit(self._list_range, start_ms, end_ms, start_offset, end_offset)
+        with self._lock:
+            self._futures.append(future)
+
+    def _list_range(self, start_ms, end_ms, start_offset, end_offset):
+        key = start_offset or ''
+        items = []
+        while True:
+            # Se sigue desde el último nombre (inclusivo) y no con el token de
+            # página, que no vale si el rango se achicó
+            page, token = self.store.list_page(self.prefix, start_offset, end_offset,
+                                               max_results=PAGE_SIZE)
+            if items and page and page[0].name == items[-1].name:
+                page = page[1:]
+            items.extend(page)
+            if not token or not page:
+                return key, items
+            start_offset = items[-1].name
+
+            # Rango denso: lo que falta se reparte en tramos de lo que duró esta página
+            first_ms, last_ms = name_timestamp(page[0].name), name_timestamp(start_offset)
+            if first_ms is None or last_ms is None:
+                continue
+            step = max(last_ms - first_ms, MIN_SPLIT_MS)
+            bounds = [last_ms + step * i for i in range(1, self.workers)
+                      if last_ms + step * i < end_ms]
+            if not bounds:
+                continue
+            offsets = [name_at(self.prefix, ms) for ms in bounds]
+            for i, (ms, offset) in enumerate(zip(bounds, offsets)):
+                last = i == len(bounds) - 1
+                self.submit(ms, end_ms if last else bounds[i + 1], offset,
+                            end_offset if last else offsets[i + 1])
+            end_ms, end_offset = bounds[0], offsets[0]
+
+    def run(self, ranges):
+        try:
+            for scan_range in ranges:
+                self.submit(*scan_range)
+            done = 0
+            while True:
+                # Un rango puede agregar otros mientras corre: se espera hasta
+                # que no quede ninguno nuevo
+                with self._lock:
+                    pending = self._futures[done:]
+                if not pending:
+                    break
+                for future in pending:
+                    future.result()
+                done += len(pending)
+        finally:
+            self._pool.shutdown(wait=True)
+        parts = sorted(future.result() for future in self._futures)
+        return [obj for _, items in parts for obj in items]
+
+
+def window_photos(store, prefix, extensions, start_ms=None, end_ms=None):
+    """ObjectInfo de las fotos subidas en [start_ms, end_ms), más recientes primero."""
+    # Con un extremo abierto el rango llega a los nombres sin timestamp
+    return [obj for obj in reversed(scan_objects(store, prefix, start_ms, end_ms))
+            if name_timestamp(obj.name) is not None and is_photo(obj, prefix, extensions)]
+
+
+def window_photo_names(store, prefix, extensions, start_ms=None, end_ms=None):
+    """Nombres (sin `prefix`) de las fotos subidas en [start_ms, end_ms), más recientes primero."""
+    return [obj.name[len(prefix):]
+            for obj in window_photos(store, prefix, extensions, start_ms, end_ms)]
+
+
+def scan_objects(store, prefix, start_ms=None, end_ms=None, partitions=None):
+    """
+    ObjectInfo bajo `prefix` en orden de nombre, listados en rangos paralelos.
+    Con `start_ms`/`end_ms` solo las subidas de [start_ms, end_ms); los
+    nombres que no siguen el formato quedan dentro si ese extremo es abierto.
+    """
+    partitions = partitions_from_env() if partitions is None else partitions
+    start_offset = name_at(prefix, start_ms) if start_ms is not None else None
+    end_offset = name_at(prefix, end_ms) if end_ms is not None else None
+    if partitions <= 1 or not store.parallel_listing:
+        return list(store.iter_objects(prefix, start_offset, end_offset))
+
+    # La primera subida del rango fija el comienzo de las particiones
+    first, _ = store.list_page(prefix, start_offset or name_at(prefix, 0), end_offset,
+                               max_results=1)
+    low_ms = name_timestamp(first[0].name) if first else None
+    high_ms = end_ms if end_ms is not None else int(time.time() * 1000)
+    if low_ms is None or high_ms - low_ms <= MIN_SPLIT_MS:
+        return list(store.iter_objects(prefix, start_offset, end_offset))
+
+    bounds = [low_ms + (high_ms - low_ms) * i // partitions for i in range(partitions + 1)]
+    offsets = ([start_offset] + [name_at(prefix, ms) for ms in bounds[1:-1]] + [end_offset])
+    ranges = [(bounds[i], bounds[i + 1], offsets[i], offsets[i + 1]) for i in range(partitions)]
+    return _PartitionedScan(store, prefix, partitions).run(ranges)
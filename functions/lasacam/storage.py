@@ -0,0 +1,696 @@
+"""
+Backends de almacenamiento de LasaCam.
+
+Interfaz única (put/get/stream/writer/list_page/delete/exists/compose/copy/
+update_metadata/batch) con dos implementaciones:
+- GCSStorage: un bucket de Firebase Storage (firebase_admin).
+- LocalStorage: un directorio del disco. La usan los servidores locales y
+  sirve para correr las Functions sin bucket. Puede simular la latencia de
+  Storage para medir concurrencia sin conexión.
+
+Los nombres de objeto son los mismos en ambos backends ('uploads/<archivo>');
+en LocalStorage se resuelven como rutas relativas a la raíz.
+
+Variables de entorno:
+    LASACAM_LOCAL_STORAGE       Directorio raíz; si existe, las Functions usan
+                                LocalStorage (<dir>/<bucket>) en vez de GCS
+    LASACAM_STORAGE_LATENCY_MS  Latencia simulada por operación en LocalStorage
+    LASACAM_STORAGE_JITTER_MS   Variación aleatoria (0..jitter) sumada a la latencia
+    LASACAM_STORAGE_MS_PER_MB   Latencia extra por MB transferido
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import secrets
+import bisect
+import threading
+from pathlib import Path
+from datetime import timedelta
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrumentation import stage
+
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    '.zip': 'application/zip',
+    '.json': 'application/json',
+}
+
+STREAM_CHUNK_SIZE = 256 * 1024
+# Bloque de las subidas por partes de writer() (múltiplo de 256 KB, como exige GCS)
+WRITE_CHUNK_SIZE = 8 * 1024 * 1024
+BATCH_WORKERS = 8
+# Validez de las URLs firmadas de descarga
+DOWNLOAD_URL_SECONDS = 15 * 60
+# Máximo de objetos que se pueden concatenar en un compose (límite de GCS)
+MAX_COMPOSE_SOURCES = 32
+
+# updated: epoch en segundos; generation: cambia con cada reescritura del objeto;
+# storage_class: clase de GCS (STANDARD, COLDLINE...), None en el disco
+ObjectInfo = namedtuple('ObjectInfo', 'name size updated content_type generation metadata '
+                        'storage_class', defaults=(None,))
+
+
+class ObjectNotFound(KeyError):
+    """El objeto pedido no existe en el backend."""
+
+
+def content_type_for(name):
+    """Content-Type según la extensión del nombre."""
+    return CONTENT_TYPES.get(Path(name).suffix.lower(), 'application/octet-stream')
+
+
+class StorageBackend:
+    """Interfaz común de almacenamiento. Las subclases implementan las operaciones."""
+
+    # Si listar rangos en paralelo ahorra tiempo (cada página es una ida y vuelta)
+    parallel_listing = True
+
+    def put(self, name, data, content_type=None, metadata=None, public=False):
+        """Guarda `data` en `name` y devuelve su ObjectInfo."""
+        raise NotImplementedError
+
+    def get(self, name):
+        """Bytes de `name`; lanza ObjectNotFound si no existe."""
+        raise NotImplementedError
+
+    def stream(self, name, chunk_size=STREAM_CHUNK_SIZE):
+        """Iterador de bloques de `name`; lanza ObjectNotFound si no existe."""
+        raise NotImplementedError
+
+    def writer(self, name, content_type=None, public=False):
+        """
+        Context manager con un archivo para escribir `name` de a partes, sin
+        tenerlo entero en memoria. El objeto aparece al salir del with; si
+        sale por una excepción no se guarda nada.
+        """
+        raise NotImplementedError
+
+    def stat(self, name):
+        """ObjectInfo de `name`, o None si no existe."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        return self.stat(name) is not None
+
+    def delete(self, name):
+        """Borra `name`. Devuelve False si no existía."""
+        raise NotImplementedError
+
+    def compose(self, sources, name):
+        """
+        Concatena `sources` (a lo sumo MAX_COMPOSE_SOURCES) en `name` y devuelve
+        su ObjectInfo. Lanza ObjectNotFound si falta alguno.
+        """
+        raise NotImplementedError
+
+    def copy(self, source, name, storage_class=None):
+        """
+        Copia `source` en `name` (con su content-type y metadata) y devuelve su
+        ObjectInfo. `storage_class` solo se aplica en los backends que tienen
+        clases. Lanza ObjectNotFound si `source` no existe.
+        """
+        info = self.stat(source)
+        if info is None:
+            raise ObjectNotFound(source)
+        return self.put(name, self.get(source), content_type=info.content_type,
+                        metadata=info.metadata)
+
+    def set_storage_class(self, name, storage_class):
+        """Cambia la clase de `name`. Devuelve False si no existe o el backend no tiene clases."""
+        return False
+
+    def update_metadata(self, name, metadata):
+        """
+        Agrega `metadata` a la de `name` sin reescribir los datos (la generación
+        no cambia). Devuelve False si no existe.
+        """
+        raise NotImplementedError
+
+    def list_page(self, prefix='', start_offset=None, end_offset=None,
+                  page_token=None, max_results=1000):
+        """
+        Una página del listado en orden lexicográfico de nombre.
+        start_offset es inclusivo y end_offset exclusivo, como en Storage.
+        Devuelve (lista de ObjectInfo, token de la página siguiente o None).
+        """
+        raise NotImplementedError
+
+    def iter_objects(self, prefix='', start_offset=None, end_offset=None):
+        """Recorre todas las páginas del listado."""
+        page_token = None
+        while True:
+            items, page_token = self.list_page(prefix, start_offset, end_offset, page_token)
+            yield from items
+            if not page_token:
+                return
+
+    def public_url(self, name):
+        raise NotImplementedError
+
+    def download_url(self, name, filename, expires=DOWNLOAD_URL_SECONDS):
+        """
+        URL para descargar `name` como adjunto `filename`. Sin URLs firmadas,
+        la pública (el nombre del adjunto queda a cargo del cliente).
+        """
+        return self.public_url(name)
+
+    def batch(self, operations, max_workers=BATCH_WORKERS):
+        """
+        Ejecuta varias operaciones en paralelo, p. ej. [('delete', nombre), ...].
+        Devuelve los resultados en el mismo orden; las excepciones se devuelven
+        como valor en lugar de lanzarse.
+        """
+        operations = list(operations)
+
+        def run(operation):
+            method, *args = operation
+            try:
+                return getattr(self, method)(*args)
+            except Exception as e:
+                return e
+
+        if len(operations) <= 1:
+            return [run(op) for op in operations]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(operations))) as pool:
+            return list(pool.map(run, operations))
+
+
+class GCSStorage(StorageBackend):
+    """Bucket de Firebase Storage."""
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self._bucket = None
+
+    def __str__(self):
+        return f'gs://{self.bucket_name}'
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from firebase_admin import storage
+            self._bucket = storage.bucket(self.bucket_name)
+        return self._bucket
+
+    @staticmethod
+    def _not_found():
+        from google.api_core.exceptions import NotFound
+        return NotFound
+
+    @staticmethod
+    def _info(blob):
+        updated = blob.updated.timestamp() if blob.updated else None
+        return ObjectInfo(blob.name, blob.size, updated, blob.content_type,
+                          blob.generation, blob.metadata or {}, blob.storage_class)
+
+    def put(self, name, data, content_type=None, metadata=None, public=False):
+        blob = self.bucket.blob(name)
+        if metadata:
+            blob.metadata = metadata
+        with stage('upload'):
+            blob.upload_from_string(data, content_type=content_type or content_type_for(name))
+        if public:
+            with stage('make_public'):
+                blob.make_public()
+        return self._info(blob)
+
+    def get(self, name):
+        try:
+            return self.bucket.blob(name).download_as_bytes()
+        except self._not_found():
+            raise ObjectNotFound(name)
+
+    def stream(self, name, chunk_size=STREAM_CHUNK_SIZE):
+        try:
+            with self.bucket.blob(name).open('rb', chunk_size=chunk_size) as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        except self._not_found():
+            raise ObjectNotFound(name)
+
+    @contextmanager
+    def writer(self, name, content_type=None, public=False):
+        blob = self.bucket.blob(name)
+        # Subida reanudable: hasta close() el objeto no existe, así que si
+        # falla a mitad de camino no se cierra y la sesión se descarta
+        f = blob.open('wb', content_type=content_type or content_type_for(name),
+                      chunk_size=WRITE_CHUNK_SIZE)
+        with stage('upload'):
+            yield f
+            f.close()
+        if public:
+            with stage('make_public'):
+                blob.make_public()
+
+    def stat(self, name):
+        blob = self.bucket.get_blob(name)
+        return self._info(blob) if blob is not None else None
+
+    def exists(self, name):
+        return self.bucket.blob(name).exists()
+
+    def delete(self, name):
+        try:
+            self.bucket.blob(name).delete()
+            return True
+        except self._not_found():
+            return False
+
+    def compose(self, sources, name):
+        if len(sources) > MAX_COMPOSE_SOURCES:
+            raise ValueError(f'compose admite hasta {MAX_COMPOSE_SOURCES} objetos')
+        # La concatenación ocurre en Storage, sin descargar los datos
+        destination = self.bucket.blob(name)
+        destination.content_type = content_type_for(name)
+        try:
+            with stage('compose'):
+                destination.compose([self.bucket.blob(source) for source in sources])
+        except self._not_found():
+            raise ObjectNotFound(name)
+        destination.reload()
+        return self._info(destination)
+
+    def copy(self, source, name, storage_class=None):
+        # rewrite copia del lado de Storage; los objetos grandes requieren varias llamadas
+        destination = self.bucket.blob(name)
+        if storage_class:
+            destination.storage_class = storage_class
+        try:
+            with stage('copy'):
+                token, _, _ = destination.rewrite(self.bucket.blob(source))
+                while token is not None:
+                    token, _, _ = destination.rewrite(self.bucket.blob(source), token=token)
+        except self._not_found():
+            raise ObjectNotFound(source)
+        return self._info(destination)
+
+    def set_storage_class(self, name, storage_class):
+        try:
+            self.bucket.blob(name).update_storage_class(storage_class)
+            return True
+        except self._not_found():
+            return False
+
+    def update_metadata(self, name, metadata):
+        # patch combina las claves con la metadata existente
+        blob = self.bucket.blob(name)
+        blob.metadata = metadata
+        try:
+            blob.patch()
+            return True
+        except self._not_found():
+            return False
+
+    def list_page(self, prefix='', start_offset=None, end_offset=None,
+                  page_token=None, max_results=1000):
+        iterator = self.bucket.list_blobs(prefix=prefix, start_offset=start_offset,
+                                          end_offset=end_offset, page_token=page_token,
+                                          max_results=max_results)
+        page = next(iterator.pages, None)
+        items = [self._info(blob) for blob in page] if page is not None else []
+        return items, iterator.next_page_token
+
+    def iter_objects(self, prefix='', start_offset=None, end_offset=None):
+        # El cliente de GCS ya pagina internamente
+        for blob in self.bucket.list_blobs(prefix=prefix, start_offset=start_offset,
+                                           end_offset=end_offset):
+            yield self._info(blob)
+
+    def public_url(self, name):
+        return self.bucket.blob(name).public_url
+
+    def download_url(self, name, filename, expires=DOWNLOAD_URL_SECONDS):
+        # URL firmada v4 con response-content-disposition: Storage entrega el
+        # archivo como adjunto sin pasar por la función
+        try:
+            credentials = self.bucket.client._credentials
+            signing = {}
+            if not hasattr(credentials, 'signer'):
+                # Credenciales de la instancia, sin clave privada: firma la API
+                # de IAM (signBlob, requiere roles/iam.serviceAccountTokenCreator)
+                from google.auth.transport.requests import Request
+                if not credentials.valid:
+                    credentials.refresh(Request())
+                signing = {'service_account_email': credentials.service_account_email,
+                           'access_token': credentials.token}
+            with stage('sign'):
+                return self.bucket.blob(name).generate_signed_url(
+                    version='v4', expiration=timedelta(seconds=expires),
+                    response_disposition=f'attachment; filename="{filename}"', **signing)
+        except Exception as e:
+            print(f'No se pudo firmar la URL de {name}, se usa la pública: {e}', file=sys.stderr)
+            return self.public_url(name)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Directorio del disco con la misma semántica que un bucket.
+
+    Las escrituras son atómicas (archivo temporal + rename) y los metadatos se
+    guardan aparte en <raíz>/.meta/. El listado usa un índice ordenado por
+    directorio (con la metadata de cada objeto) que se invalida cuando cambia
+    el mtime de algún directorio, también los de .meta/.
+    """
+
+    META_DIR = '.meta'
+
+    def __init__(self, root, base_url='', latency_ms=0, jitter_ms=0, ms_per_mb=0):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip('/')
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_mb = ms_per_mb
+        # Sin latencia simulada el listado es una búsqueda en memoria
+        self.parallel_listing = bool(latency_ms or jitter_ms)
+        self._index = {}
+        self._index_lock = threading.Lock()
+        # nombre -> (mtime_ns del archivo de metadata, metadata), para no releerlos
+        self._meta_cache = {}
+
+    def __str__(self):
+        return str(self.root)
+
+    # --- utilidades internas ---
+
+    def _delay(self, nbytes=0):
+        """Simula el tiempo de ida y vuelta de Storage, si está configurado."""
+        delay_ms = self.latency_ms + nbytes / (1024 * 1024) * self.ms_per_mb
+        if self.jitter_ms:
+            delay_ms += random.uniform(0, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    def _path(self, name):
+        # Sin '..', rutas absolutas ni archivos ocultos (temporales y .meta)
+        parts = name.split('/')
+        if not name or name.startswith('/') or any(p.startswith('.') for p in parts):
+            raise ObjectNotFound(name)
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            raise ObjectNotFound(name)
+        return path
+
+    def _meta_path(self, name):
+        return self.root / self.META_DIR / (name + '.json')
+
+    def _read_metadata(self, name):
+        try:
+            return json.loads(self._meta_path(name).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write_metadata(self, name, metadata):
+        # Con rename cambia el mtime del directorio y los índices de otros procesos se invalidan
+        meta_path = self._meta_path(name)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = meta_path.parent / f'.{meta_path.name}.{secrets.token_hex(4)}.tmp'
+        tmp_path.write_text(json.dumps(metadata))
+        os.replace(tmp_path, meta_path)
+
+    def _info(self, name, st):
+        return ObjectInfo(name, st.st_size, st.st_mtime, content_type_for(name),
+                          st.st_mtime_ns, None)
+
+    def _invalidate(self):
+        with self._index_lock:
+            self._index.clear()
+
+    # --- interfaz ---
+
+    def put(self, name, data, content_type=None, metadata=None, public=False):
+        path = self._path(name)
+        self._delay(len(data))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f'.{path.name}.{secrets.token_hex(4)}.tmp'
+        with stage('upload'):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        meta_path = self._meta_path(name)
+        if metadata:
+            self._write_metadata(name, metadata)
+        elif meta_path.exists():
+            meta_path.unlink()
+        self._invalidate()
+        st = path.stat()
+        return self._info(name, st)._replace(metadata=metadata or {})
+
+    def get(self, name):
+        path = self._path(name)
+        try:
+            data = path.read_bytes()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise ObjectNotFound(name)
+        self._delay(len(data))
+        return data
+
+    def stream(self, name, chunk_size=STREAM_CHUNK_SIZE):
+        path = self._path(name)
+        try:
+            f = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise ObjectNotFound(name)
+        self._delay()
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    @contextmanager
+    def writer(self, name, content_type=None, public=False):
+        path = self._path(name)
+        self._delay()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f'.{path.name}.{secrets.token_hex(4)}.tmp'
+        try:
+            with stage('upload'):
+                with open(tmp_path, 'wb') as f:
+                    yield f
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        try:
+            self._meta_path(name).unlink()
+        except FileNotFoundError:
+            pass
+        self._invalidate()
+
+    def stat(self, name):
+        try:
+            path = self._path(name)
+            st = path.stat()
+        except (ObjectNotFound, FileNotFoundError, NotADirectoryError):
+            return None
+        self._delay()
+        if not path.is_file():
+            return None
+        return self._info(name, st)._replace(metadata=self._read_metadata(name))
+
+    def exists(self, name):
+        try:
+            path = self._path(name)
+        except ObjectNotFound:
+            return False
+        self._delay()
+        return path.is_file()
+
+    def delete(self, name):
+        path = self._path(name)
+        self._delay()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        try:
+            self._meta_path(name).unlink()
+        except FileNotFoundError:
+            pass
+        self._meta_cache.pop(name, None)
+        self._invalidate()
+        return True
+
+    def update_metadata(self, name, metadata):
+        try:
+            path = self._path(name)
+        except ObjectNotFound:
+            return False
+        self._delay()
+        if not path.is_file():
+            return False
+        self._write_metadata(name, {**self._read_metadata(name), **metadata})
+        self._invalidate()
+        return True
+
+    def compose(self, sources, name):
+        if len(sources) > MAX_COMPOSE_SOURCES:
+            raise ValueError(f'compose admite hasta {MAX_COMPOSE_SOURCES} objetos')
+        path = self._path(name)
+        source_paths = [self._path(source) for source in sources]
+        self._delay()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f'.{path.name}.{secrets.token_hex(4)}.tmp'
+        try:
+            with stage('compose'):
+                with open(tmp_path, 'wb') as out:
+                    for source_path in source_paths:
+                        with open(source_path, 'rb') as f:
+                            shutil.copyfileobj(f, out)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            tmp_path.unlink(missing_ok=True)
+            raise ObjectNotFound(name)
+        os.replace(tmp_path, path)
+        self._invalidate()
+        return self._info(name, path.stat())._replace(metadata={})
+
+    @staticmethod
+    def _mtime_ns(directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _walk(self, top, dir_mtimes):
+        """(ruta relativa a `top`, os.DirEntry) de los archivos bajo `top`, sin los ocultos."""
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            # Un directorio que falta también se anota: si aparece, el índice se rehace
+            dir_mtimes.append((directory, self._mtime_ns(directory)))
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(Path(entry.path))
+                        elif entry.is_file():
+                            yield Path(entry.path).relative_to(top).as_posix(), entry
+            except FileNotFoundError:
+                continue
+
+    def _entries(self, prefix):
+        """Entradas ordenadas bajo el directorio de `prefix`, desde el índice si sigue vigente."""
+        base = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        base_dir = self.root / base
+
+        with self._index_lock:
+            cached = self._index.get(base)
+        if cached is not None:
+            dir_mtimes, names, infos = cached
+            if all(self._mtime_ns(d) == m for d, m in dir_mtimes):
+                return names, infos
+
+        dir_mtimes = []
+        meta_root = self.root / self.META_DIR
+        meta_mtimes = {}
+        for relative, entry in self._walk(meta_root / base, dir_mtimes):
+            if relative.endswith('.json'):
+                meta_mtimes[f'{base}/{relative[:-5]}' if base else relative[:-5]] = \
+                    entry.stat().st_mtime_ns
+
+        entries = []
+        for relative, entry in self._walk(base_dir, dir_mtimes):
+            name = f'{base}/{relative}' if base else relative
+            metadata = {}
+            meta_mtime = meta_mtimes.get(name)
+            if meta_mtime is not None:
+                cached_meta = self._meta_cache.get(name)
+                if cached_meta is not None and cached_meta[0] == meta_mtime:
+                    metadata = cached_meta[1]
+                else:
+                    metadata = self._read_metadata(name)
+                    self._meta_cache[name] = (meta_mtime, metadata)
+            entries.append(self._info(name, entry.stat())._replace(metadata=metadata))
+
+        entries.sort(key=lambda info: info.name)
+        names = [info.name for info in entries]
+        with self._index_lock:
+            self._index[base] = (dir_mtimes, names, entries)
+        return names, entries
+
+    def list_page(self, prefix='', start_offset=None, end_offset=None,
+                  page_token=None, max_results=1000):
+        self._delay()
+        names, infos = self._entries(prefix)
+
+        lo = bisect.bisect_left(names, prefix)
+        if start_offset:
+            lo = max(lo, bisect.bisect_left(names, start_offset))
+        if page_token:
+            lo = max(lo, bisect.bisect_right(names, page_token))
+        hi = len(names)
+        if end_offset:
+            hi = bisect.bisect_left(names, end_offset, lo)
+
+        page = []
+        index = lo
+        while index < hi and len(page) < max_results:
+            if not names[index].startswith(prefix):
+                break
+            page.append(infos[index])
+            index += 1
+
+        more = index < hi and names[index].startswith(prefix)
+        return page, (page[-1].name if more and page else None)
+
+    def public_url(self, name):
+        return f'{self.base_url}/{quote(name)}'
+
+
+def _latency_from_env():
+    return {
+        'latency_ms': float(os.environ.get('LASACAM_STORAGE_LATENCY_MS', 0)),
+        'jitter_ms': float(os.environ.get('LASACAM_STORAGE_JITTER_MS', 0)),
+        'ms_per_mb': float(os.environ.get('LASACAM_STORAGE_MS_PER_MB', 0)),
+    }
+
+
+def open_storage(spec, base_url=''):
+    """
+    Abre un backend a partir de una especificación:
+    'gs://<bucket>' para Firebase Storage, o una ruta de directorio.
+    """
+    spec = str(spec)
+    if spec.startswith('gs://'):
+        return GCSStorage(spec[len('gs://'):].rstrip('/'))
+    return LocalStorage(spec, base_url=base_url, **_latency_from_env())
+
+
+_bucket_storages = {}
+
+
+def storage_for_bucket(bucket_name):
+    """
+    Backend de un bucket de las Functions. Con LASACAM_LOCAL_STORAGE definido
+    usa <dir>/<bucket> en el disco, para correr y medir sin bucket real.
+    """
+    storage = _bucket_storages.get(bucket_name)
+    if storage is None:
+        local_root = os.environ.get('LASACAM_LOCAL_STORAGE')
+        if local_root:
+            storage = LocalStorage(Path(local_root) / bucket_name,
+                                   base_url=f'file://{Path(local_root).resolve() / bucket_name}',
+                                   **_latency_from_env())
+        else:
+            storage = GCSStorage(bucket_name)
+        _bucket_storages[bucket_name] = storage
+    return storage
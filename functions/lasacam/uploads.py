@@ -0,0 +1,418 @@
+"""
+Lectura y validación temprana de subidas multipart/form-data.
+
+El cuerpo se lee por bloques y se valida a medida que llega:
+- Content-Length y tope de bytes por petición (también con chunked),
+- nombre de campo y extensión en cuanto llegan los headers de la parte,
+- firma (magic bytes) JPEG/PNG/GIF con los primeros bytes del archivo,
+- dimensiones leídas del encabezado de la imagen.
+
+Ante el primer byte inválido se lanza UploadRejected y se deja de leer; el
+resto del cuerpo nunca se recibe ni se guarda en memoria.
+"""
+
+import struct
+from pathlib import Path
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_IMAGE_SIDE = 12000
+MAX_IMAGE_PIXELS = 60_000_000
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+# Bytes que se esperan como máximo para encontrar las dimensiones de un JPEG
+# (los segmentos EXIF/ICC pueden ir antes del SOF)
+MAX_PROBE_BYTES = 512 * 1024
+# Margen para boundaries, headers de las partes y campos de texto
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """Subida rechazada; `message` es el texto que se devuelve al cliente."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class UploadedFile:
+    """Archivo recibido en una parte multipart."""
+
+    def __init__(self, field, filename, data, kind, width=None, height=None):
+        self.field = field
+        self.filename = filename
+        self.data = data
+        self.kind = kind
+        self.width = width
+        self.height = height
+
+
+def _too_large(max_file_size):
+    return UploadRejected(f'Archivo muy grande. Máximo: {max_file_size / 1024 / 1024}MB')
+
+
+# --- Firma y dimensiones ---
+
+def sniff_image_type(head):
+    """'jpeg', 'png' o 'gif' según los magic bytes; None si no coincide (o faltan bytes)."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    return None
+
+
+SNIFF_BYTES = 8
+
+# Marcadores SOF con dimensiones (se excluyen DHT, JPG y DAC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def probe_dimensions(kind, head):
+    """
+    (ancho, alto) leídos del encabezado de la imagen.
+    Devuelve None si todavía faltan bytes; lanza ValueError si el encabezado es inválido.
+    """
+    if kind == 'png':
+        if len(head) < 24:
+            return None
+        if head[12:16] != b'IHDR':
+            raise ValueError('PNG sin IHDR')
+        return struct.unpack('>II', head[16:24])
+
+    if kind == 'gif':
+        if len(head) < 10:
+            return None
+        return struct.unpack('<HH', head[6:10])
+
+    if kind == 'jpeg':
+        offset = 2
+        while True:
+            # Saltar bytes de relleno 0xFF entre segmentos
+            while offset < len(head) and head[offset] == 0xFF:
+                offset += 1
+            if offset + 3 > len(head):
+                return None
+            marker = head[offset]
+            if head[offset - 1] != 0xFF or marker in (0x00, 0xD8, 0xD9, 0xDA):
+                raise ValueError('JPEG sin SOF antes de los datos')
+            segment_length = struct.unpack('>H', head[offset + 1:offset + 3])[0]
+            if segment_length < 2:
+                raise ValueError('Segmento JPEG inválido')
+            if marker in _JPEG_SOF_MARKERS:
+                if offset + 8 > len(head):
+                    return None
+                height, width = struct.unpack('>HH', head[offset + 4:offset + 8])
+                return width, height
+            offset += 1 + segment_length
+
+    raise ValueError(f'Tipo desconocido: {kind}')
+
+
+def image_dimensions(data):
+    """(ancho, alto) de una imagen completa, o (None, None) si no se pueden leer."""
+    kind = sniff_image_type(data[:SNIFF_BYTES])
+    if kind is None:
+        return None, None
+    try:
+        size = probe_dimensions(kind, data[:MAX_PROBE_BYTES])
+    except ValueError:
+        return None, None
+    return size or (None, None)
+
+
+# --- Lectores de cuerpo ---
+
+class LimitedBodyReader:
+    """Lee como máximo `length` bytes de `stream` (cuerpo con Content-Length)."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=READ_CHUNK_SIZE):
+        if self.remaining <= 0:
+            return b''
+        data = self.stream.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+class ChunkedBodyReader:
+    """Decodifica Transfer-Encoding: chunked sobre el socket de BaseHTTPRequestHandler."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunk_left = 0
+        self.done = False
+
+    def read(self, size=READ_CHUNK_SIZE):
+        if self.done:
+            return b''
+        if self.chunk_left == 0:
+            line = self.stream.readline(1024)
+            try:
+                self.chunk_left = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise UploadRejected('Cuerpo chunked inválido')
+            if self.chunk_left == 0:
+                # Trailers opcionales hasta la línea vacía
+                while self.stream.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                self.done = True
+                return b''
+        data = self.stream.read(min(size, self.chunk_left))
+        if not data:
+            raise UploadRejected('Cuerpo chunked incompleto')
+        self.chunk_left -= len(data)
+        if self.chunk_left == 0:
+            self.stream.readline(1024)
+        return data
+
+
+# --- Parser multipart incremental ---
+
+def _parse_part_headers(raw):
+    headers = {}
+    for line in raw.decode('utf-8', errors='replace').split('\r\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+def _disposition_params(value):
+    """Parámetros de Content-Disposition: name y filename."""
+    params = {}
+    for item in value.split(';')[1:]:
+        if '=' in item:
+            key, val = item.split('=', 1)
+            params[key.strip().lower()] = val.strip().strip('"\'')
+    return params
+
+
+def boundary_from_content_type(content_type):
+    if not content_type.startswith('multipart/form-data'):
+        raise UploadRejected('Content-Type debe ser multipart/form-data')
+    if 'boundary=' not in content_type:
+        raise UploadRejected('Falta boundary en Content-Type')
+    return content_type.split('boundary=')[1].split(';')[0].strip().strip('"')
+
+
+class _FilePartValidator:
+    """Valida una parte de archivo a medida que llegan sus bytes."""
+
+    def __init__(self, field, filename, allowed_extensions, max_file_size):
+        self.field = field
+        self.filename = filename
+        self.max_file_size = max_file_size
+        self.chunks = []
+        self.size = 0
+        self.head = b''
+        self.kind = None
+        self.dimensions = None
+        self.probing = True
+
+        if Path(filename).suffix.lower() not in allowed_extensions:
+            raise UploadRejected(f'Extensión no permitida. Use: {", ".join(allowed_extensions)}')
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.size > self.max_file_size:
+            raise _too_large(self.max_file_size)
+        self.chunks.append(data)
+
+        if self.probing:
+            self.head += data
+            self._probe(final=False)
+
+    def _probe(self, final):
+        if self.kind is None:
+            if len(self.head) < SNIFF_BYTES and not final:
+                return
+            self.kind = sniff_image_type(self.head)
+            if self.kind is None:
+                raise UploadRejected('El archivo no es una imagen JPEG, PNG o GIF válida')
+
+        try:
+            dimensions = probe_dimensions(self.kind, self.head)
+        except ValueError:
+            raise UploadRejected('La imagen está dañada o no es válida')
+
+        if dimensions is None:
+            if len(self.head) >= MAX_PROBE_BYTES:
+                # Encabezado demasiado largo: se acepta sin dimensiones
+                self.probing = False
+                self.head = b''
+            return
+
+        width, height = dimensions
+        if (width == 0 or height == 0 or max(width, height) > MAX_IMAGE_SIDE
+                or width * height > MAX_IMAGE_PIXELS):
+            raise UploadRejected(f'Dimensiones de imagen no permitidas: {width}x{height}')
+        self.dimensions = dimensions
+        self.probing = False
+        self.head = b''
+
+    def finish(self):
+        if self.size == 0:
+            raise UploadRejected('El archivo está vacío')
+        if self.probing:
+            self._probe(final=True)
+        width, height = self.dimensions or (None, None)
+        return UploadedFile(self.field, self.filename, b''.join(self.chunks),
+                            self.kind, width, height)
+
+
+class _RejectedPart:
+    """Parte de archivo ya rechazada: el resto de sus bytes se descarta."""
+
+    def feed(self, data):
+        pass
+
+    def finish(self):
+        return None
+
+
+def read_multipart(read, content_type, content_length=None, fields=('photo',),
+                   max_files=1, allowed_extensions=IMAGE_EXTENSIONS,
+                   max_file_size=MAX_FILE_SIZE, max_request_bytes=None,
+                   on_file=None, on_reject=None):
+    """
+    Lee y valida un cuerpo multipart/form-data desde `read(n)`.
+
+    Solo se aceptan archivos en los campos `fields` (hasta `max_files`); el
+    resto de partes con archivo se rechaza. `on_file(UploadedFile)` se llama
+    al completar cada archivo, antes de seguir leyendo. Con
+    `on_reject(campo, nombre, mensaje)` un archivo inválido no corta la
+    lectura: se informa, se descarta y se sigue con la próxima parte.
+    Devuelve (lista de UploadedFile, dict de campos de texto).
+    """
+    boundary = boundary_from_content_type(content_type).encode()
+    if max_request_bytes is None:
+        max_request_bytes = max_file_size * max_files + MULTIPART_OVERHEAD
+    if content_length is not None and content_length > max_request_bytes:
+        raise _too_large(max_file_size)
+
+    delimiter = b'\r\n--' + boundary
+    buffer = b'\r\n'  # el primer delimitador no lleva CRLF previo
+    total = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, total, eof
+        data = read(READ_CHUNK_SIZE)
+        if not data:
+            eof = True
+            return
+        total += len(data)
+        if total > max_request_bytes:
+            raise _too_large(max_file_size)
+        buffer += data
+
+    # Preámbulo: hasta el primer delimitador
+    while True:
+        index = buffer.find(delimiter)
+        if index != -1:
+            buffer = buffer[index + len(delimiter):]
+            break
+        if eof:
+            raise UploadRejected('No se encontró el archivo "photo" en la petición')
+        buffer = buffer[-len(delimiter):]
+        fill()
+
+    files = []
+    file_parts = 0
+    text_fields = {}
+
+    def reject(error):
+        if on_reject is None:
+            raise error
+        on_reject(name, filename, error.message)
+        return _RejectedPart()
+
+    while True:
+        # Tras el delimitador: '--' cierra el cuerpo, CRLF abre otra parte
+        while len(buffer) < 2 and not eof:
+            fill()
+        if buffer.startswith(b'--') or eof:
+            break
+        if not buffer.startswith(b'\r\n'):
+            raise UploadRejected('Cuerpo multipart inválido')
+        buffer = buffer[2:]
+
+        while True:
+            end = buffer.find(b'\r\n\r\n')
+            if end != -1:
+                break
+            if len(buffer) > MAX_HEADER_BYTES or eof:
+                raise UploadRejected('Headers de la parte inválidos')
+            fill()
+        headers = _parse_part_headers(buffer[:end])
+        buffer = buffer[end + 4:]
+
+        params = _disposition_params(headers.get('content-disposition', ''))
+        name = params.get('name')
+        filename = params.get('filename')
+
+        if filename is not None:
+            if not filename:
+                raise UploadRejected('No se seleccionó ningún archivo')
+            if name not in fields:
+                raise UploadRejected(f'Campo de archivo inesperado: {name}')
+            if file_parts >= max_files:
+                raise UploadRejected(f'Demasiados archivos. Máximo: {max_files}')
+            file_parts += 1
+            try:
+                sink = _FilePartValidator(name, filename, allowed_extensions, max_file_size)
+            except UploadRejected as e:
+                sink = reject(e)
+        else:
+            sink = None
+            value = []
+            value_size = 0
+
+        # Cuerpo de la parte hasta el siguiente delimitador
+        while True:
+            index = buffer.find(delimiter)
+            if index != -1:
+                data, buffer = buffer[:index], buffer[index + len(delimiter):]
+            else:
+                # Se retiene lo justo para no partir un delimitador entre bloques
+                keep = len(delimiter) - 1
+                data, buffer = buffer[:-keep], buffer[-keep:]
+            if data:
+                if sink is not None:
+                    try:
+                        sink.feed(data)
+                    except UploadRejected as e:
+                        sink = reject(e)
+                else:
+                    value_size += len(data)
+                    if value_size > MAX_FIELD_BYTES:
+                        raise UploadRejected(f'Campo {name} demasiado grande')
+                    value.append(data)
+            if index != -1:
+                break
+            if eof:
+                raise UploadRejected('Cuerpo multipart incompleto')
+            fill()
+
+        if sink is not None:
+            try:
+                uploaded = sink.finish()
+            except UploadRejected as e:
+                uploaded = reject(e).finish()
+            if uploaded is not None:
+                files.append(uploaded)
+                if on_file is not None:
+                    on_file(uploaded)
+        elif name:
+            text_fields[name] = b''.join(value).decode('utf-8', errors='replace')
+
+    return files, text_fields
@@ -0,0 +1,244 @@
+"""
+Variantes WebP/AVIF de las fotos según el header Accept.
+
+La primera vez que un cliente que acepta WebP (o AVIF) pide una foto, se
+transcodifica con Pillow y el resultado queda en un caché en disco con
+límite de tamaño (se expulsan las entradas usadas hace más tiempo). Si la
+variante no resulta más liviana que el original se recuerda y se sirve el
+original. Las respuestas llevan `Vary: Accept`.
+
+Variables de entorno:
+    LASACAM_VARIANTS           Formatos a negociar, en orden de preferencia
+                               ('webp'; 'avif,webp' para AVIF; '0' desactiva)
+    LASACAM_VARIANT_CACHE      Carpeta del caché (<raíz>/.cache/variants)
+    LASACAM_VARIANT_CACHE_MB   Tamaño máximo del caché en MB (512)
+"""
+
+import io
+import os
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from .instrumentation import stage
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - Pillow es opcional en los servidores locales
+    Image = None
+
+VARIANT_CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+VARIANT_QUALITY = {'webp': 80, 'avif': 60}
+# Solo se transcodifican estos originales (los GIF pueden ser animados)
+TRANSCODABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+DEFAULT_CACHE_MB = 512
+
+
+def supported_formats(formats):
+    """Formatos de `formats` que el Pillow instalado puede codificar."""
+    if Image is None:
+        return []
+    supported = []
+    for fmt in formats:
+        try:
+            if features.check(fmt):
+                supported.append(fmt)
+        except ValueError:
+            pass
+    return supported
+
+
+def _accepted_types(accept):
+    """Tipos MIME aceptados explícitamente (q > 0) en un header Accept."""
+    accepted = set()
+    for item in accept.split(','):
+        media_type, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+    return accepted
+
+
+def negotiate(accept, formats):
+    """Primer formato de `formats` aceptado por el cliente, o None."""
+    if not accept:
+        return None
+    accepted = _accepted_types(accept)
+    for fmt in formats:
+        if VARIANT_CONTENT_TYPES[fmt] in accepted:
+            return fmt
+    return None
+
+
+def transcode(data, fmt, quality=None):
+    """Codifica la imagen en `fmt`. Devuelve None si no conviene (animaciones)."""
+    img = Image.open(io.BytesIO(data))
+    if getattr(img, 'n_frames', 1) > 1:
+        return None
+    # El perfil ICC solo sirve si los píxeles siguen en RGB (no CMYK)
+    icc_profile = img.info.get('icc_profile') if img.mode in ('RGB', 'RGBA', 'P') else None
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    options = {'quality': quality or VARIANT_QUALITY[fmt]}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    output = io.BytesIO()
+    img.save(output, format=fmt.upper(), **options)
+    return output.getvalue()
+
+
+class VariantCache:
+    """
+    Caché en disco acotado por bytes, con expulsión LRU.
+
+    El orden de uso se guarda en memoria y en el mtime de cada archivo, así
+    se recupera al reiniciar. Un archivo vacío registra que no hay variante.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None  # OrderedDict clave -> tamaño, del menos al más reciente
+        self._total = 0
+
+    def __str__(self):
+        return f'{self.root} (máx. {self.max_bytes / 1024 / 1024:.0f}MB)'
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256('\0'.join(str(p) for p in parts).encode()).hexdigest()[:40]
+
+    def _path(self, key):
+        return self.root / key[:2] / key
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        if self.root.is_dir():
+            for path in self.root.glob('*/*'):
+                if path.is_file() and not path.name.startswith('.'):
+                    stat = path.stat()
+                    found.append((stat.st_mtime_ns, path.name, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self._total = sum(self._entries.values())
+
+    def get(self, key):
+        """Bytes guardados bajo `key` (b'' si no hay variante) o None si no está."""
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Expulsado por otro proceso
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{path.name}.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._load()
+            self._total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                self._path(old_key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def expire(self, older_than, dry_run=False):
+        """
+        Borra las entradas sin usar desde `older_than` (epoch en segundos).
+        Devuelve (cantidad, bytes); con dry_run solo los cuenta.
+        """
+        count = size = 0
+        if not self.root.is_dir():
+            return count, size
+        for path in self.root.glob('*/*'):
+            if path.name.startswith('.') or not path.is_file():
+                continue
+            stat = path.stat()
+            if stat.st_mtime >= older_than:
+                continue
+            if not dry_run:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    if self._entries is not None:
+                        self._total -= self._entries.pop(path.name, 0)
+            count += 1
+            size += stat.st_size
+        return count, size
+
+
+def variant_settings_from_env(default_root):
+    """(formatos, VariantCache) según el entorno, o ([], None) si está desactivado."""
+    value = os.environ.get('LASACAM_VARIANTS', 'webp')
+    formats = [f.strip().lower() for f in value.split(',')
+               if f.strip().lower() in VARIANT_CONTENT_TYPES]
+    formats = supported_formats(formats)
+    if not formats:
+        return [], None
+    root = os.environ.get('LASACAM_VARIANT_CACHE') or Path(default_root) / '.cache' / 'variants'
+    max_bytes = int(float(os.environ.get('LASACAM_VARIANT_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024)
+    return formats, VariantCache(root, max_bytes)
+
+
+def negotiated_variant(store, object_name, info, accept, formats, cache):
+    """
+    Variante de `object_name` para el header Accept del cliente.
+    Devuelve (bytes, content_type) o None si se debe servir el original.
+    """
+    if cache is None or Path(object_name).suffix.lower() not in TRANSCODABLE_EXTENSIONS:
+        return None
+    fmt = negotiate(accept, formats)
+    if fmt is None:
+        return None
+
+    key = VariantCache.key(object_name, info.generation, fmt, VARIANT_QUALITY[fmt])
+    with stage('cache'):
+        data = cache.get(key)
+    if data is None:
+        with stage('transcode'):
+            try:
+                data = transcode(store.get(object_name), fmt) or b''
+            except (OSError, ValueError):
+                data = b''
+            if len(data) >= info.size:
+                data = b''
+        cache.put(key, data)
+
+    if not data:
+        return None
+    return data, VARIANT_CONTENT_TYPES[fmt]
@@ -7,13 +7,36 @@ import io
 import json
 import secrets
 import zipfile
+import threading
 from datetime import datetime
 from pathlib import Path
 from PIL import Image
 
-from firebase_functions import https_fn
-from firebase_functions.options import set_global_options, CorsOptions
-from firebase_admin import initialize_app, storage
+from firebase_functions import https_fn, tasks_fn, scheduler_fn
+from firebase_functions.options import (set_global_options, CorsOptions, MemoryOption,
+                                        RetryConfig, RateLimits)
+from firebase_admin import initialize_app, functions as admin_functions
+
+from lasacam.instrumentation import instrument_handler, stage
+from lasacam.storage import storage_for_bucket, ObjectNotFound, content_type_for
+from lasacam.resize import parse_resize_params, resized_image, StorageCache, STORAGE_CACHE_PREFIX
+from lasacam.ratelimit import limiter_from_env, trusted_proxies_from_env, client_key, check
+from lasacam.compression import json_response, wants_compact, compact_listing
+from lasacam.ingest import ingest_policy, normalize_upload, archive_name
+from lasacam.uploads import read_multipart, UploadRejected
+from lasacam.listing import (wants_ndjson, iter_photos, ndjson_chunks, NDJSON_CONTENT_TYPE,
+                             parse_since, parse_window, delta_listing, delta_payload,
+                             record_deletions)
+from lasacam.exports import ExportJobs, public_status, jpg_arcname
+from lasacam.event_archive import EventArchive
+from lasacam.scan import scan_objects, window_photos, window_photo_names
+from lasacam.batch_upload import BatchUpload, BATCH_FIELDS, batch_max_files, batch_payload
+from lasacam.live import (StoragePoller, SSE_HEADERS, LIVE_HOLD_SECONDS, upload_event,
+                          last_event_id, storage_replay, iter_events)
+from lasacam.retention import RetentionJob, retention_policy, enabled, dry_run_from_env
+from lasacam.placeholder import photo_metadata, listing_fields
+from lasacam.contact_sheet import (parse_sheet_params, plan_sheet, sheet_map, sheet_image,
+                                   sheet_cache_control)
 
 # Inicializar Firebase Admin
 initialize_app()
@@ -23,6 +46,19 @@ set_global_options(max_instances=10)
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 STORAGE_BUCKET = 'lasacam.firebasestorage.app'  # Nombre del bucket (sin gs://)
+STORAGE_INGEST = ingest_policy('lasacam')  # Normalización de subidas (ver lasacam/ingest.py)
+
+# Límites por cliente compartidos entre instancias (ver lasacam/ratelimit.py);
+# con almacenamiento local (LASACAM_LOCAL_STORAGE) se limitan en memoria
+_RATE_LIMIT_STORE = 'memory' if os.environ.get('LASACAM_LOCAL_STORAGE') else 'firestore'
+UPLOAD_LIMITER = limiter_from_env('upload', default_store=_RATE_LIMIT_STORE)
+EXPORT_LIMITER = limiter_from_env('export', default_store=_RATE_LIMIT_STORE)
+# El front end de Google agrega la IP del cliente al final de X-Forwarded-For
+TRUSTED_PROXIES = trusted_proxies_from_env(default=1)
+# Exportar el evento completo exige el balde de exportaciones lleno
+EXPORT_ALL_COST = 500
+# JPG de las fotos PNG/GIF para las descargas individuales (los borra la retención con el resto del caché)
+DOWNLOAD_CACHE_PREFIX = f'{STORAGE_CACHE_PREFIX}download/'
 
 # Configuración CORS
 cors_options = CorsOptions(cors_origins="*", cors_methods=["GET", "POST", "OPTIONS"])
@@ -53,6 +89,133 @@ def _convert_to_jpg(image_data):
     return output.getvalue()
 
 
+def _download_if_exists(store, image_name):
+    """Descarga uploads/<image_name> del backend, o None si no existe."""
+    try:
+        with stage('download'):
+            return store.get(f'uploads/{image_name}')
+    except ObjectNotFound:
+        return None
+
+
+def _single_download_response(store, image_name, redirect=True):
+    """
+    Descarga de una sola imagen como JPG. Con `redirect`, un 302 a una URL de
+    Storage (firmada, con el nombre del adjunto) en lugar de pasar los bytes
+    por la función: los JPEG van directo al original y el resto a su versión
+    JPG, que se convierte una sola vez y queda en DOWNLOAD_CACHE_PREFIX.
+    """
+    object_name = f'uploads/{image_name}'
+    jpg_name = Path(image_name).stem + '.jpg'
+    not_found = https_fn.Response(
+        json.dumps({'error': f'La imagen {image_name} no existe'}),
+        status=404,
+        headers={'Content-Type': 'application/json'}
+    )
+
+    if redirect:
+        info = store.stat(object_name)
+        if info is None:
+            return not_found
+        target = object_name
+        if content_type_for(image_name) != 'image/jpeg':
+            # La generación en el nombre invalida la copia si el original cambia
+            target = f'{DOWNLOAD_CACHE_PREFIX}{Path(image_name).stem}-{info.generation}.jpg'
+            if store.stat(target) is None:
+                image_data = _download_if_exists(store, image_name)
+                if image_data is None:
+                    return not_found
+                with stage('convert'):
+                    jpg_data = _convert_to_jpg(image_data)
+                store.put(target, jpg_data, content_type='image/jpeg')
+        return https_fn.Response(
+            '',
+            status=302,
+            headers={'Location': store.download_url(target, jpg_name), 'Cache-Control': 'no-store'}
+        )
+
+    image_data = _download_if_exists(store, image_name)
+    if image_data is None:
+        return not_found
+
+    # Convertir a JPG
+    with stage('convert'):
+        jpg_data = _convert_to_jpg(image_data)
+
+    # Retornar imagen JPG
+    return https_fn.Response(
+        jpg_data,
+        status=200,
+        headers={
+            'Content-Type': 'image/jpeg',
+            'Content-Disposition': f'attachment; filename="{jpg_name}"',
+            'Cache-Control': 'public, max-age=3600'
+        }
+    )
+
+
+def _build_zip(image_names, load_image):
+    """
+    Crea un ZIP en memoria con las imágenes convertidas a JPG.
+    load_image(nombre) devuelve los bytes de la imagen o None si no existe.
+    """
+    zip_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for image_name in image_names:
+            try:
+                image_data = load_image(image_name)
+
+                if image_data is None:
+                    print(f'Advertencia: {image_name} no existe, se omite')
+                    continue
+
+                # Convertir a JPG
+                with stage('convert'):
+                    jpg_data = _convert_to_jpg(image_data)
+                jpg_name = Path(image_name).stem + '.jpg'
+
+                with stage('zip'):
+                    zip_file.writestr(jpg_name, jpg_data)
+
+            except Exception as e:
+                print(f'Error procesando {image_name}: {str(e)}')
+                continue
+
+    return zip_buffer.getvalue()
+
+
+def _event_archive(store):
+    """ZIP incremental de todo el evento (ver lasacam/event_archive.py)."""
+    return EventArchive(store, convert=_convert_to_jpg, extensions=ALLOWED_EXTENSIONS)
+
+
+def _append_to_event_archive(store, filename, data):
+    """Agrega la foto al ZIP del evento; si falla, se agrega al descargar todo."""
+    try:
+        with stage('event_zip'):
+            _event_archive(store).append(filename, data)
+    except Exception as e:
+        print(f'Aviso: no se pudo agregar {filename} al ZIP del evento ({str(e)})')
+
+
+def _event_archive_response(store, zip_filename):
+    """Descarga del evento completo: segmentos ya armados más el directorio central."""
+    archive = _event_archive(store)
+    parts, directory = archive.layout()
+    size = sum(part_size for _, part_size in parts) + len(directory)
+    
+    return https_fn.Response(
+        archive.stream(parts, directory),
+        status=200,
+        headers={
+            'Content-Type': 'application/zip',
+            'Content-Length': str(size),
+            'Content-Disposition': f'attachment; filename="{zip_filename}"'
+        }
+    )
+
+
 def _generate_unique_filename(original_filename):
     """Genera un nombre único para el archivo."""
     ext = _get_file_extension(original_filename)
@@ -61,59 +224,285 @@ def _generate_unique_filename(original_filename):
     return f'lasacam-{timestamp}-{random_hex}{ext}'
 
 
+def _photo_entry(store, obj):
+    """Entrada de una foto en los listados, con width, height y placeholder si los tiene."""
+    filename = obj.name[len('uploads/'):]
+    return {'filename': filename, 'url': store.public_url(obj.name), **listing_fields(obj.metadata)}
+
+
+def _listing_response(req, store, photos, delta=None):
+    """
+    Respuesta de un listado (ObjectInfo de las fotos), completa o compacta
+    (?shape=compact), comprimida según Accept-Encoding y con ETag (304 si no
+    cambió). `delta` = (borradas, cursor, reset) para los listados incrementales.
+    """
+    data = [_photo_entry(store, obj) for obj in photos]
+    if wants_compact(req.args):
+        data = compact_listing(store.public_url('uploads/'), data)
+    if delta is not None:
+        data = delta_payload(data, *delta)
+    
+    status, body, headers = json_response(
+        data,
+        req.headers.get('Accept-Encoding', ''),
+        req.headers.get('If-None-Match', '')
+    )
+    return https_fn.Response(body, status=status, headers=headers)
+
+
+def _ndjson_listing_response(store):
+    """
+    Listado en NDJSON (?format=ndjson): una foto por línea, enviada a medida
+    que se recorre el bucket (más recientes primero).
+    """
+    entries = (_photo_entry(store, obj)
+               for obj in iter_photos(store, 'uploads/', ALLOWED_EXTENSIONS))
+    return https_fn.Response(
+        ndjson_chunks(entries),
+        status=200,
+        headers={'Content-Type': NDJSON_CONTENT_TYPE, 'Cache-Control': 'no-cache'}
+    )
+
+
+def _delta_listing_response(req, store):
+    """Listado incremental (?since=<timestamp o cursor>): fotos nuevas y borradas."""
+    try:
+        since = parse_since(req.args)
+    except ValueError as e:
+        return https_fn.Response(
+            json.dumps({'error': str(e)}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    if wants_ndjson(req.args):
+        return https_fn.Response(
+            json.dumps({'error': 'since no se puede combinar con format=ndjson'}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    with stage('list'):
+        photos, deleted, cursor, reset = delta_listing(store, 'uploads/', ALLOWED_EXTENSIONS, since)
+    return _listing_response(req, store, photos, delta=(deleted, cursor, reset))
+
+
+def _window_listing_response(req, store):
+    """
+    Listado de las fotos subidas en ?from=&to= (ms o ISO 8601), más recientes
+    primero y en JSON o NDJSON. None si la petición no trae ventana.
+    """
+    try:
+        window = parse_window(req.args)
+    except ValueError as e:
+        return https_fn.Response(
+            json.dumps({'error': str(e)}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    if window is None:
+        return None
+    if req.args.get('since'):
+        return https_fn.Response(
+            json.dumps({'error': 'since no se puede combinar con from/to'}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    with stage('list'):
+        photos = window_photos(store, 'uploads/', ALLOWED_EXTENSIONS, *window)
+    if wants_ndjson(req.args):
+        entries = (_photo_entry(store, obj) for obj in photos)
+        return https_fn.Response(
+            ndjson_chunks(entries),
+            status=200,
+            headers={'Content-Type': NDJSON_CONTENT_TYPE, 'Cache-Control': 'no-cache'}
+        )
+    return _listing_response(req, store, photos)
+
+
+def _download_names(data, bucket_name):
+    """
+    Fotos pedidas en el cuerpo de una descarga: `imageNames`, o las subidas en
+    el horario `from`/`to`. Devuelve (nombres, None) o (None, respuesta de error).
+    """
+    try:
+        window = parse_window(data)
+    except ValueError as e:
+        return None, https_fn.Response(
+            json.dumps({'error': str(e)}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    if window is not None:
+        with stage('list'):
+            image_names = window_photo_names(storage_for_bucket(bucket_name), 'uploads/',
+                                             ALLOWED_EXTENSIONS, *window)
+        if not image_names:
+            return None, https_fn.Response(
+                json.dumps({'error': 'No hay fotos en ese horario'}),
+                status=404,
+                headers={'Content-Type': 'application/json'}
+            )
+        return image_names, None
+    
+    image_names = data.get('imageNames', [])
+    if not isinstance(image_names, list) or len(image_names) == 0:
+        return None, https_fn.Response(
+            json.dumps({'error': 'imageNames debe ser una lista no vacía (o from/to)'}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    return image_names, None
+
+
+def _record_deletions(store, deleted):
+    """Lápidas para los listados incrementales; si fallan, el borrado sigue siendo válido."""
+    if not deleted:
+        return
+    try:
+        record_deletions(store, deleted)
+    except Exception as e:
+        print(f'Aviso: no se pudieron registrar los borrados ({str(e)})')
+
+
+def _rate_limited(req, limiter, cost=1):
+    """Respuesta 429 si el cliente agotó su cuota; None si puede seguir."""
+    rejection = check(limiter, client_key(req.headers, req.remote_addr, TRUSTED_PROXIES), cost)
+    if rejection is None:
+        return None
+    
+    message, retry_after = rejection
+    return https_fn.Response(
+        json.dumps({'error': message}),
+        status=429,
+        headers={'Content-Type': 'application/json', 'Retry-After': str(retry_after)}
+    )
+
+
 def _parse_multipart_form(request):
-    """Parsea formulario multipart/form-data."""
+    """
+    Parsea formulario multipart/form-data leyendo el cuerpo por bloques.
+    La firma, las dimensiones y el tamaño se validan mientras llega el
+    cuerpo, así una subida inválida se corta sin leerla completa.
+    Devuelve (filename, data, None, None) o (None, None, error, status).
+    """
     content_type = request.headers.get('Content-Type', '')
     
-    if not content_type.startswith('multipart/form-data'):
-        return None, None, 'Content-Type debe ser multipart/form-data'
+    try:
+        files, _ = read_multipart(
+            request.stream.read,
+            content_type,
+            content_length=request.content_length,
+            allowed_extensions=ALLOWED_EXTENSIONS,
+            max_file_size=MAX_FILE_SIZE,
+        )
+    except UploadRejected as e:
+        return None, None, e.message, e.status
     
-    # Extraer boundary
-    if 'boundary=' not in content_type:
-        return None, None, 'Falta boundary en Content-Type'
+    if not files:
+        return None, None, 'No se encontró el archivo "photo" en la petición', 400
     
-    boundary = content_type.split('boundary=')[1].encode()
-    body = request.get_data()
+    return files[0].filename, files[0].data, None, None
+
+
+def _store_upload(store, ingest, original_filename, file_data, event_archive=False):
+    """
+    Normaliza y guarda una foto ya validada en uploads/ (pública, con sus
+    dimensiones). Devuelve {'filename', 'url'}.
+    """
+    with stage('normalize'):
+        file_data, filename, original = normalize_upload(file_data, original_filename, ingest)
     
-    # Dividir por boundary
-    parts = body.split(b'--' + boundary)
+    unique_filename = _generate_unique_filename(filename)
+    object_name = f'uploads/{unique_filename}'
+    store.put(object_name, file_data, content_type=content_type_for(unique_filename),
+              metadata=photo_metadata(file_data), public=True)
     
-    for part in parts:
-        if b'Content-Disposition: form-data' not in part:
-            continue
-        
-        if b'name="photo"' not in part:
-            continue
-        
-        # Extraer filename
-        filename = None
-        if b'filename=' in part:
-            for line in part.split(b'\r\n'):
-                if b'filename=' in line:
-                    filename_str = line.decode('utf-8', errors='ignore')
-                    if 'filename=' in filename_str:
-                        filename = filename_str.split('filename=')[1].strip('"\'')
-                        break
-        
-        if not filename:
-            continue
-        
-        # Extraer datos del archivo
-        file_start = part.find(b'\r\n\r\n')
-        if file_start == -1:
-            continue
-        
-        file_start += 4
-        file_end = part.rfind(b'\r\n')
-        
-        if file_end > file_start:
-            file_data = part[file_start:file_end]
-            return filename, file_data, None
+    if original is not None:
+        archive = archive_name(ingest, unique_filename, original_filename)
+        store.put(archive, original, content_type=content_type_for(archive))
+    
+    if event_archive:
+        _append_to_event_archive(store, unique_filename, file_data)
+    
+    return {'filename': unique_filename, 'url': store.public_url(object_name)}
+
+
+def _batch_upload_response(req, bucket_name, ingest, event_archive=False):
+    """
+    Subida de varias fotos (campo "photos") con un resultado por archivo:
+    200 si se guardaron todas, 207 si alguna falló (ver lasacam/batch_upload.py).
+    """
+    if req.method != 'POST':
+        return https_fn.Response(
+            json.dumps({'error': 'Método no permitido'}),
+            status=405,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    # La primera foto se cobra antes de leer el cuerpo; las demás, al llegar
+    limited = _rate_limited(req, UPLOAD_LIMITER)
+    if limited is not None:
+        return limited
+    
+    key = client_key(req.headers, req.remote_addr, TRUSTED_PROXIES)
+    
+    def admit():
+        rejection = check(UPLOAD_LIMITER, key)
+        return rejection[0] if rejection is not None else None
     
-    return None, None, 'No se encontró el archivo "photo" en la petición'
+    store = storage_for_bucket(bucket_name)
+    batch = BatchUpload(
+        lambda photo: _store_upload(store, ingest, photo.filename, photo.data, event_archive),
+        admit
+    )
+    try:
+        with stage('parse'):
+            read_multipart(
+                req.stream.read,
+                req.headers.get('Content-Type', ''),
+                content_length=req.content_length,
+                fields=BATCH_FIELDS,
+                max_files=batch_max_files(),
+                allowed_extensions=ALLOWED_EXTENSIONS,
+                max_file_size=MAX_FILE_SIZE,
+                on_file=batch.on_file,
+                on_reject=batch.on_reject,
+            )
+    except UploadRejected as e:
+        # Lo ya guardado queda guardado: el cliente recibe sus resultados
+        return https_fn.Response(
+            json.dumps({'error': e.message, 'results': batch.results()}),
+            status=e.status,
+            headers={'Content-Type': 'application/json'}
+        )
+    except Exception as e:
+        batch.results()
+        return https_fn.Response(
+            json.dumps({'error': f'Error al subir fotos: {str(e)}'}),
+            status=500,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    results = batch.results()
+    if not results:
+        return https_fn.Response(
+            json.dumps({'error': 'No se encontró ningún archivo "photos" en la petición'}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    payload, status = batch_payload(results)
+    return https_fn.Response(
+        json.dumps(payload),
+        status=status,
+        headers={'Content-Type': 'application/json'}
+    )
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadPhoto')
 def uploadPhoto(req: https_fn.Request) -> https_fn.Response:
     """
     Maneja la subida de fotos a Firebase Storage.
@@ -128,82 +517,33 @@ def uploadPhoto(req: https_fn.Request) -> https_fn.Response:
             headers={'Content-Type': 'application/json'}
         )
     
+    # Límite por cliente, antes de leer el cuerpo
+    limited = _rate_limited(req, UPLOAD_LIMITER)
+    if limited is not None:
+        return limited
+    
     try:
         # Parsear multipart form
-        filename, file_data, error = _parse_multipart_form(req)
+        with stage('parse'):
+            filename, file_data, error, status = _parse_multipart_form(req)
         
         if error:
             return https_fn.Response(
                 json.dumps({'error': error}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        if not filename or not file_data:
-            return https_fn.Response(
-                json.dumps({'error': 'No se encontró el archivo en la petición'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Validar extensión
-        file_ext = _get_file_extension(filename)
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return https_fn.Response(
-                json.dumps({'error': f'Extensión no permitida. Use: {", ".join(ALLOWED_EXTENSIONS)}'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Validar tamaño
-        file_size = len(file_data)
-        if file_size == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'El archivo está vacío'}),
-                status=400,
+                status=status,
                 headers={'Content-Type': 'application/json'}
             )
         
-        if file_size > MAX_FILE_SIZE:
-            return https_fn.Response(
-                json.dumps({'error': f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Generar nombre único
-        unique_filename = _generate_unique_filename(filename)
-        
-        # Subir a Firebase Storage
-        bucket = storage.bucket(STORAGE_BUCKET)
-        blob = bucket.blob(f'uploads/{unique_filename}')
-        
-        # Determinar content-type
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif'
-        }
-        content_type = content_types.get(file_ext, 'application/octet-stream')
-        
-        # Subir archivo
-        blob.upload_from_string(
-            file_data,
-            content_type=content_type
-        )
-        
-        # Hacer el archivo público
-        blob.make_public()
-        
-        # Obtener URL pública
-        public_url = blob.public_url
+        # Normalizar, guardar pública (con sus dimensiones) y conservar el original
+        # si la política lo pide
+        store = storage_for_bucket(STORAGE_BUCKET)
+        stored = _store_upload(store, STORAGE_INGEST, filename, file_data)
         
         # Response en el mismo formato que el backend original
         response_data = {
             'message': 'Foto subida con éxito',
-            'filename': unique_filename,
-            'url': public_url
+            'filename': stored['filename'],
+            'url': stored['url']
         }
         
         return https_fn.Response(
@@ -221,16 +561,28 @@ def uploadPhoto(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadPhotoBatch')
+def uploadPhotoBatch(req: https_fn.Request) -> https_fn.Response:
+    """
+    Subida de varias fotos en una petición.
+    POST /api/upload/batch
+    """
+    return _batch_upload_response(req, STORAGE_BUCKET, STORAGE_INGEST)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('downloadMultipleImages')
 def downloadMultipleImages(req: https_fn.Request) -> https_fn.Response:
     """
     Descarga una o múltiples imágenes.
-    - Si se envía 1 imagen: descarga directa de la imagen
+    - Si se envía 1 imagen: 302 a la imagen en Storage ("redirect": false la devuelve en la respuesta)
     - Si se envían 2+: descarga como ZIP
     
     Payload esperado:
     {
         "imageNames": ["lasacam-1234567890-abc123.jpg"] // 1 o más
     }
+    o {"from": "2025-03-01T20:00", "to": "2025-03-01T21:00"} para las fotos de ese horario
     """
     
     # Solo permitir POST
@@ -258,78 +610,32 @@ def downloadMultipleImages(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
         
-        # Validar que imageNames esté presente y sea una lista
-        image_names = data.get('imageNames', [])
-        if not isinstance(image_names, list) or len(image_names) == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'imageNames debe ser una lista no vacía'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
+        # imageNames, o las fotos del horario from/to
+        image_names, error = _download_names(data, STORAGE_BUCKET)
+        if error is not None:
+            return error
         
-        # Obtener bucket
-        bucket = storage.bucket(STORAGE_BUCKET)
+        # Límite por cliente: cada imagen exportada cuesta un token
+        limited = _rate_limited(req, EXPORT_LIMITER, cost=len(image_names))
+        if limited is not None:
+            return limited
+        
+        # Obtener backend de almacenamiento
+        store = storage_for_bucket(STORAGE_BUCKET)
 
-        # Si es solo 1 imagen, descargarla directamente
+        # Si es solo 1 imagen: redirección a Storage (o la imagen, con "redirect": false)
         if len(image_names) == 1:
-            image_name = image_names[0]
-            blob = bucket.blob(f'uploads/{image_name}')
-
-            # Verificar que existe
-            if not blob.exists():
-                return https_fn.Response(
-                    json.dumps({'error': f'La imagen {image_name} no existe'}),
-                    status=404,
-                    headers={'Content-Type': 'application/json'}
-                )
-
-            # Descargar y convertir a JPG
-            image_data = blob.download_as_bytes()
-            jpg_data = _convert_to_jpg(image_data)
-            jpg_name = Path(image_name).stem + '.jpg'
-
-            # Retornar imagen JPG
-            return https_fn.Response(
-                jpg_data,
-                status=200,
-                headers={
-                    'Content-Type': 'image/jpeg',
-                    'Content-Disposition': f'attachment; filename="{jpg_name}"',
-                    'Cache-Control': 'public, max-age=3600'
-                }
-            )
+            return _single_download_response(store, image_names[0], data.get('redirect', True))
 
         # Si son múltiples, crear ZIP con JPGs
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for image_name in image_names:
-                try:
-                    blob = bucket.blob(f'uploads/{image_name}')
-
-                    if not blob.exists():
-                        print(f'Advertencia: {image_name} no existe, se omite')
-                        continue
-
-                    # Descargar y convertir a JPG
-                    image_data = blob.download_as_bytes()
-                    jpg_data = _convert_to_jpg(image_data)
-                    jpg_name = Path(image_name).stem + '.jpg'
-
-                    zip_file.writestr(jpg_name, jpg_data)
-
-                except Exception as e:
-                    print(f'Error procesando {image_name}: {str(e)}')
-                    continue
-
-        zip_buffer.seek(0)
+        zip_data = _build_zip(image_names, lambda name: _download_if_exists(store, name))
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         zip_filename = f'lasacam_fotos_{timestamp}.zip'
         
         # Retornar ZIP
         return https_fn.Response(
-            zip_buffer.getvalue(),
+            zip_data,
             status=200,
             headers={
                 'Content-Type': 'application/zip',
@@ -346,6 +652,7 @@ def downloadMultipleImages(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('listPhotos')
 def listPhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Lista todas las fotos subidas en Firebase Storage.
@@ -361,41 +668,39 @@ def listPhotos(req: https_fn.Request) -> https_fn.Response:
         )
     
     try:
-        # Obtener bucket
-        bucket = storage.bucket(STORAGE_BUCKET)
+        # Obtener backend de almacenamiento
+        store = storage_for_bucket(STORAGE_BUCKET)
+        
+        windowed = _window_listing_response(req, store)
+        if windowed is not None:
+            return windowed
+        if req.args.get('since'):
+            return _delta_listing_response(req, store)
+        if wants_ndjson(req.args):
+            return _ndjson_listing_response(store)
         
         # Listar todos los archivos en el directorio uploads/
-        blobs = bucket.list_blobs(prefix='uploads/')
+        with stage('list'):
+            objects = scan_objects(store, 'uploads/')
         
         photos = []
         
-        for blob in blobs:
+        for obj in objects:
             # Filtrar solo archivos válidos (no directorios)
-            if blob.name == 'uploads/':
+            if obj.name == 'uploads/':
                 continue
             
-            filename = blob.name.replace('uploads/', '')
+            filename = obj.name.replace('uploads/', '')
             file_ext = _get_file_extension(filename)
             
             # Solo incluir archivos con extensiones permitidas
             if file_ext in ALLOWED_EXTENSIONS:
-                # Hacer público si no lo está (por si acaso)
-                if not blob.public_url:
-                    blob.make_public()
-                
-                photos.append({
-                    'filename': filename,
-                    'url': blob.public_url
-                })
+                photos.append(obj)
         
         # Ordenar por nombre (que incluye timestamp) - más recientes primero
-        photos.sort(key=lambda x: x['filename'], reverse=True)
+        photos.sort(key=lambda obj: obj.name, reverse=True)
         
-        return https_fn.Response(
-            json.dumps(photos),
-            status=200,
-            headers={'Content-Type': 'application/json'}
-        )
+        return _listing_response(req, store, photos)
     
     except Exception as e:
         return https_fn.Response(
@@ -408,8 +713,10 @@ def listPhotos(req: https_fn.Request) -> https_fn.Response:
 # --- Procigar Functions ---
 
 PROCIGAR_BUCKET = 'procigarfotos'
+PROCIGAR_INGEST = ingest_policy('procigar')
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadProcigarPhoto')
 def uploadProcigarPhoto(req: https_fn.Request) -> https_fn.Response:
     """
     Maneja la subida de fotos al bucket de Procigar.
@@ -424,82 +731,33 @@ def uploadProcigarPhoto(req: https_fn.Request) -> https_fn.Response:
             headers={'Content-Type': 'application/json'}
         )
     
+    # Límite por cliente, antes de leer el cuerpo
+    limited = _rate_limited(req, UPLOAD_LIMITER)
+    if limited is not None:
+        return limited
+    
     try:
         # Parsear multipart form
-        filename, file_data, error = _parse_multipart_form(req)
+        with stage('parse'):
+            filename, file_data, error, status = _parse_multipart_form(req)
         
         if error:
             return https_fn.Response(
                 json.dumps({'error': error}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        if not filename or not file_data:
-            return https_fn.Response(
-                json.dumps({'error': 'No se encontró el archivo en la petición'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Validar extensión
-        file_ext = _get_file_extension(filename)
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return https_fn.Response(
-                json.dumps({'error': f'Extensión no permitida. Use: {", ".join(ALLOWED_EXTENSIONS)}'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Validar tamaño
-        file_size = len(file_data)
-        if file_size == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'El archivo está vacío'}),
-                status=400,
+                status=status,
                 headers={'Content-Type': 'application/json'}
             )
         
-        if file_size > MAX_FILE_SIZE:
-            return https_fn.Response(
-                json.dumps({'error': f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Generar nombre único
-        unique_filename = _generate_unique_filename(filename)
-        
-        # Subir a Firebase Storage (Bucket Procigar)
-        bucket = storage.bucket(PROCIGAR_BUCKET)
-        blob = bucket.blob(f'uploads/{unique_filename}')
-        
-        # Determinar content-type
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif'
-        }
-        content_type = content_types.get(file_ext, 'application/octet-stream')
-        
-        # Subir archivo
-        blob.upload_from_string(
-            file_data,
-            content_type=content_type
-        )
-        
-        # Hacer el archivo público
-        blob.make_public()
-        
-        # Obtener URL pública
-        public_url = blob.public_url
+        # Normalizar, guardar pública (con sus dimensiones) y conservar el original
+        # si la política lo pide; además se agrega al ZIP del evento completo
+        store = storage_for_bucket(PROCIGAR_BUCKET)
+        stored = _store_upload(store, PROCIGAR_INGEST, filename, file_data, event_archive=True)
         
         # Response
         response_data = {
             'message': 'Foto subida con éxito a Procigar',
-            'filename': unique_filename,
-            'url': public_url
+            'filename': stored['filename'],
+            'url': stored['url']
         }
         
         return https_fn.Response(
@@ -517,6 +775,17 @@ def uploadProcigarPhoto(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadProcigarPhotoBatch')
+def uploadProcigarPhotoBatch(req: https_fn.Request) -> https_fn.Response:
+    """
+    Subida de varias fotos al bucket de Procigar.
+    POST /api/procigar/upload/batch
+    """
+    return _batch_upload_response(req, PROCIGAR_BUCKET, PROCIGAR_INGEST, event_archive=True)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('listProcigarPhotos')
 def listProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Lista todas las fotos del bucket de Procigar.
@@ -532,41 +801,39 @@ def listProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
         )
     
     try:
-        # Obtener bucket Procigar
-        bucket = storage.bucket(PROCIGAR_BUCKET)
+        # Obtener backend de almacenamiento Procigar
+        store = storage_for_bucket(PROCIGAR_BUCKET)
+        
+        windowed = _window_listing_response(req, store)
+        if windowed is not None:
+            return windowed
+        if req.args.get('since'):
+            return _delta_listing_response(req, store)
+        if wants_ndjson(req.args):
+            return _ndjson_listing_response(store)
         
         # Listar todos los archivos en el directorio uploads/
-        blobs = bucket.list_blobs(prefix='uploads/')
+        with stage('list'):
+            objects = scan_objects(store, 'uploads/')
         
         photos = []
         
-        for blob in blobs:
+        for obj in objects:
             # Filtrar solo archivos válidos (no directorios)
-            if blob.name == 'uploads/':
+            if obj.name == 'uploads/':
                 continue
             
-            filename = blob.name.replace('uploads/', '')
+            filename = obj.name.replace('uploads/', '')
             file_ext = _get_file_extension(filename)
             
             # Solo incluir archivos con extensiones permitidas
             if file_ext in ALLOWED_EXTENSIONS:
-                # Hacer público si no lo está
-                if not blob.public_url:
-                    blob.make_public()
-                
-                photos.append({
-                    'filename': filename,
-                    'url': blob.public_url
-                })
+                photos.append(obj)
         
         # Ordenar por nombre (más recientes primero)
-        photos.sort(key=lambda x: x['filename'], reverse=True)
+        photos.sort(key=lambda obj: obj.name, reverse=True)
         
-        return https_fn.Response(
-            json.dumps(photos),
-            status=200,
-            headers={'Content-Type': 'application/json'}
-        )
+        return _listing_response(req, store, photos)
     
     except Exception as e:
         return https_fn.Response(
@@ -577,10 +844,11 @@ def listProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('downloadProcigarImages')
 def downloadProcigarImages(req: https_fn.Request) -> https_fn.Response:
     """
     Descarga una o múltiples imágenes del bucket Procigar.
-    - Si se envía 1 imagen: descarga directa de la imagen
+    - Si se envía 1 imagen: 302 a la imagen en Storage ("redirect": false la devuelve en la respuesta)
     - Si se envían 2+: descarga como ZIP
     
     POST /api/procigar/download
@@ -588,6 +856,8 @@ def downloadProcigarImages(req: https_fn.Request) -> https_fn.Response:
     {
         "imageNames": ["lasacam-1234567890-abc123.jpg"] // 1 o más
     }
+    o {"from": "2025-03-01T20:00", "to": "2025-03-01T21:00"} para las fotos de ese horario
+    o {"all": true} para el ZIP de todo el evento (ver lasacam/event_archive.py)
     """
     
     # Solo permitir POST
@@ -615,78 +885,41 @@ def downloadProcigarImages(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
         
-        # Validar que imageNames esté presente y sea una lista
-        image_names = data.get('imageNames', [])
-        if not isinstance(image_names, list) or len(image_names) == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'imageNames debe ser una lista no vacía'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
+        # Todo el evento: el ZIP incremental, sin volver a armarlo
+        if data.get('all'):
+            limited = _rate_limited(req, EXPORT_LIMITER, cost=EXPORT_ALL_COST)
+            if limited is not None:
+                return limited
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            return _event_archive_response(storage_for_bucket(PROCIGAR_BUCKET),
+                                           f'procigar_fotos_{timestamp}.zip')
+        
+        # imageNames, o las fotos del horario from/to
+        image_names, error = _download_names(data, PROCIGAR_BUCKET)
+        if error is not None:
+            return error
         
-        # Obtener bucket Procigar
-        bucket = storage.bucket(PROCIGAR_BUCKET)
+        # Límite por cliente: cada imagen exportada cuesta un token
+        limited = _rate_limited(req, EXPORT_LIMITER, cost=len(image_names))
+        if limited is not None:
+            return limited
+        
+        # Obtener backend de almacenamiento Procigar
+        store = storage_for_bucket(PROCIGAR_BUCKET)
 
-        # Si es solo 1 imagen, descargarla directamente
+        # Si es solo 1 imagen: redirección a Storage (o la imagen, con "redirect": false)
         if len(image_names) == 1:
-            image_name = image_names[0]
-            blob = bucket.blob(f'uploads/{image_name}')
-
-            # Verificar que existe
-            if not blob.exists():
-                return https_fn.Response(
-                    json.dumps({'error': f'La imagen {image_name} no existe'}),
-                    status=404,
-                    headers={'Content-Type': 'application/json'}
-                )
-
-            # Descargar y convertir a JPG
-            image_data = blob.download_as_bytes()
-            jpg_data = _convert_to_jpg(image_data)
-            jpg_name = Path(image_name).stem + '.jpg'
-
-            # Retornar imagen JPG
-            return https_fn.Response(
-                jpg_data,
-                status=200,
-                headers={
-                    'Content-Type': 'image/jpeg',
-                    'Content-Disposition': f'attachment; filename="{jpg_name}"',
-                    'Cache-Control': 'public, max-age=3600'
-                }
-            )
+            return _single_download_response(store, image_names[0], data.get('redirect', True))
 
         # Si son múltiples, crear ZIP con JPGs
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for image_name in image_names:
-                try:
-                    blob = bucket.blob(f'uploads/{image_name}')
-
-                    if not blob.exists():
-                        print(f'Advertencia: {image_name} no existe, se omite')
-                        continue
-
-                    # Descargar y convertir a JPG
-                    image_data = blob.download_as_bytes()
-                    jpg_data = _convert_to_jpg(image_data)
-                    jpg_name = Path(image_name).stem + '.jpg'
-
-                    zip_file.writestr(jpg_name, jpg_data)
-
-                except Exception as e:
-                    print(f'Error procesando {image_name}: {str(e)}')
-                    continue
-
-        zip_buffer.seek(0)
+        zip_data = _build_zip(image_names, lambda name: _download_if_exists(store, name))
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         zip_filename = f'procigar_fotos_{timestamp}.zip'
 
         # Retornar ZIP
         return https_fn.Response(
-            zip_buffer.getvalue(),
+            zip_data,
             status=200,
             headers={
                 'Content-Type': 'application/zip',
@@ -705,8 +938,10 @@ def downloadProcigarImages(req: https_fn.Request) -> https_fn.Response:
 # --- PCA Functions ---
 
 PCA_BUCKET = 'pca-event'
+PCA_INGEST = ingest_policy('pca')
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadPcaPhoto')
 def uploadPcaPhoto(req: https_fn.Request) -> https_fn.Response:
     """
     Maneja la subida de fotos al bucket de PCA.
@@ -721,82 +956,33 @@ def uploadPcaPhoto(req: https_fn.Request) -> https_fn.Response:
             headers={'Content-Type': 'application/json'}
         )
 
+    # Límite por cliente, antes de leer el cuerpo
+    limited = _rate_limited(req, UPLOAD_LIMITER)
+    if limited is not None:
+        return limited
+    
     try:
         # Parsear multipart form
-        filename, file_data, error = _parse_multipart_form(req)
+        with stage('parse'):
+            filename, file_data, error, status = _parse_multipart_form(req)
 
         if error:
             return https_fn.Response(
                 json.dumps({'error': error}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-
-        if not filename or not file_data:
-            return https_fn.Response(
-                json.dumps({'error': 'No se encontró el archivo en la petición'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-
-        # Validar extensión
-        file_ext = _get_file_extension(filename)
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return https_fn.Response(
-                json.dumps({'error': f'Extensión no permitida. Use: {", ".join(ALLOWED_EXTENSIONS)}'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-
-        # Validar tamaño
-        file_size = len(file_data)
-        if file_size == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'El archivo está vacío'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-
-        if file_size > MAX_FILE_SIZE:
-            return https_fn.Response(
-                json.dumps({'error': f'Archivo muy grande. Máximo: {MAX_FILE_SIZE / 1024 / 1024}MB'}),
-                status=400,
+                status=status,
                 headers={'Content-Type': 'application/json'}
             )
 
-        # Generar nombre único
-        unique_filename = _generate_unique_filename(filename)
-
-        # Subir a Firebase Storage (Bucket PCA)
-        bucket = storage.bucket(PCA_BUCKET)
-        blob = bucket.blob(f'uploads/{unique_filename}')
-
-        # Determinar content-type
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif'
-        }
-        content_type = content_types.get(file_ext, 'application/octet-stream')
-
-        # Subir archivo
-        blob.upload_from_string(
-            file_data,
-            content_type=content_type
-        )
-
-        # Hacer el archivo público
-        blob.make_public()
-
-        # Obtener URL pública
-        public_url = blob.public_url
+        # Normalizar, guardar pública (con sus dimensiones) y conservar el original
+        # si la política lo pide; además se agrega al ZIP del evento completo
+        store = storage_for_bucket(PCA_BUCKET)
+        stored = _store_upload(store, PCA_INGEST, filename, file_data, event_archive=True)
 
         # Response
         response_data = {
             'message': 'Foto subida con éxito a PCA',
-            'filename': unique_filename,
-            'url': public_url
+            'filename': stored['filename'],
+            'url': stored['url']
         }
 
         return https_fn.Response(
@@ -814,6 +1000,16 @@ def uploadPcaPhoto(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('uploadPcaPhotoBatch')
+def uploadPcaPhotoBatch(req: https_fn.Request) -> https_fn.Response:
+    """
+    Subida de varias fotos al bucket de PCA.
+    """
+    return _batch_upload_response(req, PCA_BUCKET, PCA_INGEST, event_archive=True)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('listPcaPhotos')
 def listPcaPhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Lista todas las fotos del bucket de PCA.
@@ -829,41 +1025,39 @@ def listPcaPhotos(req: https_fn.Request) -> https_fn.Response:
         )
 
     try:
-        # Obtener bucket PCA
-        bucket = storage.bucket(PCA_BUCKET)
+        # Obtener backend de almacenamiento PCA
+        store = storage_for_bucket(PCA_BUCKET)
+
+        windowed = _window_listing_response(req, store)
+        if windowed is not None:
+            return windowed
+        if req.args.get('since'):
+            return _delta_listing_response(req, store)
+        if wants_ndjson(req.args):
+            return _ndjson_listing_response(store)
 
         # Listar todos los archivos en el directorio uploads/
-        blobs = bucket.list_blobs(prefix='uploads/')
+        with stage('list'):
+            objects = scan_objects(store, 'uploads/')
 
         photos = []
 
-        for blob in blobs:
+        for obj in objects:
             # Filtrar solo archivos válidos (no directorios)
-            if blob.name == 'uploads/':
+            if obj.name == 'uploads/':
                 continue
 
-            filename = blob.name.replace('uploads/', '')
+            filename = obj.name.replace('uploads/', '')
             file_ext = _get_file_extension(filename)
 
             # Solo incluir archivos con extensiones permitidas
             if file_ext in ALLOWED_EXTENSIONS:
-                # Hacer público si no lo está
-                if not blob.public_url:
-                    blob.make_public()
-
-                photos.append({
-                    'filename': filename,
-                    'url': blob.public_url
-                })
+                photos.append(obj)
 
         # Ordenar por nombre (más recientes primero)
-        photos.sort(key=lambda x: x['filename'], reverse=True)
+        photos.sort(key=lambda obj: obj.name, reverse=True)
 
-        return https_fn.Response(
-            json.dumps(photos),
-            status=200,
-            headers={'Content-Type': 'application/json'}
-        )
+        return _listing_response(req, store, photos)
 
     except Exception as e:
         return https_fn.Response(
@@ -874,10 +1068,11 @@ def listPcaPhotos(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('downloadPcaImages')
 def downloadPcaImages(req: https_fn.Request) -> https_fn.Response:
     """
     Descarga una o múltiples imágenes del bucket PCA.
-    - Si se envía 1 imagen: descarga directa de la imagen
+    - Si se envía 1 imagen: 302 a la imagen en Storage ("redirect": false la devuelve en la respuesta)
     - Si se envían 2+: descarga como ZIP
 
     POST /api/pca/download
@@ -885,6 +1080,8 @@ def downloadPcaImages(req: https_fn.Request) -> https_fn.Response:
     {
         "imageNames": ["lasacam-1234567890-abc123.jpg"] // 1 o más
     }
+    o {"from": "2025-03-01T20:00", "to": "2025-03-01T21:00"} para las fotos de ese horario
+    o {"all": true} para el ZIP de todo el evento (ver lasacam/event_archive.py)
     """
 
     # Solo permitir POST
@@ -912,78 +1109,41 @@ def downloadPcaImages(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
 
-        # Validar que imageNames esté presente y sea una lista
-        image_names = data.get('imageNames', [])
-        if not isinstance(image_names, list) or len(image_names) == 0:
-            return https_fn.Response(
-                json.dumps({'error': 'imageNames debe ser una lista no vacía'}),
-                status=400,
-                headers={'Content-Type': 'application/json'}
-            )
-
-        # Obtener bucket PCA
-        bucket = storage.bucket(PCA_BUCKET)
-
-        # Si es solo 1 imagen, descargarla directamente
+        # Todo el evento: el ZIP incremental, sin volver a armarlo
+        if data.get('all'):
+            limited = _rate_limited(req, EXPORT_LIMITER, cost=EXPORT_ALL_COST)
+            if limited is not None:
+                return limited
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            return _event_archive_response(storage_for_bucket(PCA_BUCKET),
+                                           f'pca_fotos_{timestamp}.zip')
+
+        # imageNames, o las fotos del horario from/to
+        image_names, error = _download_names(data, PCA_BUCKET)
+        if error is not None:
+            return error
+
+        # Límite por cliente: cada imagen exportada cuesta un token
+        limited = _rate_limited(req, EXPORT_LIMITER, cost=len(image_names))
+        if limited is not None:
+            return limited
+
+        # Obtener backend de almacenamiento PCA
+        store = storage_for_bucket(PCA_BUCKET)
+
+        # Si es solo 1 imagen: redirección a Storage (o la imagen, con "redirect": false)
         if len(image_names) == 1:
-            image_name = image_names[0]
-            blob = bucket.blob(f'uploads/{image_name}')
-
-            # Verificar que existe
-            if not blob.exists():
-                return https_fn.Response(
-                    json.dumps({'error': f'La imagen {image_name} no existe'}),
-                    status=404,
-                    headers={'Content-Type': 'application/json'}
-                )
-
-            # Descargar y convertir a JPG
-            image_data = blob.download_as_bytes()
-            jpg_data = _convert_to_jpg(image_data)
-            jpg_name = Path(image_name).stem + '.jpg'
-
-            # Retornar imagen JPG
-            return https_fn.Response(
-                jpg_data,
-                status=200,
-                headers={
-                    'Content-Type': 'image/jpeg',
-                    'Content-Disposition': f'attachment; filename="{jpg_name}"',
-                    'Cache-Control': 'public, max-age=3600'
-                }
-            )
+            return _single_download_response(store, image_names[0], data.get('redirect', True))
 
         # Si son múltiples, crear ZIP con JPGs
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for image_name in image_names:
-                try:
-                    blob = bucket.blob(f'uploads/{image_name}')
-
-                    if not blob.exists():
-                        print(f'Advertencia: {image_name} no existe, se omite')
-                        continue
-
-                    # Descargar y convertir a JPG
-                    image_data = blob.download_as_bytes()
-                    jpg_data = _convert_to_jpg(image_data)
-                    jpg_name = Path(image_name).stem + '.jpg'
-
-                    zip_file.writestr(jpg_name, jpg_data)
-
-                except Exception as e:
-                    print(f'Error procesando {image_name}: {str(e)}')
-                    continue
-
-        zip_buffer.seek(0)
+        zip_data = _build_zip(image_names, lambda name: _download_if_exists(store, name))
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         zip_filename = f'pca_fotos_{timestamp}.zip'
 
         # Retornar ZIP
         return https_fn.Response(
-            zip_buffer.getvalue(),
+            zip_data,
             status=200,
             headers={
                 'Content-Type': 'application/zip',
@@ -1002,6 +1162,7 @@ def downloadPcaImages(req: https_fn.Request) -> https_fn.Response:
 # --- Delete Functions ---
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('deletePhotos')
 def deletePhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Elimina una o múltiples fotos del bucket LasaCam.
@@ -1032,20 +1193,22 @@ def deletePhotos(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
 
-        bucket = storage.bucket(STORAGE_BUCKET)
+        store = storage_for_bucket(STORAGE_BUCKET)
         deleted = []
         errors = []
 
-        for image_name in image_names:
-            try:
-                blob = bucket.blob(f'uploads/{image_name}')
-                if blob.exists():
-                    blob.delete()
-                    deleted.append(image_name)
-                else:
-                    errors.append(f'{image_name} no existe')
-            except Exception as e:
-                errors.append(f'{image_name}: {str(e)}')
+        # Borrar en paralelo; cada resultado es True, False (no existe) o la excepción
+        results = store.batch(('delete', f'uploads/{name}') for name in image_names)
+
+        for image_name, result in zip(image_names, results):
+            if isinstance(result, Exception):
+                errors.append(f'{image_name}: {str(result)}')
+            elif result:
+                deleted.append(image_name)
+            else:
+                errors.append(f'{image_name} no existe')
+
+        _record_deletions(store, deleted)
 
         return https_fn.Response(
             json.dumps({
@@ -1066,6 +1229,7 @@ def deletePhotos(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('deleteProcigarPhotos')
 def deleteProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Elimina una o múltiples fotos del bucket Procigar.
@@ -1096,20 +1260,22 @@ def deleteProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
 
-        bucket = storage.bucket(PROCIGAR_BUCKET)
+        store = storage_for_bucket(PROCIGAR_BUCKET)
         deleted = []
         errors = []
 
-        for image_name in image_names:
-            try:
-                blob = bucket.blob(f'uploads/{image_name}')
-                if blob.exists():
-                    blob.delete()
-                    deleted.append(image_name)
-                else:
-                    errors.append(f'{image_name} no existe')
-            except Exception as e:
-                errors.append(f'{image_name}: {str(e)}')
+        # Borrar en paralelo; cada resultado es True, False (no existe) o la excepción
+        results = store.batch(('delete', f'uploads/{name}') for name in image_names)
+
+        for image_name, result in zip(image_names, results):
+            if isinstance(result, Exception):
+                errors.append(f'{image_name}: {str(result)}')
+            elif result:
+                deleted.append(image_name)
+            else:
+                errors.append(f'{image_name} no existe')
+
+        _record_deletions(store, deleted)
 
         return https_fn.Response(
             json.dumps({
@@ -1130,6 +1296,7 @@ def deleteProcigarPhotos(req: https_fn.Request) -> https_fn.Response:
 
 
 @https_fn.on_request(cors=cors_options)
+@instrument_handler('deletePcaPhotos')
 def deletePcaPhotos(req: https_fn.Request) -> https_fn.Response:
     """
     Elimina una o múltiples fotos del bucket PCA.
@@ -1160,20 +1327,22 @@ def deletePcaPhotos(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
 
-        bucket = storage.bucket(PCA_BUCKET)
+        store = storage_for_bucket(PCA_BUCKET)
         deleted = []
         errors = []
 
-        for image_name in image_names:
-            try:
-                blob = bucket.blob(f'uploads/{image_name}')
-                if blob.exists():
-                    blob.delete()
-                    deleted.append(image_name)
-                else:
-                    errors.append(f'{image_name} no existe')
-            except Exception as e:
-                errors.append(f'{image_name}: {str(e)}')
+        # Borrar en paralelo; cada resultado es True, False (no existe) o la excepción
+        results = store.batch(('delete', f'uploads/{name}') for name in image_names)
+
+        for image_name, result in zip(image_names, results):
+            if isinstance(result, Exception):
+                errors.append(f'{image_name}: {str(result)}')
+            elif result:
+                deleted.append(image_name)
+            else:
+                errors.append(f'{image_name} no existe')
+
+        _record_deletions(store, deleted)
 
         return https_fn.Response(
             json.dumps({
@@ -1190,4 +1359,461 @@ def deletePcaPhotos(req: https_fn.Request) -> https_fn.Response:
             json.dumps({'error': f'Error al eliminar fotos: {str(e)}'}),
             status=500,
             headers={'Content-Type': 'application/json'}
-        )
\ No newline at end of file
+        )
+
+
+# --- Resize Functions ---
+
+def _resize_response(req, bucket_name):
+    """
+    Versión redimensionada de una foto del bucket.
+    GET ?filename=<archivo>&w=&h=&q=&fmt= (fmt: jpeg, webp, avif, png o auto)
+    """
+    if req.method != 'GET':
+        return https_fn.Response(
+            json.dumps({'error': 'Método no permitido'}),
+            status=405,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    try:
+        filename = req.args.get('filename', '')
+        if not filename or '/' in filename:
+            return https_fn.Response(
+                json.dumps({'error': 'Parámetro filename requerido'}),
+                status=400,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        try:
+            spec = parse_resize_params(req.args.to_dict(), req.headers.get('Accept', ''))
+        except ValueError as e:
+            return https_fn.Response(
+                json.dumps({'error': str(e)}),
+                status=400,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        store = storage_for_bucket(bucket_name)
+        object_name = f'uploads/{filename}'
+        info = store.stat(object_name)
+        if info is None:
+            return https_fn.Response(
+                json.dumps({'error': f'Imagen {filename} no encontrada'}),
+                status=404,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        # Las variantes quedan en cache/img/ del mismo bucket
+        data, content_type = resized_image(store, object_name, info, spec, StorageCache(store))
+        
+        return https_fn.Response(
+            data,
+            status=200,
+            headers={
+                'Content-Type': content_type,
+                'Cache-Control': 'public, max-age=86400',
+                'Vary': 'Accept'
+            }
+        )
+    
+    except ObjectNotFound:
+        return https_fn.Response(
+            json.dumps({'error': f'Imagen {filename} no encontrada'}),
+            status=404,
+            headers={'Content-Type': 'application/json'}
+        )
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error al redimensionar imagen: {str(e)}'}),
+            status=500,
+            headers={'Content-Type': 'application/json'}
+        )
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('resizeImage')
+def resizeImage(req: https_fn.Request) -> https_fn.Response:
+    """
+    Versión redimensionada de una foto del bucket principal.
+    Equivalente a GET /img/<archivo>?w=&h=&q=&fmt= del backend Python.
+    """
+    return _resize_response(req, STORAGE_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('resizeProcigarImage')
+def resizeProcigarImage(req: https_fn.Request) -> https_fn.Response:
+    """Versión redimensionada de una foto del bucket de Procigar."""
+    return _resize_response(req, PROCIGAR_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('resizePcaImage')
+def resizePcaImage(req: https_fn.Request) -> https_fn.Response:
+    """Versión redimensionada de una foto del bucket de PCA."""
+    return _resize_response(req, PCA_BUCKET)
+
+
+# --- Contact Sheet Functions ---
+
+def _contact_sheet_response(req, bucket_name):
+    """
+    Hoja de contactos de una página de la galería.
+    GET ?page=&size=&tile=&cols= devuelve el mapa en JSON; con image=1, la hoja en JPEG.
+    """
+    if req.method != 'GET':
+        return https_fn.Response(
+            json.dumps({'error': 'Método no permitido'}),
+            status=405,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    try:
+        try:
+            spec = parse_sheet_params(req.args.to_dict())
+        except ValueError as e:
+            return https_fn.Response(
+                json.dumps({'error': str(e)}),
+                status=400,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        store = storage_for_bucket(bucket_name)
+        plan = plan_sheet(store, 'uploads/', ALLOWED_EXTENSIONS, spec)
+        if plan is None:
+            return https_fn.Response(
+                json.dumps({'error': 'Página no encontrada'}),
+                status=404,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        if req.args.get('image') != '1':
+            data = sheet_map(plan, spec, 'uploads/', req.base_url,
+                             lambda name: store.public_url(f'uploads/{name}'))
+            status, body, headers = json_response(
+                data,
+                req.headers.get('Accept-Encoding', ''),
+                req.headers.get('If-None-Match', '')
+            )
+            return https_fn.Response(body, status=status, headers=headers)
+        
+        # Las hojas y las miniaturas quedan en cache/img/ del mismo bucket
+        data = sheet_image(store, plan, spec, StorageCache(store))
+        return https_fn.Response(
+            data,
+            status=200,
+            headers={
+                'Content-Type': 'image/jpeg',
+                'Cache-Control': sheet_cache_control(plan, req.args.get('v', ''))
+            }
+        )
+    
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error al armar la hoja de contactos: {str(e)}'}),
+            status=500,
+            headers={'Content-Type': 'application/json'}
+        )
+
+
+@https_fn.on_request(cors=cors_options, memory=MemoryOption.GB_1)
+@instrument_handler('listPhotoSheet')
+def listPhotoSheet(req: https_fn.Request) -> https_fn.Response:
+    """
+    Hoja de contactos de una página de fotos del bucket principal.
+    Equivalente a GET /api/photos/sheet del backend Python.
+    """
+    return _contact_sheet_response(req, STORAGE_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options, memory=MemoryOption.GB_1)
+@instrument_handler('listProcigarPhotoSheet')
+def listProcigarPhotoSheet(req: https_fn.Request) -> https_fn.Response:
+    """Hoja de contactos de una página de fotos del bucket de Procigar."""
+    return _contact_sheet_response(req, PROCIGAR_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options, memory=MemoryOption.GB_1)
+@instrument_handler('listPcaPhotoSheet')
+def listPcaPhotoSheet(req: https_fn.Request) -> https_fn.Response:
+    """Hoja de contactos de una página de fotos del bucket de PCA."""
+    return _contact_sheet_response(req, PCA_BUCKET)
+
+
+# --- Export Functions ---
+
+# Buckets que aceptan exportaciones asíncronas (ver lasacam/exports.py)
+EXPORT_BUCKETS = {STORAGE_BUCKET, PROCIGAR_BUCKET, PCA_BUCKET}
+
+
+def _run_export(bucket_name, job_id):
+    """Arma el ZIP del trabajo `job_id` con las fotos convertidas a JPG."""
+    jobs = ExportJobs(storage_for_bucket(bucket_name))
+    return jobs.run(job_id, convert=_convert_to_jpg, arcname=jpg_arcname)
+
+
+def _enqueue_export(bucket_name, job_id):
+    """Encola el trabajo en Cloud Tasks; con almacenamiento local lo corre en un hilo."""
+    if os.environ.get('LASACAM_LOCAL_STORAGE'):
+        threading.Thread(target=_run_export, args=(bucket_name, job_id), daemon=True).start()
+        return
+    admin_functions.task_queue('runExportJob').enqueue({'bucket': bucket_name, 'jobId': job_id})
+
+
+def _export_response(req, bucket_name):
+    """
+    POST {"imageNames": [...]}, {"from": ..., "to": ...} o {"all": true}: crea el trabajo y devuelve su estado
+    (202 mientras se arma, 200 si el ZIP ya existía).
+    GET ?jobId=<id>: estado y progreso; al terminar incluye `url`.
+    """
+    jobs = ExportJobs(storage_for_bucket(bucket_name))
+    
+    if req.method == 'GET':
+        job = jobs.get(req.args.get('jobId', ''))
+        if job is None:
+            return https_fn.Response(
+                json.dumps({'error': 'Trabajo no encontrado'}),
+                status=404,
+                headers={'Content-Type': 'application/json'}
+            )
+        return https_fn.Response(
+            json.dumps(public_status(job)),
+            status=200,
+            headers={'Content-Type': 'application/json', 'Cache-Control': 'no-store'}
+        )
+    
+    if req.method != 'POST':
+        return https_fn.Response(
+            json.dumps({'error': 'Método no permitido'}),
+            status=405,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    data = req.get_json(silent=True)
+    if not data:
+        return https_fn.Response(
+            json.dumps({'error': 'Body JSON requerido'}),
+            status=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    image_names = None
+    if data.get('from') is not None or data.get('to') is not None:
+        # Las fotos del horario, como en las descargas
+        image_names, error = _download_names(data, bucket_name)
+        if error is not None:
+            return error
+    elif not data.get('all'):
+        image_names = data.get('imageNames', [])
+        if (not isinstance(image_names, list) or len(image_names) == 0
+                or not all(isinstance(n, str) and n and '/' not in n for n in image_names)):
+            return https_fn.Response(
+                json.dumps({'error': 'imageNames debe ser una lista no vacía de nombres'}),
+                status=400,
+                headers={'Content-Type': 'application/json'}
+            )
+    
+    # Límite por cliente: cada imagen exportada cuesta un token
+    cost = len(image_names) if image_names is not None else EXPORT_ALL_COST
+    limited = _rate_limited(req, EXPORT_LIMITER, cost=cost)
+    if limited is not None:
+        return limited
+    
+    try:
+        job, enqueue = jobs.submit(image_names)
+        if job['total'] == 0:
+            return https_fn.Response(
+                json.dumps({'error': 'Ninguna de las imágenes existe'}),
+                status=404,
+                headers={'Content-Type': 'application/json'}
+            )
+        if enqueue:
+            try:
+                _enqueue_export(bucket_name, job['id'])
+            except Exception as e:
+                # Sin esto el trabajo quedaría "pending" sin nadie que lo arme
+                jobs.fail(job, f'No se pudo encolar la exportación: {str(e)}')
+                raise
+        
+        return https_fn.Response(
+            json.dumps(public_status(job)),
+            status=200 if job['status'] == 'done' else 202,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error al crear la exportación: {str(e)}'}),
+            status=500,
+            headers={'Content-Type': 'application/json'}
+        )
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('exportImages')
+def exportImages(req: https_fn.Request) -> https_fn.Response:
+    """Exportación asíncrona (ZIP en el bucket) de fotos de LasaCam."""
+    return _export_response(req, STORAGE_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('exportProcigarImages')
+def exportProcigarImages(req: https_fn.Request) -> https_fn.Response:
+    """Exportación asíncrona (ZIP en el bucket) de fotos de Procigar."""
+    return _export_response(req, PROCIGAR_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('exportPcaImages')
+def exportPcaImages(req: https_fn.Request) -> https_fn.Response:
+    """Exportación asíncrona (ZIP en el bucket) de fotos de PCA."""
+    return _export_response(req, PCA_BUCKET)
+
+
+@tasks_fn.on_task_dispatched(
+    retry_config=RetryConfig(max_attempts=3, min_backoff_seconds=60),
+    rate_limits=RateLimits(max_concurrent_dispatches=4),
+    memory=MemoryOption.GB_2,
+    timeout_sec=1800
+)
+def runExportJob(req: tasks_fn.CallableRequest) -> None:
+    """Arma el ZIP de un trabajo de exportación (encolado por _export_response)."""
+    bucket_name = req.data.get('bucket')
+    job_id = req.data.get('jobId')
+    if bucket_name not in EXPORT_BUCKETS or not job_id:
+        print(f'Tarea de exportación inválida: {req.data}')
+        return
+    job = _run_export(bucket_name, job_id)
+    if job is not None and job['status'] == 'error':
+        print(f"Exportación {job_id} falló: {job['error']}")
+
+
+# --- Live Functions ---
+
+# Ruta de miniaturas (rewrite de Hosting) por bucket; PCA no tiene
+LIVE_THUMBNAIL_PATHS = {
+    STORAGE_BUCKET: '/api/img',
+    PROCIGAR_BUCKET: '/api/procigar/img',
+    PCA_BUCKET: None,
+}
+THUMBNAIL_WIDTH = 400
+_LIVE_POLLERS = {}
+_LIVE_LOCK = threading.Lock()
+
+
+def _live_event(store, bucket_name, filename, obj):
+    """Datos del evento SSE de una foto del bucket."""
+    urls = {}
+    thumbnail_path = LIVE_THUMBNAIL_PATHS.get(bucket_name)
+    if thumbnail_path:
+        urls['thumbnailUrl'] = f'{thumbnail_path}?filename={filename}&w={THUMBNAIL_WIDTH}'
+    metadata = (obj.metadata if obj is not None else None) or {}
+    try:
+        width, height = int(metadata['width']), int(metadata['height'])
+    except (KeyError, ValueError):
+        width = height = None
+    return upload_event(filename, store.public_url(f'uploads/{filename}'), width, height, **urls)
+
+
+def _live_poller(bucket_name):
+    """Sondeo compartido por todas las respuestas SSE de la instancia para `bucket_name`."""
+    with _LIVE_LOCK:
+        poller = _LIVE_POLLERS.get(bucket_name)
+        if poller is None:
+            store = storage_for_bucket(bucket_name)
+            poller = StoragePoller(
+                store, 'uploads/', ALLOWED_EXTENSIONS,
+                lambda filename, obj: _live_event(store, bucket_name, filename, obj)
+            )
+            _LIVE_POLLERS[bucket_name] = poller
+        return poller
+
+
+def _live_response(req, bucket_name):
+    """
+    Novedades en vivo (Server-Sent Events). La respuesta dura LIVE_HOLD_SECONDS;
+    EventSource se reconecta con Last-Event-ID y no se pierde nada.
+    """
+    if req.method != 'GET':
+        return https_fn.Response(
+            json.dumps({'error': 'Método no permitido'}),
+            status=405,
+            headers={'Content-Type': 'application/json'}
+        )
+    
+    poller = _live_poller(bucket_name)
+    last_id = last_event_id(req.headers.get('Last-Event-ID'), req.args)
+
+    def replay(since):
+        return storage_replay(poller.store, 'uploads/', ALLOWED_EXTENSIONS, since,
+                              lambda filename, obj: _live_event(poller.store, bucket_name,
+                                                                filename, obj))
+
+    def body():
+        poller.subscribe()
+        try:
+            yield from iter_events(poller.log, last_id, replay, hold=LIVE_HOLD_SECONDS)
+        finally:
+            poller.unsubscribe()
+
+    return https_fn.Response(body(), status=200, headers=SSE_HEADERS)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('liveEvents')
+def liveEvents(req: https_fn.Request) -> https_fn.Response:
+    """
+    Fotos nuevas de LasaCam en vivo (SSE).
+    Equivalente a GET /api/events del backend Python.
+    """
+    return _live_response(req, STORAGE_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('liveProcigarEvents')
+def liveProcigarEvents(req: https_fn.Request) -> https_fn.Response:
+    """Fotos nuevas de Procigar en vivo (SSE)."""
+    return _live_response(req, PROCIGAR_BUCKET)
+
+
+@https_fn.on_request(cors=cors_options)
+@instrument_handler('livePcaEvents')
+def livePcaEvents(req: https_fn.Request) -> https_fn.Response:
+    """Fotos nuevas de PCA en vivo (SSE)."""
+    return _live_response(req, PCA_BUCKET)
+
+
+# --- Retention Functions ---
+
+# (bucket, evento de la configuración, política de ingesta)
+RETENTION_EVENTS = (
+    (STORAGE_BUCKET, 'lasacam', STORAGE_INGEST),
+    (PROCIGAR_BUCKET, 'procigar', PROCIGAR_INGEST),
+    (PCA_BUCKET, 'pca', PCA_INGEST),
+)
+
+
+@scheduler_fn.on_schedule(schedule='every day 08:00', memory=MemoryOption.MB_512, timeout_sec=1800)
+def applyRetention(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Aplica la política de retención de cada evento (ver lasacam/retention.py)
+    y registra el informe. Con LASACAM_RETENTION_DRY_RUN=1 no modifica nada.
+    """
+    dry_run = dry_run_from_env()
+    for bucket_name, event_name, ingest in RETENTION_EVENTS:
+        try:
+            policy = retention_policy(event_name)
+            if not enabled(policy):
+                continue
+            job = RetentionJob(storage_for_bucket(bucket_name), policy,
+                               ingest_archive=ingest.archive_prefix, dry_run=dry_run)
+            report = job.run().as_dict()
+        except Exception as e:
+            print(f'Error aplicando la retención de {bucket_name}: {str(e)}')
+            continue
+        print(json.dumps({
+            'severity': 'WARNING' if report['errorCount'] else 'INFO',
+            'message': f'Retención de {event_name}',
+            **report,
+        }))
@@ -0,0 +1,91 @@
+"""
+Tests de functions/lasacam/live.py: búfer de eventos y reanudación con
+Last-Event-ID.
+
+    python -m pytest -q test_live.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from lasacam.live import EventLog, iter_events, stream_preamble, HEARTBEAT
+
+
+def ids(chunk):
+    return [int(line[4:]) for line in chunk.decode('utf-8').splitlines() if line.startswith('id: ')]
+
+
+def no_replay(last_id):
+    raise AssertionError('el búfer cubre el id: no debería leer el almacenamiento')
+
+
+def test_resume_from_buffer_sends_each_event_once():
+    log = EventLog()
+    first, second, third = (log.publish({'filename': name}) for name in ('a', 'b', 'c'))
+
+    events = iter_events(log, first.id, no_replay, heartbeat=0.01)
+    assert next(events) == stream_preamble()
+    assert ids(next(events)) == [second.id]
+    assert ids(next(events)) == [third.id]
+
+    # Sin novedades solo llegan heartbeats, no los eventos ya repuestos
+    assert next(events) == HEARTBEAT
+
+    fourth = log.publish({'filename': 'd'})
+    assert ids(next(events)) == [fourth.id]
+    events.close()
+
+
+def test_resume_with_nothing_buffered_waits_for_new_events():
+    log = EventLog()
+    last = log.publish({'filename': 'a'})
+
+    events = iter_events(log, last.id, no_replay, heartbeat=0.01)
+    assert next(events) == stream_preamble()
+    assert next(events) == HEARTBEAT
+
+    new = log.publish({'filename': 'b'})
+    assert ids(next(events)) == [new.id]
+    events.close()
+
+
+def test_resume_not_covered_uses_replay():
+    log = EventLog()
+    replayed = []
+
+    def replay(last_id):
+        replayed.append(last_id)
+        return []
+
+    events = iter_events(log, log.started - 1, replay, heartbeat=0.01)
+    next(events)
+    assert next(events) == HEARTBEAT
+    assert replayed == [log.started - 1]
+    events.close()
+
+
+def test_forwarded_event_keeps_its_id():
+    # Dos workers: el que recibe la subida asigna el id y el otro lo reutiliza
+    origin, peer = EventLog(), EventLog()
+    peer.publish({'filename': 'local'}, origin.started + 10_000)
+
+    event = origin.publish({'filename': 'a'})
+    forwarded = peer.publish(event.data, event.id)
+
+    assert forwarded.id == event.id
+    assert [e.id for e in peer.since(event.id - 1)[0]] == [event.id, origin.started + 10_000]
+
+
+def test_forwarded_event_with_lower_id_reaches_open_streams():
+    log = EventLog()
+    newer = log.publish({'filename': 'local'})
+
+    events = iter_events(log, None, no_replay, heartbeat=0.01)
+    assert next(events) == stream_preamble()
+
+    # Llega de otro worker con un id menor que el último local
+    older = log.publish({'filename': 'remoto'}, newer.id - 5)
+    assert ids(next(events)) == [older.id]
+    events.close()
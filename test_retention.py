@@ -0,0 +1,34 @@
+"""
+Tests de functions/lasacam/retention.py: qué fotos se consideran viejas.
+
+    python -m pytest -q test_retention.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from lasacam.storage import LocalStorage
+from lasacam.retention import iter_older
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def test_iter_older_includes_names_without_timestamp(tmp_path):
+    store = LocalStorage(tmp_path)
+    now = int(time.time() * 1000)
+    old_generated = f'lasacam-{now - 10 * DAY_MS:013d}-aa.jpg'
+    new_generated = f'lasacam-{now:013d}-bb.jpg'
+    # Sin timestamp en el nombre: cuenta la última escritura
+    untimed = ['IMG_0001.jpg', 'lasacam-abc.jpg', 'zeta.jpg']
+    for name in [old_generated, new_generated, 'recent-lasacam-x.jpg'] + untimed:
+        store.put(f'uploads/{name}', b'x')
+    old = time.time() - 20 * DAY_MS / 1000
+    for name in untimed:
+        os.utime(tmp_path / 'uploads' / name, (old, old))
+
+    found = sorted(obj.name for obj in iter_older(store, 'uploads/', now - DAY_MS))
+
+    assert found == sorted(f'uploads/{name}' for name in [old_generated] + untimed)
@@ -0,0 +1,271 @@
+"""
+Tests de functions/lasacam/uploads.py: parser multipart incremental, lectores
+de cuerpo y rechazos tempranos.
+
+    python -m pytest -q test_uploads.py
+"""
+
+import io
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from lasacam.uploads import (read_multipart, UploadRejected, LimitedBodyReader,
+                             ChunkedBodyReader, sniff_image_type, probe_dimensions,
+                             MULTIPART_OVERHEAD)
+
+BOUNDARY = '----LasaCamTestBoundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def png(width=64, height=48, size=2000):
+    """PNG mínimo: firma, IHDR y relleno hasta `size` bytes (el parser no decodifica)."""
+    head = (b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rIHDR'
+            + struct.pack('>II', width, height) + b'\x08\x02\x00\x00\x00' + b'\x00' * 4)
+    return head + bytes(range(256)) * (size // 256) + b'\x00' * (size % 256)
+
+
+def gif(width=10, height=20):
+    return b'GIF89a' + struct.pack('<HH', width, height) + b'\x00' * 32
+
+
+def body(parts):
+    """Cuerpo multipart de [(campo, nombre de archivo o None, bytes)]."""
+    out = b''
+    for field, filename, data in parts:
+        disposition = f'form-data; name="{field}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        out += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + data + b'\r\n'
+    return out + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def reader(data, step):
+    """read(n) que devuelve como máximo `step` bytes por llamada."""
+    stream = io.BytesIO(data)
+    return lambda size: stream.read(min(size, step))
+
+
+def chunked(data, sizes):
+    """`data` en Transfer-Encoding: chunked, con bloques de los tamaños de `sizes` (cíclico)."""
+    out, offset, i = b'', 0, 0
+    while offset < len(data):
+        size = sizes[i % len(sizes)]
+        piece = data[offset:offset + size]
+        out += f'{len(piece):x}\r\n'.encode() + piece + b'\r\n'
+        offset += size
+        i += 1
+    return out + b'0\r\n\r\n'
+
+
+# --- Boundary partido entre lecturas ---
+
+@pytest.mark.parametrize('step', [1, 3, len(BOUNDARY) + 3, len(BOUNDARY) + 4, 1000, 64 * 1024])
+def test_boundary_split_across_reads(step):
+    data = png()
+    raw = body([('photo', 'foto.png', data)])
+
+    files, fields = read_multipart(reader(raw, step), CONTENT_TYPE, content_length=len(raw))
+
+    assert fields == {}
+    assert len(files) == 1
+    assert files[0].filename == 'foto.png'
+    assert files[0].data == data
+    assert (files[0].kind, files[0].width, files[0].height) == ('png', 64, 48)
+
+
+@pytest.mark.parametrize('step', [1, 5, 17])
+def test_boundary_lookalike_inside_file_is_kept(step):
+    # Un prefijo del delimitador dentro del archivo no corta la parte
+    data = png() + b'\r\n--' + BOUNDARY[:-1].encode() + b'x' + png(size=100)
+    raw = body([('photo', 'foto.png', data)])
+
+    files, _ = read_multipart(reader(raw, step), CONTENT_TYPE)
+
+    assert files[0].data == data
+
+
+def test_text_fields_and_several_files_split_across_reads():
+    first, second = png(), gif()
+    raw = body([('event', None, 'boda'.encode()),
+                ('photos', 'a.png', first),
+                ('photos', 'b.gif', second)])
+
+    files, fields = read_multipart(reader(raw, 7), CONTENT_TYPE, fields=('photos',), max_files=2)
+
+    assert fields == {'event': 'boda'}
+    assert [f.data for f in files] == [first, second]
+    assert [(f.width, f.height) for f in files] == [(64, 48), (10, 20)]
+
+
+# --- Cuerpos chunked ---
+
+@pytest.mark.parametrize('sizes', [[1], [5, 3000, 2], [64 * 1024]])
+def test_chunked_body(sizes):
+    data = png(size=5000)
+    raw = body([('photo', 'foto.png', data)])
+    stream = io.BytesIO(chunked(raw, sizes) + b'GET /siguiente')
+
+    body_reader = ChunkedBodyReader(stream)
+    files, _ = read_multipart(body_reader.read, CONTENT_TYPE)
+
+    assert files[0].data == data
+    # Como en server.py, se drena lo que sigue al último delimitador: el lector
+    # se detiene en el bloque final y no consume la próxima petición
+    while body_reader.read():
+        pass
+    assert stream.read() == b'GET /siguiente'
+
+
+def test_chunked_body_with_extensions_and_trailers():
+    raw = body([('photo', 'foto.gif', gif())])
+    encoded = f'{len(raw):x};ext=1\r\n'.encode() + raw + b'\r\n0\r\nX-Trailer: 1\r\n\r\n'
+
+    files, _ = read_multipart(ChunkedBodyReader(io.BytesIO(encoded)).read, CONTENT_TYPE)
+
+    assert files[0].kind == 'gif'
+
+
+def test_chunked_body_invalid_size():
+    with pytest.raises(UploadRejected, match='chunked inválido'):
+        ChunkedBodyReader(io.BytesIO(b'zz\r\nhola\r\n0\r\n\r\n')).read()
+
+
+def test_chunked_body_truncated():
+    reader = ChunkedBodyReader(io.BytesIO(b'10\r\nhola'))
+    assert reader.read() == b'hola'
+    with pytest.raises(UploadRejected, match='chunked incompleto'):
+        reader.read()
+
+
+# --- Firma y dimensiones ---
+
+def test_sniff_image_type():
+    assert sniff_image_type(b'\xff\xd8\xff\xe0\x00\x10JF') == 'jpeg'
+    assert sniff_image_type(png()[:8]) == 'png'
+    assert sniff_image_type(b'GIF87a\x01\x00') == 'gif'
+    assert sniff_image_type(b'<?php ec') is None
+
+
+def test_probe_dimensions_needs_more_bytes_or_rejects():
+    assert probe_dimensions('png', png()[:20]) is None
+    assert probe_dimensions('png', png(300, 200)) == (300, 200)
+    with pytest.raises(ValueError):
+        probe_dimensions('png', b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rXXXX' + b'\x00' * 16)
+    # JPEG: APP0 y luego SOF0 de 640x480
+    jpeg = (b'\xff\xd8' + b'\xff\xe0\x00\x10' + b'\x00' * 14
+            + b'\xff\xc0\x00\x11\x08' + struct.pack('>HH', 480, 640) + b'\x00' * 12)
+    assert probe_dimensions('jpeg', jpeg) == (640, 480)
+    with pytest.raises(ValueError):
+        probe_dimensions('jpeg', b'\xff\xd8\xff\xda\x00\x08' + b'\x00' * 8)
+
+
+def _read_counting(data, step):
+    calls = []
+    read = reader(data, step)
+
+    def counted(size):
+        chunk = read(size)
+        calls.append(len(chunk))
+        return chunk
+    return counted, calls
+
+
+def test_rejects_bad_signature_without_reading_the_rest():
+    raw = body([('photo', 'foto.jpg', b'<?php system($_GET["c"]); ?>' + b'A' * 5_000_000)])
+    read, calls = _read_counting(raw, 64 * 1024)
+
+    with pytest.raises(UploadRejected, match='no es una imagen'):
+        read_multipart(read, CONTENT_TYPE)
+
+    assert sum(calls) <= 64 * 1024
+
+
+def test_rejects_damaged_header():
+    damaged = b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rXXXX' + b'\x00' * 100
+    raw = body([('photo', 'foto.png', damaged)])
+
+    with pytest.raises(UploadRejected, match='dañada'):
+        read_multipart(reader(raw, 9), CONTENT_TYPE)
+
+
+def test_rejects_oversized_dimensions():
+    raw = body([('photo', 'bomba.png', png(50_000, 50_000))])
+
+    with pytest.raises(UploadRejected, match='Dimensiones'):
+        read_multipart(reader(raw, 9), CONTENT_TYPE)
+
+
+def test_rejects_extension_before_reading_the_file():
+    raw = body([('photo', 'script.php', png())])
+
+    with pytest.raises(UploadRejected, match='Extensión no permitida'):
+        read_multipart(reader(raw, 1000), CONTENT_TYPE)
+
+
+def test_on_reject_skips_bad_file_and_keeps_reading():
+    good = gif()
+    raw = body([('photos', 'malo.jpg', b'no es una imagen'), ('photos', 'bueno.gif', good)])
+    rejected = []
+
+    files, _ = read_multipart(reader(raw, 5), CONTENT_TYPE, fields=('photos',), max_files=2,
+                              on_reject=lambda field, name, message: rejected.append(name))
+
+    assert rejected == ['malo.jpg']
+    assert [f.data for f in files] == [good]
+
+
+# --- Tope de bytes ---
+
+def test_max_file_size_while_streaming():
+    raw = body([('photo', 'grande.png', png(size=50_000))])
+    read, calls = _read_counting(raw, 4096)
+
+    with pytest.raises(UploadRejected, match='muy grande'):
+        read_multipart(read, CONTENT_TYPE, max_file_size=10_000)
+
+    # Se corta al pasar el tope, sin leer el resto del cuerpo
+    assert sum(calls) < 10_000 + 2 * 4096
+
+
+def test_content_length_over_cap_rejected_before_reading():
+    def read(size):
+        raise AssertionError('no debería leer el cuerpo')
+
+    with pytest.raises(UploadRejected, match='muy grande'):
+        read_multipart(read, CONTENT_TYPE, content_length=10_000 + MULTIPART_OVERHEAD + 1,
+                       max_file_size=10_000)
+
+
+def test_request_cap_applies_without_content_length():
+    # Chunked sin Content-Length: el tope por petición se cuenta al leer
+    raw = body([('event', None, b'x' * 1000), ('photo', 'foto.gif', gif())])
+    stream = io.BytesIO(chunked(raw, [100]))
+
+    with pytest.raises(UploadRejected, match='muy grande'):
+        read_multipart(ChunkedBodyReader(stream).read, CONTENT_TYPE, max_request_bytes=500)
+
+
+def test_limited_body_reader_stops_at_length():
+    stream = io.BytesIO(b'0123456789siguiente')
+    limited = LimitedBodyReader(stream, 10)
+
+    assert limited.read(4) == b'0123'
+    assert limited.read() == b'456789'
+    assert limited.read() == b''
+    assert stream.read() == b'siguiente'
+
+
+def test_limited_body_reader_feeds_parser():
+    data = png(size=3000)
+    raw = body([('photo', 'foto.png', data)])
+    stream = io.BytesIO(raw + b'siguiente peticion')
+
+    files, _ = read_multipart(LimitedBodyReader(stream, len(raw)).read, CONTENT_TYPE,
+                              content_length=len(raw))
+
+    assert files[0].data == data